@@ -0,0 +1,51 @@
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Helpers shared by the benchmark scripts in this directory.
+
+The scripts are meant to be run directly, e.g.:
+
+    python benchmark/dispatch.py
+"""
+
+import gc
+import time
+
+def best_of(func, number=1000, repeat=3):
+    """Returns the best time per call of func, in seconds."""
+
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.time()
+        for j in xrange(number):
+            func()
+        t = (time.time() - start) / number
+        if best is None or t < best:
+            best = t
+
+    return best
+
+def report(label, seconds):
+    print "%-50s %12.2f usec" % (label, seconds * 1e6)
+
+def max_rss_kb():
+    """Returns the peak resident set size of the current process in kB."""
+
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Compares bursts of 20 concurrent identical wsgi requests to a lookup method
+that takes 20ms, with and without @soap(_coalesce=True). The time is per
+burst.
+"""
+
+import threading
+import time
+
+from StringIO import StringIO
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import wsgi
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+
+calls = []
+
+def make_service(coalesce):
+    class LookupService(DefinitionBase):
+        @soap(Integer, _returns=Array(Record), _coalesce=coalesce)
+        def lookup(self, count):
+            calls.append(count)
+            time.sleep(0.02)
+            return [Record(id=i, name='record %d' % i) for i in range(count)]
+
+    return LookupService
+
+body = ('<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:tns="tns"><e:Body><tns:lookup><tns:count>100</tns:count>'
+        '</tns:lookup></e:Body></e:Envelope>')
+
+def call(server):
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'text/xml; charset=utf-8',
+    }
+
+    return ''.join(server(environ, lambda status, headers: None))
+
+def burst(server, n=20):
+    threads = [threading.Thread(target=call, args=(server,))
+                                                          for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def main():
+    for coalesce in (False, True):
+        app = Application([make_service(coalesce)], 'tns')
+        server = wsgi.Application(app)
+
+        del calls[:]
+        t = best_of(lambda: burst(server), 10)
+        report("20 concurrent requests, coalesce=%s" % coalesce, t)
+        print "   %d calls of the method" % len(calls),
+        if coalesce:
+            print app.coalesce_stats
+        else:
+            print
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Compares serializing a 1000000-row Array(Row) response from ClassModel
+instances with serializing it from columns: a dict of column lists, a list
+of tuples and a numpy structured array, when numpy is importable. Building
+the instances is included in their time, and each input is written both
+with an lxml tree and as a string. The outputs are checked to be equal.
+"""
+
+import datetime
+
+from _bench import best_of
+from _bench import report
+from _bench import max_rss_kb
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.clazz import numpy
+from soaplib.core.model.primitive import Double
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import Base
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+ROWS = 1000000
+
+class Row(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    value = Double
+
+class RowService(DefinitionBase):
+    @soap(_returns=Array(Row))
+    def get_rows(self):
+        pass
+
+def main():
+    app = Application([RowService], 'tns')
+
+    tree_server = Base(app)
+    string_server = Base(app)
+    string_server._string_response = True
+
+    ctx = MethodContext()
+    ctx.service_class = RowService
+    ctx.service = app.get_service(RowService)
+    ctx.method_name = 'get_rows'
+    ctx.descriptor = ctx.service.get_method('get_rows')
+
+    fields = Row.get_record_class()._fields
+    ids = range(ROWS)
+    names = ['row %d' % i for i in ids]
+    values = [i * 1.5 for i in ids]
+    columns = {'id': ids, 'name': names, 'value': values}
+    rows = zip(*[columns[k] for k in fields])
+
+    def instances():
+        return [Row(id=i, name=n, value=v) for i, n, v in
+                                                 zip(ids, names, values)]
+
+    cases = [
+        ('instances', instances),
+        ('dict of columns', lambda: columns),
+        ('list of tuples', lambda: rows),
+    ]
+
+    if numpy is not None:
+        array = numpy.array(rows, dtype=[(k, {'id': 'i8', 'name': 'S16',
+                                            'value': 'f8'}[k]) for k in fields])
+        cases.append(('numpy structured array', lambda: array))
+
+    expected = None
+    for label, make in cases:
+        for server_label, server in (('lxml tree', tree_server),
+                                     ('string', string_server)):
+            def call():
+                return server.get_out_string(ctx, make())
+
+            if expected is None:
+                expected = call()
+            else:
+                assert call() == expected
+
+            report("1M rows, %s, %s" % (label, server_label),
+                                                    best_of(call, 1, 1))
+
+    print "peak rss: %d kB" % max_rss_kb()
+
+if __name__ == '__main__':
+    main()
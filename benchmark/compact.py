@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares the memory per instance and the construction and
+deserialization throughput of regular ClassModels, compact ClassModels
+(__compact__ = True) and records (ClassModelBase.get_record).
+"""
+
+import datetime
+import sys
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Float
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    value = Float
+    created = DateTime
+    count = Integer
+    label = String
+
+class CompactRecord(ClassModel):
+    __namespace__ = 'tns'
+    __compact__ = True
+
+    id = Integer
+    name = String
+    value = Float
+    created = DateTime
+    count = Integer
+    label = String
+
+def size_of(inst):
+    retval = sys.getsizeof(inst)
+
+    # namedtuples have a __dict__ property.
+    if hasattr(inst, '__dict__') and not isinstance(inst, tuple):
+        retval += sys.getsizeof(inst.__dict__)
+
+    return retval
+
+def main():
+    now = datetime.datetime(2010, 1, 1)
+    values = dict(id=1, name='name', value=1.5, created=now, count=2,
+                                                               label='label')
+
+    element = etree.Element('root')
+    Array(Record).to_parent_element([Record(**values)] * 10000, 'tns',
+                                                                    element)
+    element = element[0]
+
+    array = Array(Record)
+    compact_array = Array(CompactRecord)
+    record = Record.get_record(element[0])
+
+    print "%-50s %12d bytes" % ("regular instance", size_of(Record(**values)))
+    print "%-50s %12d bytes" % ("compact instance",
+                                          size_of(CompactRecord(**values)))
+    print "%-50s %12d bytes" % ("record", size_of(record))
+
+    report("construct, regular", best_of(lambda: Record(**values), 10000))
+    report("construct, compact", best_of(lambda: CompactRecord(**values),
+                                                                     10000))
+
+    report("10000 from_xml, regular", best_of(
+                                   lambda: array.from_xml(element), 10))
+    report("10000 from_xml, compact", best_of(
+                                   lambda: compact_array.from_xml(element), 10))
+    report("10000 get_record", best_of(
+                      lambda: [Record.get_record(e) for e in element], 10))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares the previous ClassModelBase.from_xml, which split every child tag
+and walked the class hierarchy to find the member, with the compiled
+deserializer tables, on nested classes like the ones in the interop service.
+"""
+
+import datetime
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core.model.base import nillable_element
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.clazz import ClassModelBase
+from soaplib.core.model.clazz import XMLAttribute
+from soaplib.core.model.primitive import Boolean
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Double
+from soaplib.core.model.primitive import Float
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+
+class SimpleClass(ClassModel):
+    __namespace__ = 'tns'
+
+    i = Integer
+    s = String
+
+class OtherClass(ClassModel):
+    __namespace__ = 'tns'
+
+    dt = DateTime
+    d = Double
+    b = Boolean
+
+class NestedClass(ClassModel):
+    __namespace__ = "punk.tunk"
+
+    simple = Array(SimpleClass)
+    s = String
+    i = Integer
+    f = Float
+    other = OtherClass
+    ai = Array(Integer)
+
+class ExtensionClass(NestedClass):
+    __namespace__ = "bar"
+
+    l = DateTime
+    q = Integer
+
+def old_from_xml(cls, element):
+    inst = cls.get_deserialization_instance()
+
+    for c in element:
+        if isinstance(c, etree._Comment):
+            continue
+
+        key = c.tag.split('}')[-1]
+
+        member = cls._type_info.get(key, None)
+        clz = getattr(cls,'__extends__', None)
+        while not (clz is None) and (member is None):
+            member = clz._type_info.get(key, None)
+            clz = getattr(clz,'__extends__', None)
+
+        if member is None:
+            continue
+
+        if isinstance(member, XMLAttribute):
+            value = element.get(key)
+        else:
+            mo = member.Attributes.max_occurs
+            if mo == 'unbounded' or mo > 1:
+                value = getattr(inst, key, None)
+                if value is None:
+                    value = []
+                value.append(member.from_xml(c))
+            else:
+                value = member.from_xml(c)
+
+        setattr(inst, key, value)
+
+    return inst
+
+def main():
+    now = datetime.datetime.now()
+    records = []
+    for i in range(1000):
+        records.append(ExtensionClass(
+            simple=[SimpleClass(i=j, s='simple %d' % j) for j in range(5)],
+            s='record %d' % i, i=i, f=i * 1.5,
+            other=OtherClass(dt=now, d=i * 2.5, b=True),
+            ai=range(5), l=now, q=i))
+
+    array = Array(ExtensionClass)
+    array.resolve_namespace(array, 'tns')
+
+    element = etree.Element('root')
+    array.to_parent_element(records, 'tns', element)
+    element = element[0]
+
+    def deserialize():
+        return array.from_xml(element)
+
+    new_from_xml = ClassModelBase.__dict__['from_xml']
+
+    ClassModelBase.from_xml = classmethod(nillable_element(old_from_xml))
+    old_out = etree.Element('root')
+    array.to_parent_element(deserialize(), 'tns', old_out)
+    report("1000 ExtensionClass records, old", best_of(deserialize, 10))
+
+    ClassModelBase.from_xml = new_from_xml
+    new_out = etree.Element('root')
+    array.to_parent_element(deserialize(), 'tns', new_out)
+    report("1000 ExtensionClass records, tables", best_of(deserialize, 10))
+
+    assert etree.tostring(old_out) == etree.tostring(new_out)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Measures method dispatch cost for services with 10, 100 and 1000 operations.
+
+"linear" reproduces the per-request scan DefinitionBase.get_method used to do,
+"indexed" is the dispatch table lookup done by Application, and "request"
+is a complete deserialize_soap call for the last operation of the service.
+"""
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core.model.primitive import String
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+def make_service(num_methods):
+    def make_method(name):
+        def method(self, s):
+            return s
+        method.func_name = name
+        return soap(String, _returns=String)(method)
+
+    cls_dict = {}
+    for i in range(num_methods):
+        name = 'op%d' % i
+        cls_dict[name] = make_method(name)
+
+    return type('Service%d' % num_methods, (DefinitionBase,), cls_dict)
+
+def linear_get_method(service, name):
+    for method in service.public_methods:
+        type_name = method.in_message.get_type_name()
+        if '{%s}%s' % (service.get_tns(), type_name) == name:
+            return method
+
+    for method in service.public_methods:
+        if method.public_name == name:
+            return method
+
+    raise Exception('Method "%s" not found' % name)
+
+def main():
+    for num_methods in (10, 100, 1000):
+        service_class = make_service(num_methods)
+        app = Application([service_class], 'tns')
+        service = app.get_service(service_class)
+
+        name = '{tns}op%d' % (num_methods - 1)
+        envelope = etree.fromstring(
+            '<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/">'
+                '<e:Body><op%d xmlns="tns"><s>x</s></op%d></e:Body>'
+            '</e:Envelope>' % (num_methods - 1, num_methods - 1))
+
+        def request():
+            ctx = MethodContext()
+            app.deserialize_soap(ctx, app.IN_WRAPPER, envelope)
+
+        print "%d operations:" % num_methods
+        report("  linear", best_of(lambda: linear_get_method(service, name)))
+        report("  indexed", best_of(lambda: app.method_routes[name]))
+        report("  request", best_of(request))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares deserializing requests by parsing them into a tree and calling
+from_xml with deserializing them from the events of a target parser
+(Application.deserialize_soap_string), on small, medium and huge
+envelopes.
+"""
+
+import datetime
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core import namespaces
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Float
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import Base
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    value = Float
+    created = DateTime
+    tags = Array(String)
+
+class RecordService(DefinitionBase):
+    @soap(Array(Record), _returns=Integer)
+    def put_records(self, records):
+        return len(records)
+
+    @soap(String, _returns=String)
+    def echo(self, s):
+        return s
+
+def make_request(method, name, cls, value):
+    envelope = etree.Element('{%s}Envelope' % namespaces.ns_soap_env)
+    body = etree.SubElement(envelope, '{%s}Body' % namespaces.ns_soap_env)
+    message = etree.SubElement(body, '{tns}%s' % method)
+    cls.to_parent_element(value, 'tns', message, name)
+
+    return etree.tostring(envelope, xml_declaration=True, encoding='utf-8')
+
+def main():
+    app = Application([RecordService], 'tns')
+
+    tree_server = Base(app)
+    event_server = Base(app)
+    event_server._event_request = True
+
+    now = datetime.datetime(2010, 1, 1)
+    def records(count):
+        return [Record(id=i, name='record <%d>' % i, value=i * 1.5,
+                  created=now, tags=['a', 'b']) for i in range(count)]
+
+    cases = (
+        ('small', make_request('echo', 's', String, 'hello & goodbye')),
+        ('medium, 100 records', make_request('put_records', 'records',
+                                            Array(Record), records(100))),
+        ('huge, 10000 records', make_request('put_records', 'records',
+                                            Array(Record), records(10000))),
+    )
+
+    for label, request in cases:
+        def deserialize(server):
+            ctx = MethodContext()
+            in_object = server.get_in_object(ctx, request, 'utf-8')
+            assert ctx.in_error is None
+            return in_object
+
+        def dump(in_object):
+            parent = etree.Element('parent')
+            type(in_object).to_parent_element(in_object, 'tns', parent)
+            return etree.tostring(parent)
+
+        assert dump(deserialize(tree_server)) == \
+                                             dump(deserialize(event_server))
+
+        number = 100000 // len(request) + 3
+        report("%s, tree" % label, best_of(
+               lambda: deserialize(tree_server), number))
+        report("%s, events" % label, best_of(
+               lambda: deserialize(event_server), number))
+
+if __name__ == '__main__':
+    main()
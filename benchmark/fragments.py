@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Compares wsgi requests to a method returning the same catalog of 200
+products, with and without marking the products immutable, for both the
+element tree and the string response serializers.
+"""
+
+from StringIO import StringIO
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.clazz import fragment_cache
+from soaplib.core.model.primitive import Decimal
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import wsgi
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Price(ClassModel):
+    __namespace__ = 'tns'
+
+    currency = String
+    amount = Decimal
+
+class Product(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    description = String
+    tags = Array(String)
+    prices = Array(Price)
+
+catalog = [Product(id=i, name='product %d' % i,
+                   description='the description of product %d' % i,
+                   tags=['tag %d' % j for j in range(5)],
+                   prices=[Price(currency=c, amount=i + 0.5)
+                                            for c in ('USD', 'EUR', 'GBP')])
+                                                        for i in range(200)]
+
+class CatalogService(DefinitionBase):
+    @soap(_returns=Array(Product))
+    def catalog(self):
+        return catalog
+
+body = ('<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:tns="tns"><e:Body><tns:catalog/></e:Body></e:Envelope>')
+
+def call(server):
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'text/xml; charset=utf-8',
+    }
+
+    return ''.join(server(environ, lambda status, headers: None))
+
+def main():
+    app = Application([CatalogService], 'tns')
+
+    for label, server in (
+                ('tree', wsgi.Application(app)),
+                ('string', wsgi.Application(app, _string_response=True)),
+            ):
+        Product.__immutable__ = False
+        expected = call(server)
+        report("200 products, %s" % label, best_of(lambda: call(server), 100))
+
+        Product.__immutable__ = True
+        assert call(server) == expected
+        report("200 immutable products, %s" % label,
+                                         best_of(lambda: call(server), 100))
+
+    print "  ", fragment_cache.stats
+
+if __name__ == '__main__':
+    main()
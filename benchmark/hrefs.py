@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares the previous recursive multi-ref resolution, which ran whenever
+the message had ids, with the current lazy and iterative one.
+
+"literal" is a large message with ids but no href attributes, "encoded" is
+a large rpc/encoded message where every array item is a multi-ref.
+"""
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core._base import resolve_hrefs
+
+def old_resolve_hrefs(element, xmlids):
+    for e in element:
+        if e.get('id'):
+            continue
+
+        elif e.get('href'):
+            resolved_element = xmlids[e.get('href').replace('#', '')]
+            if resolved_element is None:
+                continue
+            old_resolve_hrefs(resolved_element, xmlids)
+
+            [e.set(k, v) for k, v in resolved_element.items()]
+            [e.append(child) for child in resolved_element.getchildren()]
+            e.text = resolved_element.text
+
+        else:
+            old_resolve_hrefs(e, xmlids)
+
+    return element
+
+def old_path(envelope):
+    root, xmlids = etree.XMLID(envelope)
+    if xmlids:
+        old_resolve_hrefs(root, xmlids)
+
+def new_path(envelope):
+    resolve_hrefs(etree.fromstring(envelope))
+
+def make_literal(count):
+    items = ''.join(['<item id="i%d"><a>%d</a><b>text</b></item>' % (i, i)
+                                                        for i in range(count)])
+    return '<Envelope><Body><op>%s</op></Body></Envelope>' % items
+
+def make_encoded(count):
+    refs = ''.join(['<item href="#id%d"/>' % i for i in range(count)])
+    multirefs = ''.join(['<multiRef id="id%d"><a>%d</a><b>text</b></multiRef>'
+                                                 % (i, i) for i in range(count)])
+    return ('<Envelope><Body><op><items>%s</items></op>%s</Body></Envelope>'
+                                                           % (refs, multirefs))
+
+def main():
+    for count in (1000, 10000, 100000):
+        print "%d items:" % count
+        for name, factory in (('literal', make_literal),
+                                                    ('encoded', make_encoded)):
+            envelope = factory(count)
+            report("  %s old" % name, best_of(lambda: old_path(envelope), 3))
+            report("  %s new" % name, best_of(lambda: new_path(envelope), 3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares eager and lazy deserialization of a request with a 50 member
+ClassModel, of which the method reads 2 members. Some of the members are
+nested ClassModels and Arrays.
+"""
+
+import datetime
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core import namespaces
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.clazz import ClassModelMeta
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Item(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    created = DateTime
+
+members = {'__namespace__': 'tns'}
+for i in range(50):
+    members['f%02d' % i] = (String, Integer, DateTime, Item,
+                                                  Array(Item))[i % 5]
+
+Wide = ClassModelMeta('Wide', (ClassModel,), members)
+
+class WideService(DefinitionBase):
+    @soap(Wide, _returns=String)
+    def eager(self, wide):
+        return '%s %s' % (wide.f00, wide.f01)
+
+    @soap(Wide, _returns=String, _lazy=True)
+    def lazy(self, wide):
+        return '%s %s' % (wide.f00, wide.f01)
+
+def make_request(method):
+    now = datetime.datetime(2010, 1, 1)
+    item = Item(id=1, name='item', created=now)
+    values = ('value', 1, now, item, [item] * 10)
+
+    wide = Wide()
+    for i in range(50):
+        setattr(wide, 'f%02d' % i, values[i % 5])
+
+    envelope = etree.Element('{%s}Envelope' % namespaces.ns_soap_env)
+    body = etree.SubElement(envelope, '{%s}Body' % namespaces.ns_soap_env)
+    message = etree.SubElement(body, '{tns}%s' % method)
+    Wide.to_parent_element(wide, 'tns', message, 'wide')
+
+    return etree.tostring(envelope)
+
+def main():
+    app = Application([WideService], 'tns')
+
+    for method in ('eager', 'lazy'):
+        request = make_request(method)
+
+        def call():
+            ctx = MethodContext()
+            root, xmlids = app.parse_xml_string(request)
+            in_object = app.deserialize_soap(ctx, app.IN_WRAPPER, root,
+                                                                     xmlids)
+            return app.process_request(ctx, in_object)
+
+        assert call() == 'value 1'
+        report("50 members, 2 read, %s" % method, best_of(call, 300))
+
+if __name__ == '__main__':
+    main()
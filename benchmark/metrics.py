@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Measures the overhead of counting wsgi requests in the metrics of the
+transport, for requests to a method returning 20 records, and the time it
+takes to scrape them.
+"""
+
+from StringIO import StringIO
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import wsgi
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+
+class LookupService(DefinitionBase):
+    @soap(Integer, _returns=Array(Record))
+    def lookup(self, count):
+        return [Record(id=i, name='record %d' % i) for i in range(count)]
+
+body = ('<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:tns="tns"><e:Body><tns:lookup><tns:count>20</tns:count>'
+        '</tns:lookup></e:Body></e:Envelope>')
+
+def call(server):
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'text/xml; charset=utf-8',
+    }
+
+    return ''.join(server(environ, lambda status, headers: None))
+
+def main():
+    app = Application([LookupService], 'tns')
+
+    plain = wsgi.Application(app)
+    report("20 records, no metrics", best_of(lambda: call(plain), 2000))
+
+    counted = wsgi.Application(app, _metrics_path='/metrics')
+    report("20 records, metrics", best_of(lambda: call(counted), 2000))
+
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/metrics',
+    }
+    scrape = lambda: counted(environ, lambda status, headers: None)
+    report("scrape", best_of(scrape, 1000))
+
+    print ''.join(scrape())
+
+if __name__ == '__main__':
+    main()
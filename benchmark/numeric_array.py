@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Compares deserializing and serializing a 100000 item Array(Double) as a
+list, as an array.array buffer and as a numpy.ndarray, when numpy is
+importable.
+"""
+
+import random
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import numpy
+from soaplib.core.model.primitive import Double
+
+def main():
+    values = [random.random() * 1000 for i in xrange(100000)]
+
+    buffers = [None, 'array']
+    if numpy is not None:
+        buffers.append('numpy')
+
+    for buffer in buffers:
+        type = Array(Double, buffer=buffer)
+        type.resolve_namespace(type, 'tns')
+
+        parent = etree.Element('test')
+        type.to_parent_element(values, 'tns', parent)
+        element = parent[0]
+
+        value = type.from_xml(element)
+        assert len(value) == len(values)
+
+        def deserialize():
+            type.from_xml(element)
+
+        def serialize():
+            type.to_parent_element(value, 'tns', etree.Element('test'))
+
+        report("100000 doubles, from_xml, %s" % (buffer or 'list'),
+                                                      best_of(deserialize, 5))
+        report("100000 doubles, to_parent_element, %s" % (buffer or 'list'),
+                                                        best_of(serialize, 5))
+
+if __name__ == '__main__':
+    main()
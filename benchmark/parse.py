@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares the previous envelope parsing path (unescape + unicode decode +
+etree.XMLID) with Application.parse_xml_string, which hands the raw bytes to
+a pooled parser.
+
+Memory is measured in a child process per run, as the peak resident set size
+growth while parsing.
+"""
+
+import subprocess
+import sys
+
+from xml.sax.saxutils import unescape
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import max_rss_kb
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core.model.primitive import String
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class EchoService(DefinitionBase):
+    @soap(String, _returns=String)
+    def echo(self, s):
+        return s
+
+app = Application([EchoService], 'tns')
+
+def make_envelope(size_mb):
+    # no entities here, as the old path can't parse them correctly.
+    item = '<s>some text and some more text</s>'
+    count = size_mb * 1024 * 1024 / len(item)
+
+    return ('<?xml version="1.0" encoding="utf-8"?>'
+            '<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/">'
+                '<e:Body><echo xmlns="tns">%s</echo></e:Body>'
+            '</e:Envelope>' % (item * count))
+
+def old_parse(xml_string, charset):
+    x = unescape(xml_string, {"&apos;": "'", "&quot;": '"'})
+    try:
+        return etree.XMLID(x.decode(charset))
+    except ValueError:
+        return etree.XMLID(x)
+
+def new_parse(xml_string, charset):
+    return app.parse_xml_string(xml_string, charset)
+
+def child(mode, size_mb):
+    envelope = make_envelope(size_mb)
+    before = max_rss_kb()
+    {'old': old_parse, 'new': new_parse}[mode](envelope, 'utf-8')
+    print max_rss_kb() - before
+
+def main():
+    for size_mb in (1, 16, 64):
+        envelope = make_envelope(size_mb)
+        print "%d MB envelope:" % size_mb
+
+        for mode, func in (('old', old_parse), ('new', new_parse)):
+            rss = subprocess.Popen([sys.executable, __file__, mode,
+                          str(size_mb)], stdout=subprocess.PIPE).communicate()[0]
+            t = best_of(lambda: func(envelope, 'utf-8'), 1)
+            report("  %s (peak rss growth %d kB)" % (mode, int(rss)), t)
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        child(sys.argv[1], int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Times from_string and to_string of the primitive types, per value."""
+
+import datetime
+import decimal
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core.model.primitive import Boolean
+from soaplib.core.model.primitive import Date
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Decimal
+from soaplib.core.model.primitive import Double
+from soaplib.core.model.primitive import Duration
+from soaplib.core.model.primitive import Integer
+
+cases = (
+    (Integer, '12345', 12345),
+    (Decimal, '12345.678', decimal.Decimal('12345.678')),
+    (Double, '12345.678', 12345.678),
+    (Boolean, 'true', True),
+    (Date, '2010-01-02', datetime.date(2010, 1, 2)),
+    (DateTime, '2010-01-02T03:04:05', datetime.datetime(2010, 1, 2, 3, 4, 5)),
+    (DateTime, '2010-01-02T03:04:05.123456Z', None),
+    (DateTime, '2010-01-02T03:04:05.123456+05:30', None),
+    (Duration, 'P2DT3H4M5.5S', datetime.timedelta(2, 11045, 500000)),
+)
+
+def main():
+    for cls, string, value in cases:
+        parsed = cls.from_string(string)
+        if value is not None:
+            assert parsed == value
+
+        report("%s from %r" % (cls.__name__, string),
+                          best_of(lambda: cls.from_string(string), 100000))
+        report("%s to string" % cls.__name__,
+                          best_of(lambda: cls.to_string(parsed), 100000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Compares wsgi requests to a lookup method returning 100 records without
+a response cache, with a MemoryCache and with an SqliteCache. The cached
+requests are all hits.
+"""
+
+import datetime
+import os
+import tempfile
+
+from StringIO import StringIO
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core.cache import MemoryCache
+from soaplib.core.cache import SqliteCache
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import wsgi
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    created = DateTime
+
+def make_service(cache):
+    class LookupService(DefinitionBase):
+        @soap(Integer, _returns=Array(Record), _cache=cache)
+        def lookup(self, count):
+            now = datetime.datetime(2010, 1, 1)
+            return [Record(id=i, name='record %d' % i, created=now)
+                                                       for i in range(count)]
+
+    return LookupService
+
+body = ('<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:tns="tns"><e:Body><tns:lookup><tns:count>100</tns:count>'
+        '</tns:lookup></e:Body></e:Envelope>')
+
+def call(server):
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'text/xml; charset=utf-8',
+    }
+
+    return ''.join(server(environ, lambda status, headers: None))
+
+def main():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+
+    try:
+        caches = (
+            ('no cache', None),
+            ('MemoryCache', MemoryCache()),
+            ('SqliteCache', SqliteCache(path)),
+        )
+
+        expected = None
+        for label, cache in caches:
+            app = Application([make_service(cache)], 'tns')
+            server = wsgi.Application(app)
+
+            response = call(server)
+            if expected is None:
+                expected = response
+            assert call(server) == expected
+
+            report("100 records, %s" % label, best_of(lambda: call(server),
+                                                                        300))
+            if cache is not None:
+                print "  ", cache.stats
+
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares the previous ValidatingApplication.build_schema, which wrote the
+schema documents to a temporary directory and parsed them back, with the
+in-memory resolver, for services whose types span 10 and 50 namespaces.
+"""
+
+import shutil
+import tempfile
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core import ValidatingApplication
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+def make_service(num_namespaces):
+    def make_method(name, cls):
+        def method(self, value):
+            return value
+        method.func_name = name
+        return soap(cls, _returns=cls)(method)
+
+    cls_dict = {}
+    member = None
+    for i in range(num_namespaces):
+        type_dict = {
+            '__namespace__': 'urn:bench:ns%d' % i,
+            'i': Integer,
+            's': String,
+        }
+        if member is not None:
+            type_dict['member'] = member
+
+        member = type('Type%d' % i, (ClassModel,), type_dict)
+
+        name = 'op%d' % i
+        cls_dict[name] = make_method(name, member)
+
+    return type('Service%d' % num_namespaces, (DefinitionBase,), cls_dict)
+
+def old_build_schema(self, types=None):
+    schema_nodes = Application.build_schema(self, types)
+
+    if types is None:
+        pref_tns = self.get_namespace_prefix(self.get_tns())
+        tmp_dir_name = tempfile.mkdtemp()
+
+        for k,v in schema_nodes.items():
+            file_name = '%s/%s.xsd' % (tmp_dir_name, k)
+            f = open(file_name, 'w')
+            etree.ElementTree(v).write(f, pretty_print=True)
+            f.close()
+
+        f = open('%s/%s.xsd' % (tmp_dir_name, pref_tns), 'r')
+        self.schema = etree.XMLSchema(etree.parse(f))
+        f.close()
+        shutil.rmtree(tmp_dir_name)
+
+    return self.schema
+
+def main():
+    new_build_schema = ValidatingApplication.__dict__['build_schema']
+
+    for num_namespaces in (10, 50):
+        service = make_service(num_namespaces)
+
+        def build(cls=Application):
+            cls([service], 'tns')
+
+        def build_validating():
+            build(ValidatingApplication)
+
+        report("%d namespaces, Application" % num_namespaces,
+                                                     best_of(build, 20))
+
+        ValidatingApplication.build_schema = old_build_schema
+        report("%d namespaces, ValidatingApplication, old" % num_namespaces,
+                                                best_of(build_validating, 20))
+
+        ValidatingApplication.build_schema = new_build_schema
+        report("%d namespaces, ValidatingApplication, resolver" %
+                              num_namespaces, best_of(build_validating, 20))
+
+if __name__ == '__main__':
+    main()
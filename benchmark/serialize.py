@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares the previous ClassModelBase.get_members, which sorted and
+inspected the members of the class for every instance, with the cached
+serializer plans, on a large Array(ClassModel) response.
+"""
+
+import datetime
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.clazz import ClassModelBase
+from soaplib.core.model.clazz import XMLAttribute
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Float
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    value = Float
+    created = DateTime
+    tags = Array(String)
+
+class ExtendedRecord(Record):
+    __namespace__ = 'tns'
+
+    owner = String
+    comment = String
+
+def old_get_members(cls, inst, parent):
+    parent_cls = getattr(cls, '__extends__', None)
+    if parent_cls :
+        parent_cls.get_members(inst, parent)
+
+    for k,v in sorted(cls._type_info.items(), key=lambda (k,v): (v.creation_counter, k)):
+        subvalue = getattr(inst, k, None)
+
+        if isinstance(v, XMLAttribute):
+            v.marshall(k, subvalue, parent)
+            continue
+
+        mo = v.Attributes.max_occurs
+
+        if mo == 'unbounded' or mo > 1:
+            if subvalue != None:
+                for sv in subvalue:
+                    v.to_parent_element(sv, cls.get_namespace(), parent, k)
+
+        elif v.Attributes.min_occurs == 0 and subvalue is None :
+            pass
+
+        elif subvalue is not None or v.Attributes.nillable or v.Attributes.min_occurs > 0:
+            v.to_parent_element(subvalue, cls.get_namespace(), parent, k)
+
+def main():
+    now = datetime.datetime.now()
+    records = [ExtendedRecord(id=i, name='record %d' % i, value=i * 1.5,
+                          created=now, tags=['a', 'b'], owner='someone')
+                                                          for i in range(10000)]
+
+    array = Array(ExtendedRecord)
+    array.resolve_namespace(array, 'tns')
+
+    def serialize():
+        array.to_parent_element(records, 'tns', etree.Element('root'))
+
+    new_get_members = ClassModelBase.__dict__['get_members']
+
+    ClassModelBase.get_members = classmethod(old_get_members)
+    old_out = etree.Element('root')
+    array.to_parent_element(records, 'tns', old_out)
+    report("10000 records, old", best_of(serialize, 3))
+
+    ClassModelBase.get_members = new_get_members
+    new_out = etree.Element('root')
+    array.to_parent_element(records, 'tns', new_out)
+    report("10000 records, plan", best_of(serialize, 3))
+
+    assert etree.tostring(old_out) == etree.tostring(new_out)
+
+if __name__ == '__main__':
+    main()
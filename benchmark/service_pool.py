@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares per-request service construction with pooled service instances.
+
+Reports the number of service instances created and the latency of
+Application.get_service and of a complete request deserialization.
+"""
+
+import sys
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core.model.primitive import String
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class CountingService(DefinitionBase):
+    instances = 0
+
+    def __init__(self, environ=None):
+        DefinitionBase.__init__(self, environ)
+        CountingService.instances += 1
+
+    @soap(String, _returns=String)
+    def echo(self, s):
+        return s
+
+envelope = etree.fromstring(
+    '<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/">'
+        '<e:Body><echo xmlns="tns"><s>x</s></echo></e:Body>'
+    '</e:Envelope>')
+
+def main():
+    num_requests = 10000
+
+    for pooled in (False, True):
+        CountingService.instances = 0
+        app = Application([CountingService], 'tns', _pool_services=pooled)
+
+        def request():
+            ctx = MethodContext()
+            app.deserialize_soap(ctx, app.IN_WRAPPER, envelope)
+
+        for i in range(num_requests):
+            request()
+        inst = app.get_service(CountingService)
+        inst_size = sys.getsizeof(inst) + sys.getsizeof(inst.__dict__)
+
+        print "pooled=%s:" % pooled
+        print "  %d instances for startup and %d requests, %d bytes each" % (
+                          CountingService.instances, num_requests, inst_size)
+        report("  get_service", best_of(
+                                lambda: app.get_service(CountingService), 10000))
+        report("  request", best_of(request))
+
+if __name__ == '__main__':
+    main()
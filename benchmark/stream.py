@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares the buffered wsgi response, which builds the whole envelope tree
+and string in memory, with the streamed one, on a method that returns a
+200000-item Array from a generator.
+
+Every run happens in a child process, so that the peak resident set sizes
+don't interfere.
+"""
+
+import subprocess
+import sys
+import time
+
+from StringIO import StringIO
+
+from _bench import max_rss_kb
+
+from soaplib.core import Application
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import Float
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import wsgi
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    value = Float
+
+class RecordService(DefinitionBase):
+    @soap(Integer, _returns=Array(Record))
+    def records(self, count):
+        for i in xrange(count):
+            yield Record(id=i, name='record %d' % i, value=i * 1.5)
+
+def make_environ(count):
+    body = ('<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/">'
+                '<e:Body><records xmlns="tns"><count>%d</count></records>'
+                '</e:Body>'
+            '</e:Envelope>' % count)
+
+    return {
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'text/xml',
+    }
+
+def child(mode, count):
+    server = wsgi.Application(Application([RecordService], 'tns'),
+                                       _stream_response=(mode == 'stream'))
+    environ = make_environ(count)
+
+    before = max_rss_kb()
+    start = time.time()
+
+    first = None
+    size = 0
+    for chunk in server(environ, lambda status, headers: None):
+        if first is None:
+            first = time.time() - start
+        size += len(chunk)
+
+    total = time.time() - start
+
+    print first, total, size, max_rss_kb() - before
+
+def main():
+    count = 200000
+    print "%d records:" % count
+
+    for mode in ('tree', 'stream'):
+        out = subprocess.Popen([sys.executable, __file__, mode, str(count)],
+                                    stdout=subprocess.PIPE).communicate()[0]
+        first, total, size, rss = out.split()
+
+        print "  %-8s first byte %8.3f s, total %8.3f s, %d bytes, " \
+              "peak rss growth %d kB" % (mode, float(first), float(total),
+                                                           int(size), int(rss))
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        child(sys.argv[1], int(sys.argv[2]))
+    else:
+        main()
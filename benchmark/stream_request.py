@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Measures the peak memory use of a request with a streamed Array parameter
+(see the _stream_param argument of the soap decorator), on generated
+envelopes of up to 1GB, against parsing the whole request at once.
+
+The envelopes are generated while they're read, so they never exist in
+memory as a whole. Every run happens in a child process, so that the peak
+resident set sizes don't interfere. The sizes in MB can be passed as
+arguments; the buffered run is skipped above 64MB.
+"""
+
+import subprocess
+import sys
+import time
+
+from _bench import max_rss_kb
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core import namespaces
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Row(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    payload = String
+
+class ImportService(DefinitionBase):
+    @soap(Array(Row), _stream_param='rows', _returns=Integer)
+    def import_rows(self, rows):
+        count = 0
+        for row in rows:
+            count += 1
+
+        return count
+
+class BufferedImportService(DefinitionBase):
+    @soap(Array(Row), _returns=Integer)
+    def import_rows(self, rows):
+        return len(rows)
+
+class GeneratedRequest(object):
+    """A file-like object that generates a request of roughly the given size
+    as it's read.
+    """
+
+    row = '<Row><id>%d</id><name>row %d</name><payload>' + 'x' * 900 + \
+                                                        '</payload></Row>'
+
+    def __init__(self, size_mb):
+        self.count = size_mb * 1024 * 1024 / len(self.row)
+        self.parts = self.__generate()
+        self.data = ''
+
+    def __generate(self):
+        yield ('<e:Envelope xmlns:e="%s"><e:Body>'
+                 '<import_rows xmlns="tns"><rows>' % namespaces.ns_soap_env)
+
+        for i in xrange(self.count):
+            yield self.row % (i, i)
+
+        yield '</rows></import_rows></e:Body></e:Envelope>'
+
+    def read(self, size=-1):
+        if size < 0:
+            return self.data + ''.join(self.parts)
+
+        for part in self.parts:
+            self.data += part
+            if len(self.data) >= size:
+                break
+
+        retval, self.data = self.data[:size], self.data[size:]
+
+        return retval
+
+def child(mode, size_mb):
+    if mode == 'stream':
+        app = Application([ImportService], 'tns')
+    else:
+        app = Application([BufferedImportService], 'tns')
+
+    request = GeneratedRequest(size_mb)
+    ctx = MethodContext()
+
+    before = max_rss_kb()
+    start = time.time()
+
+    if mode == 'stream':
+        in_object = app.deserialize_soap_stream(ctx, request)
+    else:
+        root, xmlids = app.parse_xml_string(request.read())
+        in_object = app.deserialize_soap(ctx, app.IN_WRAPPER, root, xmlids)
+
+    count = app.process_request(ctx, in_object)
+    assert count == request.count, count
+
+    print time.time() - start, max_rss_kb() - before
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [16, 64, 1024]
+
+    for size_mb in sizes:
+        print "%d MB envelope:" % size_mb
+
+        for mode in ('buffered', 'stream'):
+            if mode == 'buffered' and size_mb > 64:
+                continue
+
+            out = subprocess.Popen([sys.executable, __file__, '--child', mode,
+                        str(size_mb)], stdout=subprocess.PIPE).communicate()[0]
+            t, rss = out.split()
+
+            print "  %-8s %8.2f s, peak rss growth %d kB" % (mode, float(t),
+                                                                      int(rss))
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
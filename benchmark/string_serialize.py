@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares serializing responses with lxml trees and etree.tostring with
+writing them as strings (Application.serialize_soap_string), for a small
+response and a 1000-record response. The outputs are checked to be equal.
+"""
+
+import datetime
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Float
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import Base
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+    value = Float
+    created = DateTime
+    tags = Array(String)
+
+class RecordService(DefinitionBase):
+    @soap(Integer, _returns=Array(Record))
+    def get_records(self, count):
+        now = datetime.datetime(2010, 1, 1)
+        return [Record(id=i, name='record <%d>' % i, value=i * 1.5,
+                  created=now, tags=['a', 'b']) for i in range(count)]
+
+    @soap(String, _returns=String)
+    def echo(self, s):
+        return s
+
+def main():
+    app = Application([RecordService], 'tns')
+
+    tree_server = Base(app)
+    string_server = Base(app)
+    string_server._string_response = True
+
+    cases = (
+        ('echo', 'hello & goodbye'),
+        ('get_records', 1000),
+    )
+
+    for method, arg in cases:
+        ctx = MethodContext()
+        ctx.service_class = RecordService
+        ctx.service = app.get_service(RecordService)
+        ctx.method_name = method
+        ctx.descriptor = ctx.service.get_method(method)
+
+        out_object = getattr(ctx.service, method)(arg)
+
+        tree = tree_server.get_out_string(ctx, out_object)
+        string = string_server.get_out_string(ctx, out_object)
+        assert tree == string
+
+        number = 10000 // len(tree) + 10
+        report("%s, lxml tree" % method, best_of(
+               lambda: tree_server.get_out_string(ctx, out_object), number))
+        report("%s, string" % method, best_of(
+               lambda: string_server.get_out_string(ctx, out_object), number))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Times String.from_string and String.to_string on ascii and non-ascii text
+with every string policy, and the deserialization of a message with 100
+multilingual String members.
+"""
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.clazz import ClassModelMeta
+from soaplib.core.model.primitive import String
+from soaplib.core.model.primitive import set_string_policy
+
+texts = (
+    ('ascii', 'hello world'),
+    ('latin', u'caf\xe9 cr\xe8me br\xfbl\xe9e'),
+    ('cyrillic', u'\u043f\u0440\u0438\u0432\u0435\u0442 \u043c\u0438\u0440'),
+    ('cjk', u'\u4f60\u597d\u4e16\u754c \u3053\u3093\u306b\u3061\u306f'),
+)
+
+members = {'__namespace__': 'tns'}
+for i in range(100):
+    members['s%02d' % i] = String
+
+Message = ClassModelMeta('Message', (ClassModel,), members)
+
+def main():
+    message = Message()
+    for i in range(100):
+        setattr(message, 's%02d' % i, texts[i % len(texts)][1])
+
+    parent = etree.Element('test')
+    Message.to_parent_element(message, 'tns', parent)
+    element = parent[0]
+
+    try:
+        for policy in (None, 'unicode', 'bytes'):
+            set_string_policy(policy)
+
+            for label, text in texts:
+                # the text as lxml returns it.
+                e = etree.Element('e')
+                e.text = text
+                string = e.text
+
+                report("%s from_string, policy %s" % (label, policy),
+                              best_of(lambda: String.from_string(string),
+                                                                   100000))
+
+            report("100 members from_xml, policy %s" % policy,
+                              best_of(lambda: Message.from_xml(element), 1000))
+
+        for label, text in texts:
+            decoded = unicode(text)
+            report("%s to_string, unicode" % label,
+                    best_of(lambda: String.to_string(decoded), 100000))
+
+            encoded = decoded.encode('utf-8')
+            report("%s to_string, utf-8" % label,
+                    best_of(lambda: String.to_string(encoded), 100000))
+
+    finally:
+        set_string_policy(None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+"""Measures the overhead of recording the timings of the phases of wsgi
+requests to a method returning 20 records: without a timing sink, with a
+sink that does nothing and with a TimingAggregator.
+"""
+
+from StringIO import StringIO
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.server import wsgi
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+from soaplib.core.timing import TimingAggregator
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer
+    name = String
+
+class LookupService(DefinitionBase):
+    @soap(Integer, _returns=Array(Record))
+    def lookup(self, count):
+        return [Record(id=i, name='record %d' % i) for i in range(count)]
+
+body = ('<e:Envelope xmlns:e="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:tns="tns"><e:Body><tns:lookup><tns:count>20</tns:count>'
+        '</tns:lookup></e:Body></e:Envelope>')
+
+def call(server):
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'text/xml; charset=utf-8',
+    }
+
+    return ''.join(server(environ, lambda status, headers: None))
+
+def main():
+    app = Application([LookupService], 'tns')
+    aggregator = TimingAggregator()
+
+    for label, sink in (
+                ('no timing sink', None),
+                ('no-op timing sink', lambda ctx: None),
+                ('TimingAggregator', aggregator),
+            ):
+        server = wsgi.Application(app, _timing_sink=sink)
+        report("20 records, %s" % label, best_of(lambda: call(server), 2000))
+
+    for phase, stats in sorted(aggregator.get_stats()['{tns}lookup'].items()):
+        print "   %-12s %8.2f usec" % (phase,
+                                       stats['sum'] / stats['count'] * 1e6)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Compares the cost of deserializing a request with 1000 constrained records
+without validation, with XMLSchema validation and with native validation.
+"""
+
+import datetime
+
+from lxml import etree
+
+from _bench import best_of
+from _bench import report
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core import ValidatingApplication
+from soaplib.core import namespaces
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Float
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+
+class Record(ClassModel):
+    __namespace__ = 'tns'
+
+    id = Integer(min_occurs=1, nillable=False)
+    code = String(min_len=3, max_len=8, pattern='[A-Z]+[0-9]*')
+    status = String(values=set(['new', 'open', 'closed']))
+    value = Float
+    created = DateTime
+    tags = Array(String(max_len=16))
+
+class RecordService(DefinitionBase):
+    @soap(Array(Record), _returns=Integer)
+    def put_records(self, records):
+        return len(records)
+
+def make_request(count):
+    now = datetime.datetime.now()
+    records = [Record(id=i, code='REC%d' % (i % 10000), status='open',
+                      value=i * 1.5, created=now, tags=['a', 'b'])
+                                                       for i in range(count)]
+
+    envelope = etree.Element('{%s}Envelope' % namespaces.ns_soap_env)
+    body = etree.SubElement(envelope, '{%s}Body' % namespaces.ns_soap_env)
+    message = etree.SubElement(body, '{tns}put_records')
+
+    records_type = Array(Record)
+    records_type.resolve_namespace(records_type, 'tns')
+    records_type.to_parent_element(records, 'tns', message, 'records')
+
+    return etree.tostring(envelope)
+
+def main():
+    request = make_request(1000)
+
+    apps = (
+        ('none', Application([RecordService], 'tns')),
+        ('schema', ValidatingApplication([RecordService], 'tns')),
+        ('native', ValidatingApplication([RecordService], 'tns',
+                                                         _validator='native')),
+    )
+
+    for label, app in apps:
+        def deserialize():
+            root = etree.fromstring(request)
+            return app.deserialize_soap(MethodContext(), app.IN_WRAPPER, root)
+
+        assert len(deserialize().records) == 1000
+        report("1000 records, validation: %s" % label,
+                                                    best_of(deserialize, 5, 10))
+
+    schema = apps[1][1].schema
+    message = etree.fromstring(request)[0][0]
+    report("1000 records, XMLSchema.validate only",
+                           best_of(lambda: schema.validate(message), 5, 10))
+
+if __name__ == '__main__':
+    main()
@@ -17,75 +17,62 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
-from time import time
+import soaplib
 
 from soaplib.core.service import soap
-from soaplib.core.model.primitive import String, Integer, Array
-from soaplib.server.wsgi_soap import request
-from soaplib.server.wsgi_soap import SimpleWSGIApp
+from soaplib.core.service import DefinitionBase
+from soaplib.core.model.primitive import String, Integer
+
+from soaplib.core.server import wsgi
+from soaplib.core.model.clazz import Array
 
 '''
 This example is an enhanced version of the HelloWorld example that
-uses service 'hooks' to apply cross-cutting behavior to the service.
-In this example, the service hooks are used to gather performance
-information on both the method execution as well as the duration
-of the entire call, including serialization and deserialization. The
-available hooks are:
-
-    * on_call
-    * on_wsdl
-    * on_wsdl_exception
-    * on_method_exec
-    * on_results
-    * on_exception
-    * on_return
-
-These method can be used to easily apply cross-cutting functionality
-accross all methods in the service to do things like database transaction
-management, logging and measuring performance.  This example also
-employs the threadlocal request (soaplib.wsgi_soap.request) object
-to hold the data points for this request.
+gathers performance information on every request. The wsgi application is
+given a timing sink, which is passed the MethodContext of every request once
+its response is produced. ctx.timings then holds the seconds spent in every
+phase of the request:
+
+    * read
+    * mime
+    * parse
+    * validate
+    * deserialize
+    * process
+    * serialize
+    * tostring
+    * total
+
+See soaplib.core.timing for what each phase covers. The service hooks
+(on_method_call, on_method_return_object, on_method_exception_object, etc.)
+are still there to apply other cross-cutting behavior to the service, like
+database transaction management or logging.
 '''
 
-
-class HelloWorldService(SimpleWSGIApp):
-
+class HelloWorldService(DefinitionBase):
     @soap(String, Integer, _returns=Array(String))
     def say_hello(self, name, times):
         results = []
-        raise Exception("this is some crazy crap")
         for i in range(0, times):
             results.append('Hello, %s' % name)
         return results
 
-    def on_call(self, environ):
-        request.additional['call_start'] = time()
-
-    def on_method_exec(self, environ, body, py_params, soap_params):
-        request.additional['method_start'] = time()
+def print_timings(ctx):
+    print 'Method %s took [%s] - total execution time [%s]' % (
+        ctx.method_name, ctx.timings.get('process'), ctx.timings['total'])
 
-    def on_results(self, environ, py_results, soap_results, http_headers):
-        request.additional['method_end'] = time()
-
-    def on_return(self, environ, return_String):
-        call_start = request.additional['call_start']
-        call_end = time()
-        method_start = request.additional['method_start']
-        method_end = request.additional['method_end']
-
-        print 'Method took [%s] - total execution time[%s]'% (
-            method_end-method_start, call_end-call_start)
-
-
-def make_client():
-    from soaplib.client import make_service_client
-    client = make_service_client('http://localhost:7889/', HelloWorldService())
-    return client
+    for phase, seconds in sorted(ctx.timings.items()):
+        print '    %-12s %.6f' % (phase, seconds)
 
 if __name__=='__main__':
     try:
         from wsgiref.simple_server import make_server
-        server = make_server('localhost', 7889, HelloWorldService())
+        soap_application = soaplib.core.Application([HelloWorldService], 'tns')
+        wsgi_application = wsgi.Application(soap_application,
+                                                _timing_sink=print_timings)
+
+        server = make_server('localhost', 7889, wsgi_application)
         server.serve_forever()
+
     except ImportError:
         print "Error: example server code requires Python >= 2.5"
@@ -22,25 +22,40 @@ logger = logging.getLogger("soaplib._base")
 
 import warnings
 
-import shutil
-import tempfile
+from copy import deepcopy
+
+import gzip
+import hashlib
+import sys
+import threading
+import time
 import traceback
 
+from StringIO import StringIO
+
 from lxml import etree
 
 from soaplib.core import namespaces
+from soaplib.core._event_deserializer import EventDeserializer
+from soaplib.core._event_deserializer import Unsupported
+from soaplib.core._string_serializer import StringSerializer
 
+from soaplib.core.cache import get_request_key
+from soaplib.core.model.clazz import ClassModelBase
 from soaplib.core.model.exception import Fault
+from soaplib.core.model.exception import ValidationError
+from soaplib.core.model.primitive import _string_policies
+from soaplib.core.model.primitive import get_string_policy
+from soaplib.core.model.primitive import set_string_policy
+from soaplib.core.timing import clock
 from soaplib.core.util.ordereddict import OrderedDict as odict
+from soaplib.core.validation import Always
 from soaplib.core.wsdl import WSDL
 
 HTTP_500 = '500 Internal server error'
 HTTP_200 = '200 OK'
 HTTP_405 = '405 Method Not Allowed'
 
-class ValidationError(Fault):
-    pass
-
 class _SchemaInfo(object):
     def __init__(self):
         self.elements = odict()
@@ -172,7 +187,35 @@ class MethodContext(object):
 
         self.method_name = None
         self.descriptor = None
-        
+
+        # set by the transport to identify the client, see
+        # soaplib.core.validation.PerClientKey
+        self.client_key = None
+        self.validate_input = False
+
+        # the seconds spent in every phase of the request, when the
+        # transport records them. see soaplib.core.timing.
+        self.timings = None
+
+    def add_timing(self, phase, start):
+        '''Adds the time elapsed since start, as returned by
+        soaplib.core.timing.clock, to the given phase.
+        '''
+
+        timings = self.timings
+        timings[phase] = timings.get(phase, 0.0) + clock() - start
+
+class _Flight(object):
+    """A call of a coalesced method, which identical requests that come in
+    while it runs wait for. See Application.process_request.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.retval = None
+        self.out_header = None
+        self.exc_info = None
+
 class MethodDescriptor(object):
     '''
     This class represents the method signature of a soap method,
@@ -193,6 +236,13 @@ class MethodDescriptor(object):
                  faults=(),
                  body_style='rpc', # backward compatibility
                  port_type=None, #added to support multiple portTypes
+                 stream_param=None,
+                 validation=None,
+                 lazy=False,
+                 records=False,
+                 cache=None,
+                 coalesce=False,
+                 coalesce_per_client=True,
                 ):
 
         self.name = name
@@ -208,14 +258,20 @@ class MethodDescriptor(object):
         self.faults = faults
         self.body_style = body_style
         self.port_type = port_type
+        self.stream_param = stream_param
+        self.validation = validation
+        self.lazy = lazy
+        self.records = records
+        self.cache = cache
+        self.coalesce = coalesce
+        self.coalesce_per_client = coalesce_per_client
 
 def _from_soap(in_envelope_xml, xmlids=None):
     '''
     Parses the xml string into the header and payload
     '''
 
-    if xmlids:
-        resolve_hrefs(in_envelope_xml, xmlids)
+    resolve_hrefs(in_envelope_xml, xmlids)
 
     if in_envelope_xml.tag != '{%s}Envelope' % namespaces.ns_soap_env:
         raise Fault('Client.SoapError', 'No {%s}Envelope element was found!' %
@@ -240,48 +296,217 @@ def _from_soap(in_envelope_xml, xmlids=None):
 
     return header, body
 
-def _parse_xml_string(xml_string, charset=None):
+def _iterparse_array(events, array_xml, serializer, string_policy):
+    '''Deserializes the items of array_xml as they're read from the given
+    iterparse events, and removes them from the tree once they're done. The
+    items are deserialized with the given string policy, which is only in
+    effect while they are.
+    '''
+
+    depth = 0
+    for event, element in events:
+        if event == 'start':
+            depth += 1
+
+        elif depth == 0:
+            # the end of array_xml
+            break
+
+        else:
+            depth -= 1
+            if depth == 0:
+                previous = get_string_policy()
+                set_string_policy(string_policy)
+                try:
+                    value = serializer.from_xml(element)
+                finally:
+                    set_string_policy(previous)
+
+                element.clear()
+                while element.getprevious() is not None:
+                    del array_xml[0]
+
+                yield value
+
+    # the rest of the request has to be read to make sure it's well-formed.
+    for event, element in events:
+        pass
+
+class _ParserPool(threading.local):
+    """Keeps one preconfigured etree.XMLParser per thread and encoding, as lxml
+    parsers can't be shared between threads.
+    """
+
+    defaults = {
+        'resolve_entities': False,
+        'huge_tree': False,
+    }
+
+    def __init__(self, options=None):
+        self.options = dict(self.defaults)
+        if options is not None:
+            self.options.update(options)
+
+        self.parsers = {}
+
+    def get_parser(self, encoding=None):
+        parser = self.parsers.get(encoding, None)
+        if parser is None:
+            parser = etree.XMLParser(encoding=encoding, **self.options)
+            self.parsers[encoding] = parser
+
+        return parser
+
+_default_parser_pool = _ParserPool()
+
+def _parse_xml_string(xml_string, charset=None, parser_pool=None):
+    if parser_pool is None:
+        parser_pool = _default_parser_pool
+
+    if isinstance(xml_string, unicode):
+        # lxml refuses unicode strings that have an encoding declaration.
+        xml_string = xml_string.encode('utf8')
+        charset = 'utf8'
+
     try:
-        if charset is None: # hack
-            raise ValueError(charset)
+        # the charset is handed to the parser so that the payload is decoded
+        # in a single pass, without making a unicode copy of it.
+        root = etree.fromstring(xml_string, parser_pool.get_parser(charset))
 
-        root, xmlids = etree.XMLID(xml_string.decode(charset))
+    except etree.XMLSyntaxError, e:
+        if charset is None:
+            raise
 
-    except ValueError,e:
         logger.debug('%s -- falling back to str decoding.' % (e))
-        root, xmlids = etree.XMLID(xml_string)
+        root = etree.fromstring(xml_string, parser_pool.get_parser())
+
+    # the id dictionary is only needed to resolve multi-references, so it's
+    # built by resolve_hrefs, and only if the message has any.
+    return root, None
 
-    return root, xmlids
+_xpath_hrefs = etree.XPath('//*[@href]')
+_xpath_ids = etree.XPath('//*[@id]')
+_xpath_child_hrefs = etree.XPath('.//*[@href]')
+_xpath_nested_ids = etree.XPath('//*[@id][.//*[@href]]')
 
 # see http://www.w3.org/TR/2000/NOTE-SOAP-20000508/
 # section 5.2.1 for an example of how the id and href attributes are used.
-def resolve_hrefs(element, xmlids):
-    for e in element:
-        if e.get('id'):
-            continue # don't need to resolve this element
-
-        elif e.get('href'):
-            resolved_element = xmlids[e.get('href').replace('#', '')]
-            if resolved_element is None:
+def resolve_hrefs(element, xmlids=None):
+    """Replaces the elements that refer to others with the href attribute with
+    the contents of the referred elements.
+
+    This is done without recursion, and every referred element is resolved
+    only once, no matter how many times it's referred to. Elements in a
+    reference cycle are left unresolved.
+    """
+
+    hrefs = _xpath_hrefs(element)
+    if len(hrefs) == 0:
+        return element
+
+    if not xmlids:
+        xmlids = dict([(e.get('id'), e) for e in _xpath_ids(element)])
+
+    # the children of an element referred to by more than one element are
+    # copied to all but the last one, where they are moved.
+    ref_count = {}
+    for e in hrefs:
+        ref = e.get('href').replace('#', '')
+        ref_count[ref] = ref_count.get(ref, 0) + 1
+
+    # the referred elements that contain references themselves
+    nested = set(_xpath_nested_ids(element))
+
+    done = set()
+    in_progress = set()
+    waiting = set()
+    cyclic = set()
+    stack = hrefs[::-1]
+
+    while len(stack) > 0:
+        e = stack[-1]
+
+        ref = e.get('href')
+        if ref is None or e in cyclic: # already taken care of
+            stack.pop()
+            continue
+
+        ref = ref.replace('#', '')
+        resolved_element = xmlids.get(ref, None)
+        if resolved_element is None:
+            stack.pop()
+            continue
+
+        # references in the referred element need to be resolved first
+        if not (ref in done):
+            if e in waiting:
+                done.add(ref)
+
+            elif ref in in_progress: # it's a reference cycle
+                cyclic.add(e)
+                stack.pop()
                 continue
-            resolve_hrefs(resolved_element, xmlids)
 
-            # copies the attributes
-            [e.set(k, v) for k, v in resolved_element.items()]
+            else:
+                in_progress.add(ref)
+
+                pending = ()
+                if resolved_element in nested:
+                    pending = _xpath_child_hrefs(resolved_element)
 
-            # copies the children
-            [e.append(child) for child in resolved_element.getchildren()]
+                if len(pending) > 0:
+                    waiting.add(e)
+                    stack.extend(pending[::-1])
+                    continue
 
-            # copies the text
-            e.text = resolved_element.text
+                done.add(ref)
 
+        stack.pop()
+        del e.attrib['href']
+
+        # copies the attributes
+        [e.set(k, v) for k, v in resolved_element.items() if k != 'id']
+
+        # copies the children
+        ref_count[ref] -= 1
+        if ref_count[ref] == 0:
+            e.extend(resolved_element.getchildren())
         else:
-            resolve_hrefs(e, xmlids)
+            e.extend([deepcopy(c) for c in resolved_element.getchildren()])
+
+        # copies the text
+        e.text = resolved_element.text
 
     return element
 
+# see Application.deserialize_soap_string
+_element_hooks = ('parse_xml_string', 'decompose_incoming_envelope',
+                  'deserialize_soap', 'get_service_class', 'should_validate',
+                  'validate', 'from_xml')
+
+class WSDLDocument(object):
+    """A serialized wsdl, along with everything that's needed to serve it
+    over http: its gzipped variant, its entity tag and its modification time.
+    """
+
+    def __init__(self, string):
+        self.string = string
+        self.etag = '"%s"' % hashlib.md5(string).hexdigest()
+        self.last_modified = int(time.time())
+
+        # mtime is fixed so that the gzipped variant only depends on the wsdl
+        # contents.
+        buf = StringIO()
+        f = gzip.GzipFile(fileobj=buf, mode='wb', mtime=0)
+        f.write(string)
+        f.close()
+
+        self.gzipped = buf.getvalue()
+        self.gzipped_etag = '"%s-gzip"' % self.etag[1:-1]
+
 class Application(object):
     transport = None
+    wsdl_cache_size = 16
 
     class NO_WRAPPER:
         pass
@@ -290,22 +515,65 @@ class Application(object):
     class OUT_WRAPPER:
         pass
 
-    def __init__(self, services, tns, name=None, _with_partnerlink=False):
+    def __init__(self, services, tns, name=None, _with_partnerlink=False,
+                                   _pool_services=False, _parser_options=None,
+                                   _string_policy=None):
         '''
         @param An iterable of ServiceBase subclasses that define the exposed
                services.
         @param The targetNamespace attribute of the exposed service.
         @param The name attribute of the exposed service.
         @param Flag to indicate whether to generate partnerlink node in wsdl.
+        @param Flag to indicate whether service instances should be reused
+               across requests. Every thread gets its own instance of each
+               service class, which is reset before every request. Only turn
+               this on if your services don't keep per-request state other
+               than in_header, out_header and environ.
+        @param A dict of keyword arguments for the etree.XMLParser instances
+               used to parse incoming messages, e.g. {'huge_tree': True}.
+               Entity resolution is off by default.
+        @param The type of the String values of incoming messages: None
+               for str when the text is ascii and unicode otherwise,
+               'unicode' for unicode, 'bytes' for str in string_encoding.
+               See soaplib.core.model.primitive.set_string_policy.
         '''
 
+        if not (_string_policy in _string_policies):
+            raise ValueError("Unknown string policy %r" % (_string_policy,))
+
+        self.string_policy = _string_policy
         self.services = services
         self.__tns = tns
         self.__name = name
         self._with_plink = _with_partnerlink
+        self._pool_services = _pool_services
+        self.__service_pool = threading.local()
+        self.__parser_pool = _ParserPool(_parser_options)
+        self.__string_serializer = StringSerializer(self)
+        self.__event_deserializer = EventDeserializer(self,
+                                                  self.__parser_pool.options)
+
+        # the event deserializer skips the hooks that route requests and get
+        # their elements.
+        self.__event_requests = not [name for name in _element_hooks
+                           if getattr(type(self), name).im_func is not
+                              getattr(Application, name).im_func]
+
+        # the calls of coalesced methods in progress, by request key. see
+        # process_request.
+        self.__flights = {}
+        self.__flights_lock = threading.Lock()
+
+        # the number of calls of coalesced methods that were executed, and
+        # that waited for an identical call instead.
+        self.coalesce_stats = {'executed': 0, 'coalesced': 0}
 
         self.call_routes = {}
+        self.method_routes = {}
+        self.stream_requests = False
         self.wsdl = None
+        self.__wsdl_cache = odict()
+        self.__wsdl_lock = threading.Lock()
         self.__public_methods = {}
         self.__classes = {}
 
@@ -328,9 +596,7 @@ class Application(object):
         return self.__classes[key]()
 
     def parse_xml_string(self, xml_string, charset=None):
-        from xml.sax.saxutils import unescape, escape
-        x = unescape(xml_string, {"&apos;": "'", "&quot;": '"'})
-        return _parse_xml_string(x, charset)
+        return _parse_xml_string(xml_string, charset, self.__parser_pool)
 
     def decompose_incoming_envelope(self, ctx, envelope_xml, xmlids=None):
         header, body = _from_soap(envelope_xml, xmlids)
@@ -343,7 +609,15 @@ class Application(object):
 
         elif not (body is None):
             try:
-                self.validate(body)
+                ctx.validate_input = self.should_validate(ctx, body)
+                if ctx.validate_input:
+                    if ctx.timings is None:
+                        self.validate(body)
+                    else:
+                        start = clock()
+                        self.validate(body)
+                        ctx.add_timing('validate', start)
+
                 if (not (body is None)) and (ctx.method_name is None):
                     ctx.method_name = body.tag
                     logger.debug("\033[92mMethod name: %r\033[0m" %
@@ -385,6 +659,14 @@ class Application(object):
         assert wrapper in (Application.IN_WRAPPER,
                                                 Application.OUT_WRAPPER),wrapper
 
+        string_policy = get_string_policy()
+        set_string_policy(self.string_policy)
+        try:
+            return self.__deserialize_soap(ctx, wrapper, envelope_xml, xmlids)
+        finally:
+            set_string_policy(string_policy)
+
+    def __deserialize_soap(self, ctx, wrapper, envelope_xml, xmlids):
         # this sets the ctx.in_body_xml and ctx.in_header_xml properties
         self.decompose_incoming_envelope(ctx, envelope_xml, xmlids)
 
@@ -397,8 +679,7 @@ class Application(object):
                 raise Exception("Could not extract method name from the request!")
             else:
                 if ctx.descriptor is None:
-                    descriptor = ctx.descriptor = ctx.service.get_method(
-                                                                ctx.method_name)
+                    descriptor = ctx.descriptor = self.get_method_descriptor(ctx)
                 else:
                     descriptor = ctx.descriptor
 
@@ -413,16 +694,218 @@ class Application(object):
             if (ctx.in_header_xml is not None and
                 len(ctx.in_header_xml) > 0 and
                 header_class is not None):
-                ctx.service.in_header = header_class.from_xml(ctx.in_header_xml)
+                ctx.service.in_header = self.from_xml(ctx, header_class,
+                                                            ctx.in_header_xml)
 
             # decode method arguments
             if ctx.in_body_xml is not None and len(ctx.in_body_xml) > 0:
-                in_body = body_class.from_xml(ctx.in_body_xml)
+                in_body = self.from_xml(ctx, body_class, ctx.in_body_xml)
             else:
                 in_body = [None] * len(body_class._type_info)
 
         return in_body
 
+    def from_xml(self, ctx, cls, element):
+        """Deserializes the given element of an incoming message as an
+        instance of cls. The ClassModels of the messages of methods declared
+        with @soap(_lazy=True) are deserialized lazily, and the ones of
+        methods declared with @soap(_records=True) as records. See
+        ClassModelBase.get_lazy_instance and ClassModelBase.get_record.
+        """
+
+        descriptor = ctx.descriptor
+        if descriptor is not None and issubclass(cls, ClassModelBase):
+            if descriptor.lazy:
+                return cls.get_lazy_instance(element, True)
+
+            if descriptor.records:
+                return cls.get_record(element)
+
+        return cls.from_xml(element)
+
+    def deserialize_soap_string(self, ctx, xml_string, charset=None):
+        """Like deserialize_soap with IN_WRAPPER, but parses the request
+        itself, deserializing the message from the events of the parser
+        instead of building the envelope tree first. ctx.in_body_xml is not
+        set.
+
+        Requests with faults or multi-references, requests to services that
+        override on_method_call and applications that override the hooks
+        which get elements, like ValidatingApplication, are parsed and
+        handed to deserialize_soap instead.
+
+        Not meant to be overridden.
+        """
+
+        if self.__event_requests and ctx.method_name is None and \
+                                                ctx.service_class is None:
+            string_policy = get_string_policy()
+            set_string_policy(self.string_policy)
+
+            try:
+                return self.__deserialize_events(ctx, xml_string, charset)
+
+            except Unsupported:
+                pass
+
+            finally:
+                set_string_policy(string_policy)
+
+        root, xmlids = self.parse_xml_string(xml_string, charset)
+
+        return self.deserialize_soap(ctx, Application.IN_WRAPPER, root,
+                                                                        xmlids)
+
+    def __deserialize_events(self, ctx, xml_string, charset):
+        method_name, route, header, in_body = \
+                     self.__event_deserializer.deserialize(xml_string, charset)
+
+        ctx.method_name = method_name
+        ctx.service_class, ctx.descriptor = route
+        ctx.service = self.get_service(ctx.service_class)
+
+        ctx.in_header_xml = header
+        header_class = ctx.descriptor.in_header
+        if header is not None and len(header) > 0 and header_class is not None:
+            ctx.service.in_header = self.from_xml(ctx, header_class, header)
+
+        return in_body
+
+    def deserialize_soap_stream(self, ctx, in_stream, charset=None):
+        """Like deserialize_soap, but reads the request from the given
+        file-like object with etree.iterparse.
+
+        When the method the request is routed to has a streamed parameter
+        (see the _stream_param argument of the soap decorator), that
+        parameter is an iterator that parses the array items as it's
+        consumed, discarding every item once it's deserialized. Such requests
+        are not validated and can't use multi-ref encoding. Other requests are
+        parsed as a whole and handed to deserialize_soap.
+
+        Not meant to be overridden.
+        """
+
+        string_policy = get_string_policy()
+        set_string_policy(self.string_policy)
+        try:
+            return self.__deserialize_soap_stream(ctx, in_stream, charset)
+        finally:
+            set_string_policy(string_policy)
+
+    def __deserialize_soap_stream(self, ctx, in_stream, charset):
+        events = etree.iterparse(in_stream, events=('start', 'end'),
+                                encoding=charset, **self.__parser_pool.options)
+
+        # look for the start of the first child of the soap body.
+        body_tag = '{%s}Body' % namespaces.ns_soap_env
+        body_xml = None
+        for event, element in events:
+            if event == 'start':
+                parent = element.getparent()
+                if parent is not None and parent.tag == body_tag:
+                    body_xml = element
+                    break
+
+        route = None
+        if body_xml is not None:
+            route = self.method_routes.get(body_xml.tag, None)
+
+        if route is None or route[1].stream_param is None:
+            for event, element in events:
+                pass
+
+            return self.deserialize_soap(ctx, Application.IN_WRAPPER,
+                                                                events.root)
+
+        envelope_xml = body_xml.getroottree().getroot()
+        if envelope_xml.tag != '{%s}Envelope' % namespaces.ns_soap_env:
+            raise Fault('Client.SoapError', 'No {%s}Envelope element was '
+                                            'found!' % namespaces.ns_soap_env)
+
+        ctx.method_name = body_xml.tag
+        try:
+            ctx.service_class = self.get_service_class(ctx.method_name)
+
+        except Exception,e:
+            logger.debug(traceback.format_exc())
+            raise ValidationError('Client', 'Method not found: %r' %
+                                                                ctx.method_name)
+
+        ctx.service = self.get_service(ctx.service_class)
+        ctx.in_body_xml = body_xml
+        descriptor = ctx.descriptor = self.get_method_descriptor(ctx)
+
+        # the header precedes the body, so it's already parsed.
+        header_xml = envelope_xml.find('{%s}Header' % namespaces.ns_soap_env)
+        if header_xml is not None and len(header_xml) > 0:
+            ctx.in_header_xml = header_xml[0]
+            if descriptor.in_header is not None:
+                ctx.service.in_header = descriptor.in_header.from_xml(
+                                                             ctx.in_header_xml)
+
+        # parse the parameters that precede the streamed one.
+        stream_param = descriptor.stream_param
+        array_xml = None
+        depth = 0
+        for event, element in events:
+            if event == 'start':
+                depth += 1
+                if depth == 1 and \
+                            element.tag.split('}')[-1] == stream_param:
+                    array_xml = element
+                    break
+
+            else:
+                depth -= 1
+                if depth < 0:
+                    # the body ended without the streamed parameter.
+                    break
+
+        # the parser may have read ahead into the streamed parameter, so
+        # ClassModelBase.from_xml can't be used on the body here.
+        in_message = descriptor.in_message
+        in_body = in_message.get_deserialization_instance()
+        tags, names, attributes = in_message.get_deserializer_tables()
+
+        for element in body_xml:
+            if element is array_xml:
+                break
+
+            tag = element.tag
+            if not isinstance(tag, basestring):
+                continue
+
+            entry = tags.get(tag, None)
+            if entry is None:
+                entry = names.get(tag.split('}')[-1], None)
+                if entry is None:
+                    continue
+
+            key, member, is_multiple = entry
+            if is_multiple:
+                value = getattr(in_body, key, None)
+                if value is None:
+                    value = []
+                    setattr(in_body, key, value)
+                value.append(member.from_xml(element))
+
+            else:
+                setattr(in_body, key, member.from_xml(element))
+
+        if array_xml is None or array_xml.get('{%s}nil' % namespaces.ns_xsi):
+            for event, element in events:
+                pass
+
+            setattr(in_body, stream_param, None)
+
+        else:
+            (serializer,) = \
+                         in_message._type_info[stream_param]._type_info.values()
+            setattr(in_body, stream_param, _iterparse_array(events, array_xml,
+                                                serializer, self.string_policy))
+
+        return in_body
+
     def process_request(self, ctx, req_obj):
         """Takes a MethodContext instance and the native request object.
         Returns the response to the request as a native python object.
@@ -438,7 +921,10 @@ class Application(object):
             func = getattr(ctx.service, ctx.descriptor.name)
 
             # call the method
-            retval = ctx.service.call_wrapper(func, req_obj)
+            if ctx.descriptor.coalesce:
+                retval = self.__call_coalesced(ctx, func, req_obj)
+            else:
+                retval = ctx.service.call_wrapper(func, req_obj)
 
         except Fault, e:
             stacktrace=traceback.format_exc()
@@ -462,6 +948,60 @@ class Application(object):
 
         return retval
 
+    def __call_coalesced(self, ctx, func, req_obj):
+        """Calls the method of a request like process_request does, unless an
+        identical request (see soaplib.core.cache.get_request_key) is already
+        being processed. In that case, this waits for the other call and
+        shares its return value, out header or exception.
+
+        Only the requests of the same client (see MethodContext.client_key)
+        are identical, unless the method is decorated with
+        @soap(_coalesce_per_client=False).
+        """
+
+        key = get_request_key(ctx, req_obj, ctx.descriptor.coalesce_per_client)
+
+        with self.__flights_lock:
+            flight = self.__flights.get(key, None)
+            if flight is None:
+                flight = self.__flights[key] = _Flight()
+                is_leader = True
+            else:
+                self.coalesce_stats['coalesced'] += 1
+                is_leader = False
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.exc_info is not None:
+                raise flight.exc_info[0], flight.exc_info[1], \
+                                                          flight.exc_info[2]
+
+            ctx.service.out_header = flight.out_header
+            return flight.retval
+
+        try:
+            retval = ctx.service.call_wrapper(func, req_obj)
+
+            # generators can only be serialized once.
+            if hasattr(retval, 'next'):
+                retval = list(retval)
+
+            flight.retval = retval
+            flight.out_header = ctx.service.out_header
+
+            return retval
+
+        except:
+            flight.exc_info = sys.exc_info()
+            raise
+
+        finally:
+            with self.__flights_lock:
+                del self.__flights[key]
+                self.coalesce_stats['executed'] += 1
+
+            flight.done.set()
+
     def serialize_soap(self, ctx, wrapper, out_object):
         """Takes a MethodContext instance and the object to be serialied.
         Returns the corresponding xml structure as an lxml.etree._Element
@@ -523,31 +1063,8 @@ class Application(object):
             ctx.out_body_xml = out_body_xml = etree.SubElement(envelope,
                                                '{%s}Body' % namespaces.ns_soap_env)
 
-            # instantiate the result message
-            if wrapper is Application.NO_WRAPPER:
-                result_message_class = ctx.descriptor.in_message
-                result_message = out_object
-
-            else:
-                if wrapper is Application.IN_WRAPPER:
-                    result_message_class = ctx.descriptor.in_message
-                elif wrapper is Application.OUT_WRAPPER:
-                    result_message_class = ctx.descriptor.out_message
-
-                result_message = result_message_class()
-
-                # assign raw result to its wrapper, result_message
-                out_type_info = result_message_class._type_info
-
-                if len(out_type_info) > 0:
-                    if len(out_type_info) == 1:
-                        attr_name = result_message_class._type_info.keys()[0]
-                        setattr(result_message, attr_name, out_object)
-
-                    else:
-                        for i in range(len(out_type_info)):
-                            attr_name=result_message_class._type_info.keys()[i]
-                            setattr(result_message, attr_name, out_object[i])
+            result_message_class, result_message = self.__get_result_message(
+                                                      ctx, wrapper, out_object)
 
             # transform the results into an element
             result_message_class.to_parent_element(
@@ -564,6 +1081,115 @@ class Application(object):
 
         return envelope
 
+    def serialize_soap_incremental(self, ctx, wrapper, out_object, xf):
+        """Like serialize_soap, but writes the envelope to xf, an open
+        lxml.etree.xmlfile context, as it goes. This is a generator that
+        yields whenever a part of the response is written, see
+        ClassModelBase.to_xmlfile.
+
+        Faults and the on_method_return_xml hook need the whole envelope
+        tree, so they're only supported by serialize_soap.
+
+        Not meant to be overridden.
+        """
+
+        assert wrapper in (Application.IN_WRAPPER, Application.OUT_WRAPPER,
+                                                 Application.NO_WRAPPER),wrapper
+        assert not isinstance(out_object, Exception)
+
+        # the xml prefix is implicit, lxml only omits it when building trees.
+        nsmap = dict([(k, v) for k, v in self.nsmap.items() if k != 'xml'])
+
+        with xf.element('{%s}Envelope' % namespaces.ns_soap_env, nsmap=nsmap):
+            # header
+            if ctx.service.out_header != None:
+                if wrapper in (Application.NO_WRAPPER, Application.OUT_WRAPPER):
+                    header_message_class = ctx.descriptor.in_header
+                else:
+                    header_message_class = ctx.descriptor.out_header
+
+                if ctx.descriptor.out_header is None:
+                    logger.warning(
+                        "Skipping soap response header as %r method is not "
+                        "published to have one." % ctx.descriptor.name)
+
+                else:
+                    with xf.element('{%s}Header' % namespaces.ns_soap_env):
+                        for _ in header_message_class.to_xmlfile(
+                                ctx.service.out_header, self.get_tns(), xf,
+                                header_message_class.get_type_name()):
+                            yield
+
+            # body
+            with xf.element('{%s}Body' % namespaces.ns_soap_env):
+                result_message_class, result_message = \
+                        self.__get_result_message(ctx, wrapper, out_object)
+
+                for _ in result_message_class.to_xmlfile(result_message,
+                                                        self.get_tns(), xf):
+                    yield
+
+    def serialize_soap_string(self, ctx, wrapper, out_object):
+        """Like serialize_soap, but returns the response as a string in
+        string_encoding, the same one etree.tostring would produce from
+        serialize_soap's result. The response is written as text without
+        building the envelope tree.
+
+        Returns None when the response can't be serialized this way, i.e.
+        for faults, responses with headers and messages that contain types
+        with their own serializers. ctx.out_body_xml is not set, so the
+        on_method_return_xml hook is not supported either.
+
+        Not meant to be overridden.
+        """
+
+        assert wrapper in (Application.IN_WRAPPER, Application.OUT_WRAPPER,
+                                                 Application.NO_WRAPPER),wrapper
+
+        if isinstance(out_object, Exception):
+            return None
+
+        if ctx.service.out_header != None:
+            return None
+
+        result_message_class, result_message = self.__get_result_message(
+                                                      ctx, wrapper, out_object)
+
+        return self.__string_serializer.serialize(result_message_class,
+                                              result_message, self.get_tns())
+
+    def __get_result_message(self, ctx, wrapper, out_object):
+        """Returns the message class and the message instance that wrap the
+        given object.
+        """
+
+        if wrapper is Application.NO_WRAPPER:
+            result_message_class = ctx.descriptor.in_message
+            result_message = out_object
+
+        else:
+            if wrapper is Application.IN_WRAPPER:
+                result_message_class = ctx.descriptor.in_message
+            elif wrapper is Application.OUT_WRAPPER:
+                result_message_class = ctx.descriptor.out_message
+
+            result_message = result_message_class()
+
+            # assign raw result to its wrapper, result_message
+            out_type_info = result_message_class._type_info
+
+            if len(out_type_info) > 0:
+                if len(out_type_info) == 1:
+                    attr_name = result_message_class._type_info.keys()[0]
+                    setattr(result_message, attr_name, out_object)
+
+                else:
+                    for i in range(len(out_type_info)):
+                        attr_name=result_message_class._type_info.keys()[i]
+                        setattr(result_message, attr_name, out_object[i])
+
+        return result_message_class, result_message
+
     def get_namespace_prefix(self, ns):
         """Returns the namespace prefix for the given namespace. Creates a new
         one automatically if it doesn't exist.
@@ -692,6 +1318,7 @@ class Application(object):
 
         if types is None:
             # populate call routes
+            method_routes = {}
             for s in self.services:
                 s.__tns__ = self.get_tns()
                 inst = self.get_service(s)
@@ -710,6 +1337,25 @@ class Application(object):
                         self.call_routes[method_name] = s
                         self.call_routes[method.name] = s
 
+                    # the dispatch table maps everything a request can be
+                    # routed by to the (service class, descriptor) pair, so
+                    # that incoming requests are dispatched by a single dict
+                    # lookup.
+                    route = (s, method)
+                    body_name = "{%s}%s" % (self.get_tns(),
+                                                method.in_message.get_type_name())
+                    method_routes[body_name] = route
+                    method_routes.setdefault(method_name, route)
+                    method_routes.setdefault(method.name, route)
+                    method_routes.setdefault(method.public_name, route)
+
+            self.method_routes = method_routes
+
+            # tells the transports to hand requests to
+            # deserialize_soap_stream instead of parsing them as a whole.
+            self.stream_requests = bool([True for s, method in
+                          method_routes.values() if method.stream_param])
+
         # populate types
         schema_entries = _SchemaEntries(self)
         for s in self.services:
@@ -728,14 +1374,38 @@ class Application(object):
         Override this function to alter the method mappings. Just try not to get
         too crazy with regular expressions :)
         """
-        return self.call_routes[method_name]
+        return self.method_routes[method_name][0]
+
+    def get_method_descriptor(self, ctx):
+        """Returns the MethodDescriptor for the method the given context is
+        routed to. This is a single lookup in the dispatch table built by
+        build_schema. Contexts routed elsewhere by an overridden
+        get_service_class fall back to the service's own get_method.
+
+        Not meant to be overridden.
+        """
+        route = self.method_routes.get(ctx.method_name, None)
+        if route is not None and route[0] is ctx.service_class:
+            return route[1]
+
+        return ctx.service.get_method(ctx.method_name)
 
     def get_service(self, service, http_req_env=None):
         """The function that maps service classes to service instances.
         Overriding this function is useful in case e.g. you need to pass
         additional parameters to service constructors.
         """
-        return service(http_req_env)
+        if not self._pool_services:
+            return service(http_req_env)
+
+        pool = self.__service_pool.__dict__
+        inst = pool.get(service, None)
+        if inst is None:
+            inst = pool[service] = service(http_req_env)
+        else:
+            inst.reset(http_req_env)
+
+        return inst
 
     def get_schema(self):
         """Simple accessor method that caches application's xml schema, once
@@ -758,14 +1428,40 @@ class Application(object):
         Not meant to be overridden.
         """
 
-        if self.wsdl is None:
+        return self.get_wsdl_document(url).string
 
-            factory = self._WSDL_factory()
-            self.wsdl = factory(self, self.get_tns(), url, self._with_plink)
-            self.wsdl.build_wsdl()
+    def get_wsdl_document(self, url):
+        """Returns the WSDLDocument for the given service url. The wsdl is
+        generated once per url, and the last wsdl_cache_size of them are kept,
+        so that every host name the service is reached by gets a wsdl with
+        the right addresses in it.
 
-        return self.wsdl.to_string(xml_declaration=True, encoding="UTF-8")
+        Not meant to be overridden.
+        """
 
+        cache = self.__wsdl_cache
+
+        # generating the wsdl changes the state of the application, so it's
+        # done with the lock held.
+        with self.__wsdl_lock:
+            document = cache.get(url, None)
+            if document is not None:
+                # moves the url to the end of the lru list
+                del cache[url]
+
+            else:
+                factory = self._WSDL_factory()
+                self.wsdl = factory(self, self.get_tns(), url, self._with_plink)
+                self.wsdl.build_wsdl()
+
+                document = WSDLDocument(self.wsdl.to_string(
+                                      xml_declaration=True, encoding="UTF-8"))
+
+            cache[url] = document
+            while len(cache) > self.wsdl_cache_size:
+                cache.popitem(last=False)
+
+        return document
 
     def __get_schema_node(self, pref, schema_nodes, types):
         """Return schema node for the given namespace prefix.
@@ -836,6 +1532,11 @@ class Application(object):
 
         return retval
 
+    def should_validate(self, ctx, payload):
+        """Tells whether the given payload is passed to validate."""
+
+        return True
+
     def validate(self, payload):
         """Method to be overriden to perform any sort of custom input
         validation.
@@ -857,41 +1558,130 @@ class Application(object):
         @param the xml element containing the xml serialization of the fault
         '''
 
+class _SchemaResolver(etree.Resolver):
+    """Resolves the schemaLocation of xsd imports to the schema documents
+    generated for the application, so that they don't have to be written to
+    the filesystem.
+    """
+
+    url_prefix = 'soaplib:/'
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def resolve(self, url, id, context):
+        document = self.documents.get(url, None)
+        if document is None:
+            return None
+
+        return self.resolve_string(document, context, base_url=url)
+
 class ValidatingApplication(Application):
+    def __init__(self, services, tns, name=None, _with_partnerlink=False,
+                                   _pool_services=False, _parser_options=None,
+                                   _validator='schema',
+                                   _validation_policy=None,
+                                   _string_policy=None):
+        '''
+        See Application.__init__ for the other parameters.
+
+        @param How incoming messages are validated. 'schema' validates them
+               with the XMLSchema compiled from the application's schema.
+               'native' checks them while they're deserialized, with
+               functions compiled from the constraints of the models (see
+               Base.get_validator). It doesn't check the order of elements,
+               and xml schema patterns are matched as python regular
+               expressions.
+        @param The soaplib.core.validation.ValidationPolicy that decides
+               which messages are validated. Methods can override it with
+               the _validation argument of @soap. Every message is validated
+               by default.
+        '''
+
+        if not (_validator in ('schema', 'native')):
+            raise ValueError("Unknown validator %r" % _validator)
+
+        self._validator = _validator
+
+        if _validation_policy is None:
+            _validation_policy = Always()
+        self.validation_policy = _validation_policy
+
+        # the number of messages that were validated, skipped by the policy,
+        # and found invalid.
+        self.validation_stats = {'validated': 0, 'skipped': 0, 'failed': 0}
+        self.__stats_lock = threading.Lock()
+
+        Application.__init__(self, services, tns, name, _with_partnerlink,
+                         _pool_services, _parser_options, _string_policy)
+
     def build_schema(self, types=None):
         """Build application schema specifically for xml validation purposes.
         """
         schema_nodes = Application.build_schema(self, types)
 
+        if self._validator == 'native':
+            return schema_nodes
+
         if types is None:
             pref_tns = self.get_namespace_prefix(self.get_tns())
             logger.debug("generating schema for targetNamespace=%r, prefix: %r"
                                                    % (self.get_tns(), pref_tns))
 
-            tmp_dir_name = tempfile.mkdtemp()
-
-            # serialize nodes to files
+            # serialize nodes to the documents the resolver hands to lxml
+            documents = {}
             for k,v in schema_nodes.items():
-                file_name = '%s/%s.xsd' % (tmp_dir_name, k)
-                f = open(file_name, 'w')
-                etree.ElementTree(v).write(f, pretty_print=True)
-                f.close()
-                logger.debug("writing %r for ns %s" % (file_name,
-                                                            self.nsmap[k]))
+                url = '%s%s.xsd' % (_SchemaResolver.url_prefix, k)
+                documents[url] = etree.tostring(v)
+                logger.debug("serialized %r for ns %s" % (url, self.nsmap[k]))
 
-            f = open('%s/%s.xsd' % (tmp_dir_name, pref_tns), 'r')
+            parser = etree.XMLParser()
+            parser.resolvers.add(_SchemaResolver(documents))
+
+            url = '%s%s.xsd' % (_SchemaResolver.url_prefix, pref_tns)
+            root = etree.fromstring(documents[url], parser, base_url=url)
 
             logger.debug("building schema...")
-            self.schema = etree.XMLSchema(etree.parse(f))
+            self.schema = etree.XMLSchema(root)
 
-            logger.debug("schema %r built, cleaning up..." % self.schema)
-            f.close()
-            shutil.rmtree(tmp_dir_name)
-            logger.debug("removed %r" % tmp_dir_name)
+            logger.debug("schema %r built" % self.schema)
 
         return self.schema
 
+    def __count(self, key):
+        with self.__stats_lock:
+            self.validation_stats[key] += 1
+
+    def should_validate(self, ctx, payload):
+        policy = self.validation_policy
+
+        route = self.method_routes.get(ctx.method_name or payload.tag, None)
+        if route is not None and route[1].validation is not None:
+            policy = route[1].validation
+
+        retval = policy.should_validate(ctx)
+        if retval:
+            self.__count('validated')
+        else:
+            self.__count('skipped')
+
+        return retval
+
+    def from_xml(self, ctx, cls, element):
+        if self._validator == 'native' and ctx.validate_input:
+            try:
+                return cls.get_validator()(element)
+
+            except ValidationError:
+                self.__count('failed')
+                raise
+
+        return Application.from_xml(self, ctx, cls, element)
+
     def validate(self, payload):
+        if self._validator == 'native':
+            return
+
         schema = self.schema
         ret = schema.validate(payload)
 
@@ -900,5 +1690,6 @@ class ValidatingApplication(Application):
             err = schema.error_log.last_error
 
             fault_code = 'Client.SchemaValidation'
+            self.__count('failed')
 
             raise ValidationError(fault_code, faultstring=str(err))
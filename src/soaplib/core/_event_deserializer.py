@@ -0,0 +1,416 @@
+
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Deserializes soap requests directly from the events of a target parser,
+without building an element tree first. See
+Application.deserialize_soap_string.
+"""
+
+import threading
+
+from lxml import etree
+
+from soaplib.core import namespaces
+from soaplib.core.model.base import SimpleType
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModelBase
+from soaplib.core.model.primitive import String
+
+_envelope_tag = '{%s}Envelope' % namespaces.ns_soap_env
+_header_tag = '{%s}Header' % namespaces.ns_soap_env
+_body_tag = '{%s}Body' % namespaces.ns_soap_env
+_fault_tag = '{%s}Fault' % namespaces.ns_soap_env
+_ns_xsi_nil = '{%s}nil' % namespaces.ns_xsi
+
+class Unsupported(Exception):
+    """Raised when a request can't be deserialized without a tree."""
+
+# the kinds of frames. the values of _CLASS, _ARRAY, _SIMPLE and _STRING
+# frames are decoded from the events, the ones of _TREE frames are built as
+# elements and handed to the from_xml of their class.
+_ENVELOPE = 0
+_HEADER = 1
+_BODY = 2
+_SKIP = 3
+_NIL = 4
+_CLASS = 5
+_ARRAY = 6
+_SIMPLE = 7
+_STRING = 8
+_TREE = 9
+
+_NONE = (None, None)
+
+class _Target(object):
+    """The parser target. Every open element has a frame on the stack, which
+    is a [kind, class, value, name, is_multiple, extra, has_children] list.
+    'name' and 'is_multiple' tell how the value is stored in the parent
+    ClassModel. 'extra' is the deserializer tables of ClassModels, the item
+    class of Arrays and the text of simple types.
+    """
+
+    def __init__(self, deserializer):
+        self.deserializer = deserializer
+        self.reset()
+
+    def reset(self):
+        self.stack = []
+        self.builder = None
+        self.builder_depth = 0
+        self.header = None
+        self.route = None
+        self.method_name = None
+        self.in_body = None
+
+    def start(self, tag, attrib, nsmap=None):
+        # attrib is a dict only when the element has attributes.
+        if attrib and 'href' in attrib:
+            # multi-ref messages are resolved on the tree.
+            raise Unsupported(tag)
+
+        builder = self.builder
+        if builder is not None:
+            builder.start(tag, attrib, _builder_nsmap(nsmap))
+            self.builder_depth += 1
+            return
+
+        stack = self.stack
+        if not stack:
+            if tag != _envelope_tag:
+                raise Unsupported(tag)
+
+            stack.append([_ENVELOPE, None, None, None, False, None, False])
+            return
+
+        parent = stack[-1]
+        parent[6] = True
+        kind = parent[0]
+
+        if kind is _CLASS:
+            tags, names, attributes = parent[5]
+            entry = tags.get(tag, None)
+            if entry is None:
+                entry = names.get(tag.split('}')[-1], None)
+
+            if entry is not None:
+                key, member, is_multiple = entry
+
+                # the common case of simple members without attributes.
+                kind = self.deserializer.kinds.get(member, _NONE)[0]
+                if (kind is _SIMPLE or kind is _STRING) and not attrib:
+                    stack.append([kind, member, None, key, is_multiple, [],
+                                                                     False])
+                    return
+
+                self.open(member, tag, attrib, nsmap, key, is_multiple)
+                return
+
+        elif kind is _ARRAY:
+            member = parent[5]
+            kind = self.deserializer.kinds.get(member, _NONE)[0]
+            if (kind is _SIMPLE or kind is _STRING) and not attrib:
+                stack.append([kind, member, None, None, False, [], False])
+                return
+
+            self.open(member, tag, attrib, nsmap, None, False)
+            return
+
+        elif kind is _ENVELOPE:
+            if tag == _header_tag:
+                stack.append([_HEADER, None, None, None, False, None, False])
+                return
+
+            if tag == _body_tag:
+                stack.append([_BODY, None, None, None, False, None, False])
+                return
+
+        elif kind is _HEADER:
+            if self.header is None:
+                # the header is kept as an element, like the tree path does.
+                self.open_tree(None, tag, attrib, nsmap, None, False)
+                return
+
+        elif kind is _BODY:
+            if self.route is None:
+                self.open_message(tag, attrib, nsmap)
+                return
+
+        stack.append([_SKIP, None, None, None, False, None, False])
+
+    def open_message(self, tag, attrib, nsmap):
+        if tag == _fault_tag:
+            raise Unsupported(tag)
+
+        route = self.deserializer.app.method_routes.get(tag, None)
+        if route is None:
+            raise Unsupported(tag)
+
+        service_class, descriptor = route
+
+        # lazy messages and records are deserialized from elements.
+        if descriptor.lazy or descriptor.records:
+            raise Unsupported(tag)
+
+        if self.deserializer.get_kind(descriptor.in_message)[0] is not _CLASS:
+            raise Unsupported(tag)
+
+        # on_method_call gets the body element.
+        if getattr(service_class.on_method_call, 'im_func', None) is not \
+                                               self.deserializer.on_method_call:
+            raise Unsupported(tag)
+
+        self.route = route
+        self.method_name = tag
+        self.open(descriptor.in_message, tag, attrib, nsmap, None, False)
+
+    def open(self, cls, tag, attrib, nsmap, key, is_multiple):
+        entry = self.deserializer.kinds.get(cls, None)
+        if entry is None:
+            entry = self.deserializer.get_kind(cls)
+        kind, item = entry
+
+        if kind is _TREE:
+            self.open_tree(cls, tag, attrib, nsmap, key, is_multiple)
+            return
+
+        if attrib and bool(attrib.get(_ns_xsi_nil)):
+            self.stack.append([_NIL, cls, None, key, is_multiple, None,
+                                                                     False])
+            return
+
+        if kind is _CLASS:
+            inst = cls.get_deserialization_instance()
+            tables = cls.get_deserializer_tables()
+            if attrib:
+                for k, member in tables[2]:
+                    value = attrib.get(k)
+                    if value is not None:
+                        setattr(inst, k, value)
+
+            self.stack.append([kind, cls, inst, key, is_multiple, tables,
+                                                                     False])
+
+        elif kind is _ARRAY:
+            self.stack.append([kind, cls, [], key, is_multiple, item, False])
+
+        else:
+            self.stack.append([kind, cls, None, key, is_multiple, [], False])
+
+    def open_tree(self, cls, tag, attrib, nsmap, key, is_multiple):
+        self.builder = builder = etree.TreeBuilder()
+        self.builder_depth = 1
+        builder.start(tag, attrib, _builder_nsmap(nsmap))
+
+        self.stack.append([_TREE, cls, None, key, is_multiple, None, False])
+
+    def data(self, data):
+        builder = self.builder
+        if builder is not None:
+            builder.data(data)
+            return
+
+        stack = self.stack
+        if stack:
+            frame = stack[-1]
+            # like element.text, only the text before the first child counts.
+            if (frame[0] is _SIMPLE or frame[0] is _STRING) and not frame[6]:
+                frame[5].append(data)
+
+    def end(self, tag):
+        builder = self.builder
+        if builder is not None:
+            builder.end(tag)
+            self.builder_depth -= 1
+            if self.builder_depth > 0:
+                return
+
+            self.builder = None
+            element = builder.close()
+
+            frame = self.stack.pop()
+            cls = frame[1]
+            if cls is None:
+                value = element
+            else:
+                value = cls.from_xml(element)
+
+        else:
+            frame = self.stack.pop()
+            kind = frame[0]
+
+            if kind is _CLASS or kind is _ARRAY:
+                value = frame[2]
+
+            elif kind is _SIMPLE:
+                text = frame[5]
+                if len(text) == 1:
+                    value = frame[1].from_string(text[0])
+                elif text:
+                    value = frame[1].from_string(u''.join(text))
+                else:
+                    value = frame[1].from_string(None)
+
+            elif kind is _STRING:
+                # text that comes in one piece is passed on as the parser
+                # gave it, so that String doesn't have to convert it.
+                text = frame[5]
+                if len(text) == 1:
+                    value = frame[1].from_string(text[0])
+                else:
+                    value = frame[1].from_string(u''.join(text))
+
+            elif kind is _NIL:
+                value = None
+
+            else:
+                return
+
+        parent = self.stack[-1]
+        kind = parent[0]
+
+        if kind is _CLASS:
+            key = frame[3]
+            if frame[4]:
+                values = getattr(parent[2], key, None)
+                if values is None:
+                    values = []
+                    setattr(parent[2], key, values)
+                values.append(value)
+
+            else:
+                setattr(parent[2], key, value)
+
+        elif kind is _ARRAY:
+            parent[2].append(value)
+
+        elif kind is _BODY:
+            if not frame[6]:
+                # the tree path's value for messages without parameters.
+                value = [None] * len(frame[1]._type_info)
+            self.in_body = value
+
+        elif kind is _HEADER:
+            self.header = value
+
+    def close(self):
+        if self.route is None:
+            # faults and malformed envelopes are reported by the tree path.
+            raise Unsupported()
+
+        return self.method_name, self.route, self.header, self.in_body
+
+def _builder_nsmap(nsmap):
+    # the target gets the default namespace with an empty prefix.
+    if nsmap and '' in nsmap:
+        nsmap = dict(nsmap)
+        nsmap[None] = nsmap.pop('')
+
+    return nsmap
+
+class _ParserPool(threading.local):
+    """Keeps one target parser per thread and encoding."""
+
+    def __init__(self, deserializer, options):
+        self.deserializer = deserializer
+        self.options = options
+        self.parsers = {}
+
+    def get_parser(self, encoding=None):
+        entry = self.parsers.get(encoding, None)
+        if entry is None:
+            target = _Target(self.deserializer)
+            parser = etree.XMLParser(target=target, encoding=encoding,
+                                                              **self.options)
+            entry = self.parsers[encoding] = (parser, target)
+
+        return entry
+
+class EventDeserializer(object):
+    """Deserializes the incoming messages of an application from parser
+    events. Messages whose members are ClassModels, Arrays and simple types
+    are decoded as they're parsed; other types get their elements built and
+    handed to their from_xml.
+
+    Faults, multi-ref messages, requests to services that override
+    on_method_call and requests to methods with lazy or record messages
+    can't be deserialized this way. Lazy ClassModels get their elements built.
+    """
+
+    def __init__(self, app, parser_options):
+        # the service module depends on the package this module is part of.
+        from soaplib.core.service import DefinitionBase
+
+        self.app = app
+        self.on_method_call = DefinitionBase.on_method_call.im_func
+        self.kinds = {}
+        self.parser_pool = _ParserPool(self, parser_options)
+
+    def get_kind(self, cls):
+        """Returns the kind of the frames of the given class, along with the
+        class of its items for Arrays, computed once per class.
+        """
+
+        retval = self.kinds.get(cls, None)
+        if retval is not None:
+            return retval
+
+        from_xml = getattr(cls.from_xml, 'im_func', None)
+        item = None
+
+        if from_xml is ClassModelBase.from_xml.im_func and not cls.__lazy__:
+            kind = _CLASS
+        elif from_xml is Array.from_xml.im_func and \
+                                            cls.get_buffer_typecode() is None:
+            kind = _ARRAY
+            (item,) = cls._type_info.values()
+        elif from_xml is SimpleType.from_xml.im_func:
+            kind = _SIMPLE
+        elif from_xml is String.from_xml.im_func:
+            kind = _STRING
+        else:
+            kind = _TREE
+
+        retval = self.kinds[cls] = (kind, item)
+
+        return retval
+
+    def deserialize(self, xml_string, charset=None):
+        """Parses the given request, and returns its method name, its
+        (service class, descriptor) route, its header element and its
+        deserialized body. Raises Unsupported when the request has to be
+        handled by the tree path.
+        """
+
+        if isinstance(xml_string, unicode):
+            xml_string = xml_string.encode('utf8')
+            charset = 'utf8'
+
+        parser, target = self.parser_pool.get_parser(charset)
+        target.reset()
+
+        try:
+            return etree.fromstring(xml_string, parser)
+
+        except etree.XMLSyntaxError:
+            # the tree path retries without the charset, and reports the
+            # error otherwise.
+            raise Unsupported()
+
+        finally:
+            target.reset()
@@ -0,0 +1,418 @@
+
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Serializes soap responses to strings directly, without building an element
+tree first. See Application.serialize_soap_string.
+"""
+
+import re
+import threading
+
+from lxml import etree
+
+from soaplib.core import namespaces
+from soaplib.core.model.clazz import ClassModelBase
+from soaplib.core.model.clazz import XMLAttribute
+from soaplib.core.model.clazz import _Columns
+from soaplib.core.model.clazz import fragment_cache
+from soaplib.core.model.primitive import string_encoding
+
+_marker = 'soaplib-body-marker'
+
+# the characters lxml escapes, along with the ones it refuses.
+_text_special = re.compile(u'[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f]')
+_attribute_special = re.compile(u'[&<>"\t\n\r\x00-\x08\x0b\x0c\x0e-\x1f]')
+_invalid = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_text_escapes = (
+    ('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('\r', '&#13;'),
+)
+_attribute_escapes = _text_escapes + (
+    ('"', '&quot;'), ('\t', '&#9;'), ('\n', '&#10;'),
+)
+
+def _escape(value, special, escapes):
+    if special.search(value) is None:
+        return value
+
+    if _invalid.search(value) is not None:
+        raise ValueError("All strings must be XML compatible: Unicode or "
+                                        "ASCII, no NULL bytes or control "
+                                        "characters")
+
+    for c, escaped in escapes:
+        value = value.replace(c, escaped)
+
+    return value
+
+def escape_text(value):
+    return _escape(value, _text_special, _text_escapes)
+
+def escape_attribute(value):
+    return _escape(value, _attribute_special, _attribute_escapes)
+
+class Unsupported(Exception):
+    """Raised when a class can't be serialized without lxml."""
+
+# the kinds of compiled members
+_ATTRIBUTE = 0
+_SIMPLE = 1
+_CLASS = 2
+
+class StringSerializer(object):
+    """Writes the response envelopes of an application as lists of string
+    fragments. The tags of the members of every class are computed once, with
+    the prefixes lxml would pick for them, so that the output is the same as
+    etree.tostring's.
+
+    Only classes whose members are ClassModels, simple types and xml
+    attributes can be serialized this way.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.writer = None
+
+    def serialize(self, cls, value, tns):
+        """Returns the response envelope with the given message in its body,
+        as a string in string_encoding, or None when the message class can't
+        be serialized this way.
+        """
+
+        # the writer is replaced as a whole when the namespace map of the
+        # application changes, so that concurrent requests never see a
+        # partially built one. threads that race here just build equivalent
+        # writers.
+        writer = self.writer
+        if writer is None or writer.nsmap != self.app.nsmap:
+            writer = self.writer = _Writer(dict(self.app.nsmap))
+
+        return writer.serialize(cls, value, tns)
+
+class _Writer(object):
+    """The envelope, the prefixes and the compiled classes of a
+    StringSerializer for one namespace map, along with the methods that
+    write with them.
+    """
+
+    def __init__(self, nsmap):
+        self.nsmap = nsmap
+
+        # guards the cache misses of get_prefix and get_class, which use the
+        # body element below.
+        self.lock = threading.RLock()
+
+        envelope = etree.Element('{%s}Envelope' % namespaces.ns_soap_env,
+                                                           nsmap=self.nsmap)
+        self.body = body = etree.SubElement(envelope,
+                                         '{%s}Body' % namespaces.ns_soap_env)
+        body.text = _marker
+        self.prefix, self.suffix = etree.tostring(envelope,
+               xml_declaration=True, encoding=string_encoding) \
+                                     .decode(string_encoding).split(_marker)
+        body.text = None
+
+        self.prefixes = {}
+        self.classes = {}
+        self.unsupported = set()
+
+        self.nil = ' %s:nil="true"/>' % self.get_prefix(namespaces.ns_xsi)
+
+    def get_prefix(self, ns):
+        """Returns the prefix lxml uses for the given namespace inside the
+        body.
+        """
+
+        prefix = self.prefixes.get(ns, None)
+        if prefix is not None:
+            return prefix
+
+        with self.lock:
+            prefix = self.prefixes.get(ns, None)
+            if prefix is not None:
+                return prefix
+
+            child = etree.SubElement(self.body, '{%s}x' % ns)
+            prefix = child.prefix
+            self.body.remove(child)
+
+            # otherwise lxml would declare the namespace on the element
+            # itself.
+            if prefix not in self.nsmap or self.nsmap[prefix] != ns:
+                raise Unsupported(ns)
+
+            self.prefixes[ns] = prefix
+
+        return prefix
+
+    def get_class(self, cls):
+        """Returns the attributes and the elements of the given class,
+        computed once per class. Attributes are (name, type, open, close)
+        tuples, elements are (name, kind, type, open tag, open tag for text,
+        close tag, is_multiple, write_none, to_string) tuples.
+        """
+
+        members = self.classes.get(cls, None)
+        if members is not None:
+            return members
+
+        with self.lock:
+            members = self.classes.get(cls, None)
+            if members is None:
+                members = self.classes[cls] = self.__compile_class(cls)
+
+        return members
+
+    def __compile_class(self, cls):
+        class_to_parent_element = ClassModelBase.to_parent_element.im_func
+        attribute_marshall = XMLAttribute.marshall.im_func
+
+        attributes = []
+        elements = []
+        for k, v, ns, tag, is_attribute, is_multiple, write_none, to_string \
+                                              in cls.get_serializer_plan():
+            if is_attribute:
+                if getattr(v.marshall, 'im_func', None) is not \
+                                                        attribute_marshall:
+                    raise Unsupported(cls, k)
+
+                attributes.append((k, v, ' %s="' % k, '"'))
+                continue
+
+            if to_string is not None:
+                kind = _SIMPLE
+            elif getattr(v.to_parent_element, 'im_func', None) is \
+                                                    class_to_parent_element:
+                kind = _CLASS
+            else:
+                raise Unsupported(cls, k)
+
+            name = '%s:%s' % (self.get_prefix(ns), k)
+            elements.append((k, kind, v, '<' + name, '<%s>' % name,
+                    '</%s>' % name, is_multiple, write_none, to_string))
+
+        return attributes, elements
+
+    def write_element(self, out, cls, value, open_tag, close_tag):
+        """Appends the element of a ClassModel value to out."""
+
+        append = out.append
+
+        if value is None:
+            append(open_tag)
+            append(self.nil)
+            return
+
+        key = None
+        if getattr(value, '__immutable__', False):
+            # the prefix of the envelope holds the namespace declarations.
+            key = (self.prefix, open_tag) + \
+                                           fragment_cache.get_key(cls, value)
+            fragment = fragment_cache.get(key)
+            if fragment is not None:
+                append(fragment)
+                return
+            fragment_start = len(out)
+
+        inst = cls.get_serialization_instance(value)
+        members = self.classes.get(cls, None)
+        if members is None:
+            members = self.get_class(cls)
+        attributes, elements = members
+
+        append(open_tag)
+        for k, v, open_, close in attributes:
+            subvalue = getattr(inst, k, None)
+            if subvalue is not None:
+                append(open_)
+                append(escape_attribute(subvalue))
+                append(close)
+
+        # the start tag is closed once it's known whether the element is empty
+        append('>')
+        start = len(out)
+
+        nil = self.nil
+        special = _text_special
+        for k, kind, v, open_, open_text, close, is_multiple, write_none, \
+                                                    to_string in elements:
+            subvalue = getattr(inst, k, None)
+
+            # like get_members, nothing is written for multiple members that
+            # are None.
+            if subvalue is None:
+                if write_none and not is_multiple:
+                    append(open_)
+                    append(nil)
+                continue
+
+            if is_multiple:
+                if type(subvalue) is _Columns:
+                    self.write_columns(out, v, subvalue, open_, close)
+                    continue
+
+                values = subvalue
+            else:
+                values = (subvalue,)
+
+            for sv in values:
+                if sv is None:
+                    append(open_)
+                    append(nil)
+
+                elif kind is _SIMPLE:
+                    text = to_string(sv)
+                    if special.search(text) is not None:
+                        text = escape_text(text)
+                    append(open_text)
+                    append(text)
+                    append(close)
+
+                else:
+                    self.write_element(out, v, sv, open_, close)
+
+        if len(out) == start:
+            out[-1] = '/>'
+        else:
+            append(close_tag)
+
+        if key is not None:
+            fragment_cache.set(key, value, u''.join(out[fragment_start:]))
+
+    def write_columns(self, out, cls, columns, open_tag, close_tag):
+        """Appends the elements of the rows of a _Columns instance to out.
+        Simple members are written to text fragments a column at a time.
+        """
+
+        append = out.append
+
+        members = self.classes.get(cls, None)
+        if members is None:
+            members = self.get_class(cls)
+        attributes, elements = members
+
+        get = columns.columns.get
+        length = columns.length
+        nil = self.nil
+        special = _text_special
+
+        compiled_attributes = []
+        for k, v, open_, close in attributes:
+            column = get(k, None)
+            if column is not None:
+                compiled_attributes.append([
+                       '%s%s%s' % (open_, escape_attribute(c), close)
+                                           if c is not None else ''
+                                                         for c in column])
+
+        compiled = []
+        for k, kind, v, open_, open_text, close, is_multiple, write_none, \
+                                                    to_string in elements:
+            column = get(k, None)
+            if column is None:
+                if is_multiple or not write_none:
+                    continue
+                column = (None,) * length
+
+            if kind is _SIMPLE and not is_multiple:
+                fragments = []
+                for c in column:
+                    if c is None:
+                        fragments.append(open_ + nil if write_none else '')
+                        continue
+
+                    text = to_string(c)
+                    if special.search(text) is not None:
+                        text = escape_text(text)
+                    fragments.append(open_text + text + close)
+
+                compiled.append((None, None, None, None, None, None, None,
+                                                       None, fragments))
+
+            else:
+                compiled.append((kind, v, open_, open_text, close,
+                                 is_multiple, write_none, to_string, column))
+
+        for i in xrange(length):
+            append(open_tag)
+            for fragments in compiled_attributes:
+                append(fragments[i])
+            append('>')
+            start = len(out)
+
+            for kind, v, open_, open_text, close, is_multiple, write_none, \
+                                            to_string, column in compiled:
+                subvalue = column[i]
+
+                if kind is None:
+                    if subvalue:
+                        append(subvalue)
+                    continue
+
+                if subvalue is None:
+                    if write_none and not is_multiple:
+                        append(open_)
+                        append(nil)
+                    continue
+
+                if is_multiple:
+                    values = subvalue
+                else:
+                    values = (subvalue,)
+
+                for sv in values:
+                    if sv is None:
+                        append(open_)
+                        append(nil)
+
+                    elif kind is _SIMPLE:
+                        text = to_string(sv)
+                        if special.search(text) is not None:
+                            text = escape_text(text)
+                        append(open_text)
+                        append(text)
+                        append(close)
+
+                    else:
+                        self.write_element(out, v, sv, open_, close)
+
+            if len(out) == start:
+                out[-1] = '/>'
+            else:
+                append(close_tag)
+
+    def serialize(self, cls, value, tns):
+        """See StringSerializer.serialize."""
+
+        if cls in self.unsupported:
+            return None
+
+        out = [self.prefix]
+
+        try:
+            name = '%s:%s' % (self.get_prefix(tns), cls.get_type_name())
+            self.write_element(out, cls, value, '<' + name, '</%s>' % name)
+
+        except Unsupported:
+            self.unsupported.add(cls)
+            return None
+
+        out.append(self.suffix)
+
+        return u''.join(out).encode(string_encoding)
@@ -0,0 +1,329 @@
+
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Caches for the serialized responses of idempotent methods.
+
+A cache is passed to the @soap decorator of the methods whose responses only
+depend on their arguments and in headers, like pure lookups:
+
+    currencies = MemoryCache(max_size=1000, ttl=300)
+
+    class Service(DefinitionBase):
+        @soap(String, _returns=Currency, _cache=currencies)
+        def get_currency(self, code):
+            ...
+
+On a hit, the wsgi server sends the cached response without calling the
+method or serializing anything. This also skips process_request along with
+the hooks of the service, like on_method_call, so checks done there, e.g.
+authorization, don't run for cached responses. Responses are cached per
+client (see MethodContext.client_key) unless the cache is created with
+per_client=False. Faults are not cached. SqliteCache keeps the responses in a
+file that the worker processes of a server can share.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from array import array
+
+from lxml import etree
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from soaplib.core.model.clazz import ClassModelBase
+from soaplib.core.util.ordereddict import OrderedDict
+
+def _canonical(value):
+    """Returns a hashable form of a deserialized value, in which equal values
+    look the same.
+    """
+
+    if isinstance(value, ClassModelBase):
+        return (value.get_type_name(), tuple([(member[0],
+                         _canonical(getattr(value, member[0], None)))
+                                for member in value.get_serializer_plan()]))
+
+    if isinstance(value, (list, tuple)):
+        return tuple([_canonical(v) for v in value])
+
+    if isinstance(value, dict):
+        return tuple(sorted([(k, _canonical(v)) for k, v in value.items()]))
+
+    if etree.iselement(value):
+        return etree.tostring(value, method='c14n')
+
+    # buffers are keyed by their contents, as their repr() is either
+    # ambiguous or elided for large buffers.
+    if isinstance(value, array):
+        return ('array', value.typecode, value.tostring())
+
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        if value.dtype.hasobject:
+            return ('ndarray', value.shape, _canonical(value.tolist()))
+
+        return ('ndarray', _canonical(value.dtype.descr), value.shape,
+                                      numpy.ascontiguousarray(value).tobytes())
+
+    return value
+
+def get_request_key(ctx, in_object, per_client=False):
+    """Returns a key for the request of the given MethodContext, as a string.
+    It's made of the method name, the arguments and the in header of the
+    request, so requests with equal keys get equal responses from idempotent
+    methods. When per_client is True, ctx.client_key is part of the key too.
+    """
+
+    in_header = None
+    if ctx.descriptor.in_header is not None:
+        in_header = ctx.service.in_header
+
+    canonical = (ctx.method_name, _canonical(in_object), _canonical(in_header))
+    if per_client:
+        canonical += (ctx.client_key,)
+
+    return hashlib.sha1(repr(canonical)).hexdigest()
+
+class ResponseCache(object):
+    """The base class for response caches. Subclasses implement load and
+    store.
+
+    The stats dict counts hits, misses, entries evicted to make room for
+    others, and entries that expired. Hits bypass the hooks of the service,
+    see the module docstring.
+    """
+
+    # the function that returns the current time, in seconds.
+    clock = time.time
+
+    def __init__(self, ttl=None, per_client=True):
+        '''
+        @param The number of seconds responses are kept, or None to keep them
+               until they're evicted.
+        @param When True, responses are only sent again to the client they
+               were produced for. Pass False for responses that don't depend
+               on the client at all.
+        '''
+
+        self.ttl = ttl
+        self.per_client = per_client
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0,
+                                                        'expirations': 0}
+        self.__stats_lock = threading.Lock()
+
+    def count(self, stat, n=1):
+        with self.__stats_lock:
+            self.stats[stat] += n
+
+    def get_key(self, ctx, in_object):
+        """Returns the key of the response to the request of the given
+        MethodContext. See get_request_key. Override this to take more into
+        account, e.g. request headers.
+        """
+
+        return get_request_key(ctx, in_object, self.per_client)
+
+    def get(self, key):
+        """Returns the cached response for the given key, or None."""
+
+        value = self.load(key)
+
+        if value is None:
+            self.count('misses')
+        else:
+            self.count('hits')
+
+        return value
+
+    def set(self, key, value):
+        """Caches the given response string."""
+
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = self.clock() + self.ttl
+
+        self.store(key, value, expires)
+
+    def load(self, key):
+        """Returns the response stored for the given key when it hasn't
+        expired, or None.
+        """
+
+        raise NotImplementedError()
+
+    def store(self, key, value, expires):
+        """Stores the given response until the given time, or until it's
+        evicted when expires is None.
+        """
+
+        raise NotImplementedError()
+
+class MemoryCache(ResponseCache):
+    """Keeps the max_size most recently used responses in memory."""
+
+    def __init__(self, max_size=1024, ttl=None, per_client=True):
+        ResponseCache.__init__(self, ttl, per_client)
+
+        self.max_size = max_size
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def load(self, key):
+        entries = self.__entries
+
+        with self.__lock:
+            entry = entries.pop(key, None)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires is not None and expires <= self.clock():
+                self.count('expirations')
+                return None
+
+            # moves the key to the end of the lru list
+            entries[key] = entry
+
+        return value
+
+    def store(self, key, value, expires):
+        entries = self.__entries
+
+        with self.__lock:
+            entries.pop(key, None)
+            entries[key] = (value, expires)
+
+            evicted = 0
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+                evicted += 1
+
+        if evicted:
+            self.count('evictions', evicted)
+
+class SqliteCache(ResponseCache):
+    """Keeps the max_size most recently used responses in an sqlite database
+    file, which can be shared by several processes. Every thread uses its own
+    connection, and so does every process: the connections opened before a
+    fork, e.g. when the application is loaded by the master process of a
+    prefork server, are not reused by the children. The stats only count the
+    operations of this process.
+    """
+
+    def __init__(self, path, max_size=10000, ttl=None, timeout=5.0,
+                                                            per_client=True):
+        '''
+        @param The path of the database file. It's created when it doesn't
+               exist.
+        @param The number of responses that are kept.
+        @param See ResponseCache.__init__.
+        @param The number of seconds to wait for the database when another
+               process is writing to it.
+        @param See ResponseCache.__init__.
+        '''
+
+        ResponseCache.__init__(self, ttl, per_client)
+
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.__connections = threading.local()
+
+        # this usually runs when the services are defined, so the connection
+        # isn't kept.
+        connection = self.__connect()
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS responses '
+                       '(key TEXT PRIMARY KEY, value BLOB, expires REAL, '
+                                                            'used REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS '
+                                      'responses_used ON responses (used)')
+        finally:
+            connection.close()
+
+    def __connect(self):
+        # the entries are only a cache, so they're not synced to disk.
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                                        isolation_level=None)
+        connection.execute('PRAGMA synchronous = OFF')
+
+        return connection
+
+    def get_connection(self):
+        """Returns the connection of the current thread."""
+
+        local = self.__connections
+        connection = getattr(local, 'connection', None)
+
+        # sqlite connections can't be used across fork(). the one inherited
+        # from the parent process is left alone.
+        if connection is None or local.pid != os.getpid():
+            connection = local.connection = self.__connect()
+            local.pid = os.getpid()
+
+        return connection
+
+    def __len__(self):
+        return self.get_connection().execute(
+                                'SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def load(self, key):
+        connection = self.get_connection()
+        now = self.clock()
+
+        row = connection.execute('SELECT value, expires FROM responses '
+                                          'WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        value, expires = row
+        if expires is not None and expires <= now:
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.count('expirations')
+            return None
+
+        connection.execute('UPDATE responses SET used = ? WHERE key = ?',
+                                                                  (now, key))
+
+        return str(value)
+
+    def store(self, key, value, expires):
+        connection = self.get_connection()
+
+        connection.execute('INSERT OR REPLACE INTO responses VALUES '
+                        '(?, ?, ?, ?)', (key, buffer(value), expires,
+                                                              self.clock()))
+
+        (size,) = connection.execute('SELECT COUNT(*) FROM responses') \
+                                                                  .fetchone()
+        if size > self.max_size:
+            cursor = connection.execute('DELETE FROM responses WHERE key IN '
+                          '(SELECT key FROM responses ORDER BY used LIMIT ?)',
+                                                     (size - self.max_size,))
+            self.count('evictions', cursor.rowcount)
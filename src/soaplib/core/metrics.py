@@ -0,0 +1,201 @@
+
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Request metrics in the Prometheus text exposition format.
+
+soaplib.core.server.wsgi.Application counts the requests it handles in a
+Metrics instance when it's given a _metrics_path, and serves them at that
+path, e.g.:
+
+    wsgi.Application(app, _metrics_path='/metrics')
+
+The metrics are, per operation:
+
+    soaplib_requests_total            the number of soap requests
+    soaplib_faults_total              the number of faults, by faultcode
+    soaplib_request_duration_seconds  a histogram of the request latencies
+    soaplib_request_bytes_total       the size of the request bodies
+    soaplib_response_bytes_total      the size of the response bodies
+
+Every thread counts in its own dicts, without locking, and the counts are
+merged when the metrics are scraped.
+"""
+
+import threading
+
+from bisect import bisect_left
+
+# see http://prometheus.io/docs/instrumenting/exposition_formats/
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n') \
+                                                      .replace('"', '\\"')
+
+def _format_float(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value))
+
+class Metrics(object):
+    """Counts the requests of a transport. See the module docstring."""
+
+    latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                                                                  5.0, 10.0)
+
+    def __init__(self, latency_buckets=None):
+        if latency_buckets is not None:
+            self.latency_buckets = tuple(sorted(latency_buckets))
+
+        self.__local = threading.local()
+
+        # the counts of every thread, along with the thread, and the counts
+        # of the threads that are gone.
+        self.__threads = []
+        self.__retired = {}
+        self.__lock = threading.Lock()
+
+    def __get_counts(self):
+        counts = getattr(self.__local, 'counts', None)
+        if counts is None:
+            counts = self.__local.counts = {}
+            with self.__lock:
+                self.__threads.append((threading.current_thread(), counts))
+
+        return counts
+
+    def record(self, operation, duration, faultcode, request_bytes,
+                                                             response_bytes):
+        """Counts a request to the given operation. faultcode is None when
+        the request succeeded.
+        """
+
+        counts = self.__get_counts()
+
+        key = ('requests', operation)
+        counts[key] = counts.get(key, 0) + 1
+
+        if faultcode is not None:
+            key = ('faults', operation, faultcode)
+            counts[key] = counts.get(key, 0) + 1
+
+        key = ('latency', operation)
+        latency = counts.get(key, None)
+        if latency is None:
+            latency = counts[key] = [0.0] + [0] * (len(self.latency_buckets)
+                                                                         + 1)
+        latency[0] += duration
+        latency[1 + bisect_left(self.latency_buckets, duration)] += 1
+
+        key = ('request_bytes', operation)
+        counts[key] = counts.get(key, 0) + request_bytes
+
+        key = ('response_bytes', operation)
+        counts[key] = counts.get(key, 0) + response_bytes
+
+    def __merge(self, into, counts):
+        for key, value in counts.items():
+            if key[0] == 'latency':
+                merged = into.get(key, None)
+                if merged is None:
+                    into[key] = list(value)
+                else:
+                    for i, v in enumerate(value):
+                        merged[i] += v
+            else:
+                into[key] = into.get(key, 0) + value
+
+    def get_counts(self):
+        """Returns the counts of all threads, merged."""
+
+        with self.__lock:
+            # the counts of threads that are gone don't change anymore, so
+            # they're merged once and for all.
+            alive = []
+            for thread, counts in self.__threads:
+                if thread.is_alive():
+                    alive.append((thread, counts))
+                else:
+                    self.__merge(self.__retired, counts)
+            self.__threads = alive
+
+            retval = {}
+            self.__merge(retval, self.__retired)
+            for thread, counts in alive:
+                self.__merge(retval, counts)
+
+        return retval
+
+    def get_text(self):
+        """Returns the metrics in the Prometheus text format."""
+
+        counts = self.get_counts()
+        lines = []
+
+        def add_counter(name, help, kind, labels):
+            samples = sorted([(key[1:], value)
+                         for key, value in counts.items() if key[0] == kind])
+            if not samples:
+                return
+
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s counter' % name)
+            for values, value in samples:
+                lines.append('%s{%s} %s' % (name, ','.join(['%s="%s"' %
+                            (l, _escape(v)) for l, v in zip(labels, values)]),
+                                                                     value))
+
+        add_counter('soaplib_requests_total', 'The number of soap requests.',
+                                                   'requests', ('operation',))
+        add_counter('soaplib_faults_total', 'The number of soap faults.',
+                                        'faults', ('operation', 'faultcode'))
+
+        samples = sorted([(key[1], value)
+                      for key, value in counts.items() if key[0] == 'latency'])
+        if samples:
+            name = 'soaplib_request_duration_seconds'
+            lines.append('# HELP %s The latency of soap requests.' % name)
+            lines.append('# TYPE %s histogram' % name)
+
+            bounds = self.latency_buckets + (float('inf'),)
+            for operation, latency in samples:
+                operation = _escape(operation)
+
+                count = 0
+                for bound, n in zip(bounds, latency[1:]):
+                    count += n
+                    lines.append('%s_bucket{operation="%s",le="%s"} %d' %
+                             (name, operation, _format_float(bound), count))
+
+                lines.append('%s_sum{operation="%s"} %s' % (name, operation,
+                                                   _format_float(latency[0])))
+                lines.append('%s_count{operation="%s"} %d' % (name, operation,
+                                                                       count))
+
+        add_counter('soaplib_request_bytes_total',
+                         'The size of the soap request bodies, in bytes.',
+                                              'request_bytes', ('operation',))
+        add_counter('soaplib_response_bytes_total',
+                         'The size of the soap response bodies, in bytes.',
+                                             'response_bytes', ('operation',))
+
+        lines.append('')
+
+        return '\n'.join(lines)
@@ -30,6 +30,20 @@ from lxml import etree
 __all__ = ('nillable_value','nillable_element','nillable_string','Base','Null',
            'SimpleType')
 
+_ns_xsi_nil = '{%s}nil' % namespaces.ns_xsi
+
+# see Base.get_validator
+_validators = {}
+
+def invalid_element(element, message):
+    '''Raises the ValidationError native validators report errors with.'''
+
+    # the exception module depends on this one.
+    from soaplib.core.model.exception import ValidationError
+
+    raise ValidationError('Client.SchemaValidation',
+                      faultstring="Element '%s': %s" % (element.tag, message))
+
 def nillable_value(func):
     def wrapper(cls, value, tns, parent_elt, *args, **kwargs):
         if value is None:
@@ -58,6 +72,7 @@ class Base(object):
     """
     Base class for all soaplib models.
     """
+    __slots__ = ()
     __namespace__ = None
     __type_name__ = None
     
@@ -121,6 +136,28 @@ class Base(object):
     def from_xml(cls, element):
         return cls.from_string(element.text)
 
+    @classmethod
+    def get_validator(cls):
+        """Returns a function that deserializes an element like from_xml,
+        while checking it against the constraints of this type. It raises
+        ValidationError when the element is not valid. The function is
+        compiled once per class.
+        """
+
+        validator = _validators.get(cls, None)
+        if validator is None:
+            validator = _validators[cls] = cls.compile_validator()
+
+        return validator
+
+    @classmethod
+    def compile_validator(cls):
+        """Builds the function get_validator returns. Types that have
+        constraints to check override this.
+        """
+
+        return cls.from_xml
+
     @classmethod
     @nillable_value
     def to_parent_element(cls, value, tns, parent_elt, name='retval'):
@@ -157,8 +194,15 @@ class Base(object):
 
         cls_dict = {}
 
+        # the slots of compact classes are generated again by their metaclass.
+        slots = cls.__dict__.get('__slots__', ())
+        if slots:
+            skipped = ("__dict__", "__weakref__", "__slots__") + tuple(slots)
+        else:
+            skipped = ("__dict__", "__weakref__")
+
         for k in cls.__dict__:
-            if not (k in ("__dict__", "__weakref__")):
+            if not (k in skipped):
                 cls_dict[k] = cls.__dict__[k]
 
         class Attributes(cls.Attributes):
@@ -225,6 +269,61 @@ class SimpleType(Base):
     def is_default(cls):
         return (cls.Attributes.values == SimpleType.Attributes.values)
 
+    @classmethod
+    def to_string(cls, value):
+        """Returns the text representation of the given non-null value."""
+
+        return value
+
+    @classmethod
+    def get_text_checks(cls):
+        """Returns the constraints on the text of the elements of this type
+        as a list of (check, message) pairs. 'check' is called with the text
+        and returns False when the text is not valid.
+        """
+
+        return []
+
+    @classmethod
+    def compile_validator(cls):
+        from_xml = cls.from_xml
+        nillable = cls.Attributes.nillable
+        values = cls.Attributes.values
+        text_checks = cls.get_text_checks()
+        type_name = cls.get_type_name()
+        if not isinstance(type_name, basestring):
+            type_name = cls.__base_type__.get_type_name()
+
+        def validate(element):
+            if bool(element.get(_ns_xsi_nil)):
+                if not nillable:
+                    invalid_element(element, 'The element is not nillable.')
+                return None
+
+            text = element.text or ''
+            for check, message in text_checks:
+                if not check(text):
+                    invalid_element(element, message)
+
+            try:
+                value = from_xml(element)
+            except Exception:
+                invalid_element(element, "%r is not a valid value of the type "
+                                           "'%s'." % (element.text, type_name))
+
+            if values and not (value in values):
+                invalid_element(element, "%r is not an element of the set %r."
+                                                   % (value, sorted(values)))
+
+            return value
+
+        return validate
+
+    @classmethod
+    @nillable_value
+    def to_parent_element(cls, value, tns, parent_elt, name='retval'):
+        Base.to_parent_element(cls.to_string(value), tns, parent_elt, name)
+
     @classmethod
     def get_restriction_tag(cls, schema_entries):
         simple_type = etree.Element('{%s}simpleType' % namespaces.ns_xsd)
@@ -17,15 +17,54 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
 #
 
+import threading
+
+from array import array
+from collections import namedtuple
+from copy import deepcopy
+
 from lxml import etree
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from soaplib.core import namespaces
 
 from soaplib.core.model import Base
+from soaplib.core.model import SimpleType
 from soaplib.core.model import nillable_element
 from soaplib.core.model import nillable_value
+from soaplib.core.model.primitive import Double
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import get_string_policy
+from soaplib.core.model.primitive import set_string_policy
+from soaplib.core.model.base import _validators
+from soaplib.core.model.base import invalid_element
 
 from soaplib.core.util.odict import odict as TypeInfo
+from soaplib.core.util.ordereddict import OrderedDict
+
+_ns_xsi_nil = '{%s}nil' % namespaces.ns_xsi
+
+# see ClassModelBase.get_serializer_plan
+_serializer_plans = {}
+
+# see ClassModelBase.get_deserializer_tables
+_deserializer_tables = {}
+
+# see ClassModelBase.get_lazy_class
+_lazy_classes = {}
+
+# see ClassModelBase.get_record_class
+_record_classes = {}
+_record_types = set()
+
+# see Array.from_xml
+_xpath_texts = etree.XPath('*/text()', smart_strings=False)
+_xpath_has_nil = etree.XPath('boolean(*/@xsi:nil[. != ""])',
+                                        namespaces={'xsi': namespaces.ns_xsi})
 
 class XMLAttribute(Base):
     """ items which are marshalled as attributes of the parent element.
@@ -58,6 +97,179 @@ class XMLAttributeRef(XMLAttribute):
             element.set('use', self._use)
 
 
+class _LazyMember(object):
+    """The member of a lazy class. The member is deserialized the first time
+    it's read, and stored in the instance, where it shadows this descriptor.
+    It's deserialized with the string policy that was in effect when the
+    instance was created. See ClassModelBase.get_lazy_instance.
+    """
+
+    def __init__(self, key, member, is_multiple, default):
+        self.key = key
+        self.member = member
+        self.is_multiple = is_multiple
+        self.default = default
+
+    def __get__(self, inst, owner):
+        if inst is None:
+            return self.default
+
+        elements, deep, string_policy = inst.__dict__['_lazy_elements']
+        element = elements.pop(self.key, None)
+
+        member = self.member
+        if deep:
+            from_xml = lambda element: _from_xml_lazy(member, element)
+        else:
+            from_xml = member.from_xml
+
+        previous = get_string_policy()
+        set_string_policy(string_policy)
+        try:
+            if element is None:
+                value = None
+            elif self.is_multiple:
+                value = [from_xml(e) for e in element]
+            else:
+                value = from_xml(element)
+
+        finally:
+            set_string_policy(previous)
+
+        inst.__dict__[self.key] = value
+
+        return value
+
+def _from_xml_lazy(cls, element):
+    """Deserializes the given element like cls.from_xml, with the ClassModels
+    in it deserialized lazily.
+    """
+
+    from_xml = getattr(cls.from_xml, 'im_func', None)
+
+    if from_xml is ClassModelBase.from_xml.im_func and \
+                         cls.get_deserialization_instance.im_func is \
+                         ClassModelBase.get_deserialization_instance.im_func:
+        return cls.get_lazy_instance(element, True)
+
+    if from_xml is Array.from_xml.im_func and cls.Attributes.buffer is None:
+        if bool(element.get(_ns_xsi_nil)):
+            return None
+
+        (serializer,) = cls._type_info.values()
+        return [_from_xml_lazy(serializer, c) for c in element.getchildren()]
+
+    return cls.from_xml(element)
+
+def _from_xml_record(cls, element):
+    """Deserializes the given element like cls.from_xml, with the ClassModels
+    in it deserialized as records.
+    """
+
+    from_xml = getattr(cls.from_xml, 'im_func', None)
+
+    if from_xml is ClassModelBase.from_xml.im_func:
+        return cls.get_record(element)
+
+    if from_xml is Array.from_xml.im_func and cls.Attributes.buffer is None:
+        if bool(element.get(_ns_xsi_nil)):
+            return None
+
+        (serializer,) = cls._type_info.values()
+        return [_from_xml_record(serializer, c) for c in element.getchildren()]
+
+    return cls.from_xml(element)
+
+class _Columns(object):
+    """The rows of an Array of ClassModels, given column by column. See
+    Array.get_columns.
+    """
+
+    __slots__ = ('columns', 'length')
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        # the serializers write the columns directly, this is for the code
+        # paths that need the rows one by one.
+        columns = self.columns.items()
+        for i in xrange(self.length):
+            yield dict([(k, column[i]) for k, column in columns])
+
+class FragmentCache(object):
+    """A bounded map of the serialized elements of immutable ClassModel
+    instances, which are spliced into later responses instead of being
+    serialized again. The least recently used fragments are evicted once
+    there are more than max_size of them.
+
+    Classes are marked immutable by setting __immutable__ to True, and single
+    instances by setting it on them. The fragments of immutable instances are
+    looked up by identity, so the instances must not change once they have
+    been serialized. Alternatively, __immutable__ can be the name of a
+    version member: the fragments are then looked up by identity and
+    version, so instances can change as long as their version does too.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        self.__fragments = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__fragments)
+
+    def get_key(self, cls, value):
+        """Returns the key of the fragments of the given immutable value,
+        serialized as an instance of cls.
+        """
+
+        immutable = value.__immutable__
+        if immutable is True:
+            return cls, id(value)
+
+        return cls, id(value), getattr(value, immutable)
+
+    def get(self, key):
+        """Returns the fragment with the given key, or None."""
+
+        with self.__lock:
+            entry = self.__fragments.pop(key, None)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            # move the entry to the most recently used end.
+            self.__fragments[key] = entry
+            self.stats['hits'] += 1
+
+        return entry[1]
+
+    def set(self, key, value, fragment):
+        """Stores the fragment of the given value."""
+
+        with self.__lock:
+            # the value is kept along with its fragment so that its id can't
+            # be reused while it's in the cache.
+            self.__fragments[key] = (value, fragment)
+
+            while len(self.__fragments) > self.max_size:
+                self.__fragments.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__fragments.clear()
+
+# see FragmentCache. this is shared by all applications.
+fragment_cache = FragmentCache()
+
 class ClassModelMeta(type(Base)):
     """This is the metaclass that populates ClassModel instances with
     the appropriate datatypes for (de)serialization.
@@ -114,6 +326,26 @@ class ClassModelMeta(type(Base)):
             if not isinstance(_type_info, TypeInfo):
                 cls_dict['_type_info'] = TypeInfo(_type_info)
 
+        # compact classes keep their members in slots instead of a __dict__.
+        # subclasses of compact classes are compact too, unless they say
+        # otherwise.
+        compact = cls_dict.get('__compact__', None)
+        if compact is None:
+            compact = bool([b for b in cls_bases
+                                        if getattr(b, '__compact__', False)])
+
+        if compact:
+            inherited = set()
+            for b in cls_bases:
+                for c in b.__mro__:
+                    inherited.update(c.__dict__.get('__slots__', ()))
+
+            slots = [k for k in cls_dict['_type_info'] if k not in inherited]
+            for k in slots:
+                cls_dict.pop(k, None)
+
+            cls_dict['__slots__'] = tuple(slots)
+
         n = type.__new__(cls, cls_name, cls_bases, cls_dict)
 
         n.creation_counter = Base.creation_counter
@@ -127,6 +359,18 @@ class ClassModelBase(Base):
     inherit from
     """
 
+    __slots__ = ()
+
+    # when True, instances are deserialized lazily. see get_lazy_instance.
+    __lazy__ = False
+
+    # when True, instances keep their members in slots. see ClassModelMeta.
+    __compact__ = False
+
+    # when set, the serialized elements of instances are cached. see
+    # FragmentCache.
+    __immutable__ = False
+
     def __init__(self, **kwargs):
         super(ClassModelBase,self).__init__()
 
@@ -153,7 +397,11 @@ class ClassModelBase(Base):
         # the only time when the member order is not arbitrary (as the members
         # are declared and passed around as sequences of arguments, unlike
         # dictionaries in a regular class definition).
-        if isinstance(value, list) or isinstance(value, tuple):
+        if type(value) in _record_types:
+            # records have the members as attributes.
+            inst = value
+
+        elif isinstance(value, list) or isinstance(value, tuple):
             assert len(value) <= len(cls._type_info)
 
             inst = cls()
@@ -178,36 +426,163 @@ class ClassModelBase(Base):
         return cls()
 
     @classmethod
-    def get_members(cls, inst, parent):
+    def get_serializer_plan(cls):
+        """Returns the members of this class and its ancestors, in the order
+        they are serialized, as a list of (name, type, namespace, tag,
+        is_attribute, is_multiple, write_none, to_string) tuples.
+
+        'write_none' tells whether None values are serialized, and
+        'to_string' is set for simple types whose elements can be written
+        directly. The list is computed once per class.
+        """
+
+        plan = _serializer_plans.get(cls, None)
+        if plan is not None:
+            return plan
+
+        plan = []
+
         parent_cls = getattr(cls, '__extends__', None)
         if parent_cls :
-            parent_cls.get_members(inst, parent)
+            plan.extend(parent_cls.get_serializer_plan())
+
+        tns = cls.get_namespace()
+        simple_to_parent_element = SimpleType.to_parent_element.im_func
 
         for k,v in sorted(cls._type_info.items(), key=lambda (k,v): (v.creation_counter, k)):
+            if isinstance(v, XMLAttribute):
+                plan.append((k, v, tns, None, True, False, False, None))
+                continue
+
+            mo = v.Attributes.max_occurs
+            is_multiple = (mo == 'unbounded' or mo > 1)
+
+            # if a null value is passed to an element with min_occurs = 0
+            # then we need to **NOT** render an empty tag. per
+            # http://www.w3.org/TR/xmlschema-0/
+            # Don't include empty values for non-nillable optional attributes
+            # either.
+            min_occurs = v.Attributes.min_occurs
+            write_none = (min_occurs != 0 and
+                                bool(v.Attributes.nillable or min_occurs > 0))
+
+            to_string = None
+            if getattr(v.to_parent_element, 'im_func', None) is \
+                                                     simple_to_parent_element:
+                to_string = v.to_string
+
+            #TODO: move this ns tag to the parent element...........
+            plan.append((k, v, tns, "{%s}%s" % (tns, k), False, is_multiple,
+                                                         write_none, to_string))
+
+        _serializer_plans[cls] = plan
+
+        return plan
+
+    @classmethod
+    def get_members(cls, inst, parent):
+        plan = _serializer_plans.get(cls, None)
+        if plan is None:
+            plan = cls.get_serializer_plan()
 
+        for k, v, ns, tag, is_attribute, is_multiple, write_none, to_string \
+                                                                    in plan:
             subvalue = getattr(inst, k, None)
 
-            if isinstance(v, XMLAttribute):
+            if is_attribute:
                 v.marshall(k, subvalue, parent)
-                continue
 
-            mo = v.Attributes.max_occurs
+            elif is_multiple:
+                if subvalue is not None:
+                    if type(subvalue) is _Columns:
+                        v.write_columns(subvalue, parent, tag)
+
+                    elif to_string is None:
+                        for sv in subvalue:
+                            v.to_parent_element(sv, ns, parent, k)
+
+                    else:
+                        for sv in subvalue:
+                            if sv is None:
+                                etree.SubElement(parent, tag).set(_ns_xsi_nil,
+                                                                        'true')
+                            else:
+                                etree.SubElement(parent, tag).text = \
+                                                                  to_string(sv)
+
+            elif subvalue is None:
+                if write_none:
+                    if to_string is None:
+                        v.to_parent_element(None, ns, parent, k)
+                    else:
+                        etree.SubElement(parent, tag).set(_ns_xsi_nil, 'true')
+
+            elif to_string is None:
+                v.to_parent_element(subvalue, ns, parent, k)
+
+            else:
+                etree.SubElement(parent, tag).text = to_string(subvalue)
+
+    @classmethod
+    def write_columns(cls, columns, parent, tag):
+        """Appends one element with the given tag per row of the given
+        _Columns instance to parent. Simple members are converted to strings
+        a column at a time, and no instances are built for the rows.
+        """
+
+        plan = _serializer_plans.get(cls, None)
+        if plan is None:
+            plan = cls.get_serializer_plan()
+
+        rows = xrange(columns.length)
+        compiled = []
+        for k, v, ns, member_tag, is_attribute, is_multiple, write_none, \
+                                                          to_string in plan:
+            column = columns.columns.get(k, None)
+            if column is None:
+                if is_attribute or is_multiple or not write_none:
+                    continue
+                column = (None,) * columns.length
+
+            elif to_string is not None and not is_multiple:
+                column = [to_string(c) if c is not None else None
+                                                            for c in column]
+            compiled.append((k, v, ns, member_tag, is_attribute, is_multiple,
+                                                write_none, to_string, column))
+
+        SubElement = etree.SubElement
+        for i in rows:
+            row = SubElement(parent, tag)
+
+            for k, v, ns, member_tag, is_attribute, is_multiple, write_none, \
+                                              to_string, column in compiled:
+                subvalue = column[i]
+
+                if is_attribute:
+                    v.marshall(k, subvalue, row)
+
+                elif is_multiple:
+                    if subvalue is None:
+                        continue
 
-            if mo == 'unbounded' or mo > 1:
-                if subvalue != None:
                     for sv in subvalue:
-                        v.to_parent_element(sv, cls.get_namespace(), parent, k)
+                        if to_string is None:
+                            v.to_parent_element(sv, ns, row, k)
+                        elif sv is None:
+                            SubElement(row, member_tag).set(_ns_xsi_nil,
+                                                                    'true')
+                        else:
+                            SubElement(row, member_tag).text = to_string(sv)
 
-            elif v.Attributes.min_occurs == 0 and subvalue is None :
-                # if a null value is passed to an element with min_occurs = 0
-                # then we need to **NOT** render an empty tag. per
-                # http://www.w3.org/TR/xmlschema-0/
-                pass
+                elif subvalue is None:
+                    if write_none:
+                        SubElement(row, member_tag).set(_ns_xsi_nil, 'true')
+
+                elif to_string is None:
+                    v.to_parent_element(subvalue, ns, row, k)
 
-            # Don't include empty values for non-nillable optional attributes.
-            elif subvalue is not None or v.Attributes.nillable or v.Attributes.min_occurs > 0:
-                #TODO: move this ns tag to the parent element...........
-                v.to_parent_element(subvalue, cls.get_namespace(), parent, k)
+                else:
+                    SubElement(row, member_tag).text = subvalue
 
     @classmethod
     @nillable_value
@@ -215,47 +590,439 @@ class ClassModelBase(Base):
         if name is None:
             name = cls.get_type_name()
 
+        key = None
+        if getattr(value, '__immutable__', False):
+            # the prefixes of the copies depend on the namespaces declared
+            # by the document.
+            nsmap = parent_elt.getroottree().getroot().nsmap
+            key = (tns, name, tuple(sorted(nsmap.items()))) + \
+                                           fragment_cache.get_key(cls, value)
+            fragment = fragment_cache.get(key)
+            if fragment is not None:
+                parent_elt.append(deepcopy(fragment))
+                return
+
         element = etree.SubElement(parent_elt, "{%s}%s" % (tns, name))
 
         inst = cls.get_serialization_instance(value)
 
         cls.get_members(inst, element)
 
+        if key is not None:
+            fragment_cache.set(key, value, deepcopy(element))
+
+    @classmethod
+    def to_xmlfile(cls, value, tns, xf, name=None):
+        """Incrementally writes the given value to xf, an open
+        lxml.etree.xmlfile context, like to_parent_element would.
+
+        This is a generator that yields after every item of members with
+        max_occurs > 1, so that the caller can send out what was written so
+        far. Such members can be any iterable, including generators, which
+        are consumed lazily.
+        """
+
+        if name is None:
+            name = cls.get_type_name()
+
+        if value is None:
+            with xf.element("{%s}%s" % (tns, name), {_ns_xsi_nil: 'true'}):
+                pass
+            return
+
+        inst = cls.get_serialization_instance(value)
+
+        plan = _serializer_plans.get(cls, None)
+        if plan is None:
+            plan = cls.get_serializer_plan()
+
+        attrib = {}
+        for k, v, ns, tag, is_attribute, is_multiple, write_none, to_string \
+                                                                    in plan:
+            if is_attribute:
+                subvalue = getattr(inst, k, None)
+                if subvalue is not None:
+                    attrib[k] = subvalue
+
+        class_to_parent_element = ClassModelBase.to_parent_element.im_func
+
+        with xf.element("{%s}%s" % (tns, name), attrib):
+            for k, v, ns, tag, is_attribute, is_multiple, write_none, \
+                                                        to_string in plan:
+                if is_attribute:
+                    continue
+
+                subvalue = getattr(inst, k, None)
+
+                # like get_members, nothing is written for multiple members
+                # that are None.
+                if subvalue is None:
+                    if write_none and not is_multiple:
+                        with xf.element(tag, {_ns_xsi_nil: 'true'}):
+                            pass
+                    continue
+
+                if is_multiple:
+                    values = subvalue
+                else:
+                    values = (subvalue,)
+
+                is_class = getattr(v.to_parent_element, 'im_func', None) is \
+                                                        class_to_parent_element
+
+                for sv in values:
+                    if sv is None:
+                        with xf.element(tag, {_ns_xsi_nil: 'true'}):
+                            pass
+
+                    elif to_string is not None:
+                        with xf.element(tag):
+                            xf.write(to_string(sv))
+
+                    elif is_class:
+                        for _ in v.to_xmlfile(sv, ns, xf, k):
+                            yield
+
+                    else:
+                        # types with their own serializers are written as
+                        # separate subtrees.
+                        scratch = etree.Element('scratch')
+                        v.to_parent_element(sv, ns, scratch, k)
+                        for child in scratch:
+                            xf.write(child)
+
+                    if is_multiple:
+                        yield
+
+    @classmethod
+    def get_deserializer_tables(cls):
+        """Returns the lookup tables from_xml uses, as a (tags, names,
+        attributes) tuple, computed once per class.
+
+        'tags' maps the Clark notation tags of the members of this class and
+        its ancestors to (name, type, is_multiple) tuples. 'names' maps bare
+        member names to the same tuples, for child elements in unexpected
+        namespaces. 'attributes' is a list of (name, type) pairs of members
+        that are xml attributes.
+        """
+
+        tables = _deserializer_tables.get(cls, None)
+        if tables is not None:
+            return tables
+
+        parent_cls = getattr(cls, '__extends__', None)
+        if parent_cls :
+            parent_tags, parent_names, parent_attributes = \
+                                            parent_cls.get_deserializer_tables()
+            tags = dict(parent_tags)
+            names = dict(parent_names)
+            attributes = list(parent_attributes)
+
+        else:
+            tags = {}
+            names = {}
+            attributes = []
+
+        tns = cls.get_namespace()
+
+        for k, v in cls._type_info.items():
+            if isinstance(v, XMLAttribute):
+                attributes.append((k, v))
+                continue
+
+            mo = v.Attributes.max_occurs
+            entry = (k, v, mo == 'unbounded' or mo > 1)
+
+            tags["{%s}%s" % (tns, k)] = entry
+            names[k] = entry
+
+        tables = _deserializer_tables[cls] = (tags, names, attributes)
+
+        return tables
+
+    @classmethod
+    def get_lazy_class(cls):
+        """Returns the subclass of this class whose instances deserialize
+        their members the first time they're read, computed once per class.
+        """
+
+        lazy_cls = _lazy_classes.get(cls, None)
+        if lazy_cls is not None:
+            return lazy_cls
+
+        cls_dict = {'__module__': cls.__module__}
+        tags, names, attributes = cls.get_deserializer_tables()
+        for key, member, is_multiple in names.values():
+            cls_dict[key] = _LazyMember(key, member, is_multiple,
+                                                    getattr(cls, key, None))
+
+        # the metaclass would build a new _type_info.
+        lazy_cls = type.__new__(type(cls), cls.__name__, (cls,), cls_dict)
+        _lazy_classes[cls] = lazy_cls
+
+        return lazy_cls
+
+    @classmethod
+    def get_lazy_instance(cls, element, deep=False):
+        """Returns an instance of the lazy class of this class for the given
+        element. The children of the element are sorted by member, and every
+        member is deserialized the first time it's read. The instance keeps
+        the elements of the members it hasn't deserialized yet.
+
+        @param element the element to deserialize
+        @param deep when True, the ClassModels in the members are deserialized
+               lazily too. Otherwise the members are deserialized with
+               from_xml.
+        """
+
+        if bool(element.get(_ns_xsi_nil)):
+            return None
+
+        tables = _deserializer_tables.get(cls, None)
+        if tables is None:
+            tables = cls.get_deserializer_tables()
+        tags, names, attributes = tables
+
+        lazy_cls = _lazy_classes.get(cls, None)
+        if lazy_cls is None:
+            lazy_cls = cls.get_lazy_class()
+
+        inst = lazy_cls.__new__(lazy_cls)
+
+        elements = {}
+        for c in element:
+            tag = c.tag
+            entry = tags.get(tag, None)
+
+            if entry is None:
+                # comments and processing instructions don't have string tags
+                if not isinstance(tag, basestring):
+                    continue
+
+                entry = names.get(tag.split('}')[-1], None)
+                if entry is None:
+                    continue
+
+            key, member, is_multiple = entry
+
+            if is_multiple:
+                value = elements.get(key, None)
+                if value is None:
+                    value = elements[key] = []
+                value.append(c)
+
+            else:
+                elements[key] = c
+
+        inst.__dict__['_lazy_elements'] = (elements, deep,
+                                                       get_string_policy())
+
+        for key, member in attributes:
+            setattr(inst, key, element.get(key))
+
+        return inst
+
+    @classmethod
+    def get_record_class(cls):
+        """Returns the namedtuple class that get_record returns, whose fields
+        are the members of this class and its ancestors, computed once per
+        class.
+        """
+
+        record_cls = _record_classes.get(cls, None)
+        if record_cls is not None:
+            return record_cls
+
+        fields = [k for k, v, ns, tag, is_attribute, is_multiple, write_none,
+                        to_string in cls.get_serializer_plan()]
+        record_cls = namedtuple(cls.__name__, fields)
+        record_cls._positions = dict([(k, i) for i, k in enumerate(fields)])
+
+        _record_classes[cls] = record_cls
+        _record_types.add(record_cls)
+
+        return record_cls
+
+    @classmethod
+    def get_record(cls, element):
+        """Deserializes the given element as a read-only record, i.e. an
+        instance of get_record_class(). The ClassModels in its members are
+        records too. Records are serialized like instances of this class.
+        """
+
+        if bool(element.get(_ns_xsi_nil)):
+            return None
+
+        tables = _deserializer_tables.get(cls, None)
+        if tables is None:
+            tables = cls.get_deserializer_tables()
+        tags, names, attributes = tables
+
+        record_cls = _record_classes.get(cls, None)
+        if record_cls is None:
+            record_cls = cls.get_record_class()
+        positions = record_cls._positions
+
+        values = [None] * len(positions)
+        for c in element:
+            tag = c.tag
+            entry = tags.get(tag, None)
+
+            if entry is None:
+                # comments and processing instructions don't have string tags
+                if not isinstance(tag, basestring):
+                    continue
+
+                entry = names.get(tag.split('}')[-1], None)
+                if entry is None:
+                    continue
+
+            key, member, is_multiple = entry
+            i = positions[key]
+
+            if is_multiple:
+                value = values[i]
+                if value is None:
+                    value = values[i] = []
+                value.append(_from_xml_record(member, c))
+
+            else:
+                values[i] = _from_xml_record(member, c)
+
+        for key, member in attributes:
+            values[positions[key]] = element.get(key)
+
+        return tuple.__new__(record_cls, values)
+
     @classmethod
     @nillable_element
     def from_xml(cls, element):
+        if cls.__lazy__ and \
+                cls.get_deserialization_instance.im_func is \
+                ClassModelBase.get_deserialization_instance.im_func:
+            return cls.get_lazy_instance(element)
+
         inst = cls.get_deserialization_instance()
 
+        tables = _deserializer_tables.get(cls, None)
+        if tables is None:
+            tables = cls.get_deserializer_tables()
+        tags, names, attributes = tables
+
         for c in element:
-            if isinstance(c, etree._Comment):
-                continue
+            tag = c.tag
+            entry = tags.get(tag, None)
 
-            key = c.tag.split('}')[-1]
+            if entry is None:
+                # comments and processing instructions don't have string tags
+                if not isinstance(tag, basestring):
+                    continue
 
-            member = cls._type_info.get(key, None)
-            clz = getattr(cls,'__extends__', None)
-            while not (clz is None) and (member is None):
-                member = clz._type_info.get(key, None)
-                clz = getattr(clz,'__extends__', None)
+                entry = names.get(tag.split('}')[-1], None)
+                if entry is None:
+                    continue
 
-            if member is None:
-                continue
+            key, member, is_multiple = entry
+
+            if is_multiple:
+                value = getattr(inst, key, None)
+                if value is None:
+                    value = []
+                    setattr(inst, key, value)
+                value.append(member.from_xml(c))
 
-            if isinstance(member, XMLAttribute):
-                value = element.get(key)
             else:
-                mo = member.Attributes.max_occurs
-                if mo == 'unbounded' or mo > 1:
+                setattr(inst, key, member.from_xml(c))
+
+        for key, member in attributes:
+            value = element.get(key)
+            if value is not None:
+                setattr(inst, key, value)
+
+        return inst
+
+    @classmethod
+    def compile_validator(cls):
+        tags, names, attributes = cls.get_deserializer_tables()
+        nillable = cls.Attributes.nillable
+        get_validator = _validators.get
+
+        # the members whose number of occurrences needs to be checked once
+        # all children are read, as (name, tag, is_multiple, min_occurs,
+        # max_occurs) tuples.
+        occurs = []
+        for tag, (k, v, is_multiple) in tags.items():
+            min_occurs = v.Attributes.min_occurs
+            max_occurs = v.Attributes.max_occurs
+            if max_occurs == 'unbounded' or not is_multiple:
+                max_occurs = None
+
+            if min_occurs > 0 or max_occurs is not None:
+                occurs.append((k, tag, is_multiple, min_occurs, max_occurs))
+
+        def validate(element):
+            if bool(element.get(_ns_xsi_nil)):
+                if not nillable:
+                    invalid_element(element, 'The element is not nillable.')
+                return None
+
+            inst = cls.get_deserialization_instance()
+            seen = set()
+
+            for c in element:
+                tag = c.tag
+                entry = tags.get(tag, None)
+
+                if entry is None:
+                    # comments and processing instructions don't have string
+                    # tags
+                    if not isinstance(tag, basestring):
+                        continue
+
+                    invalid_element(c, 'This element is not expected.')
+
+                key, member, is_multiple = entry
+
+                # validators are looked up here and not when compiling, as
+                # classes can refer to themselves.
+                validator = get_validator(member, None)
+                if validator is None:
+                    validator = member.get_validator()
+
+                if is_multiple:
                     value = getattr(inst, key, None)
                     if value is None:
                         value = []
-                    value.append(member.from_xml(c))
+                        setattr(inst, key, value)
+                    value.append(validator(c))
+
                 else:
-                    value = member.from_xml(c)
+                    if key in seen:
+                        invalid_element(c, 'This element is not expected.')
+                    seen.add(key)
+                    setattr(inst, key, validator(c))
+
+            for key, tag, is_multiple, min_occurs, max_occurs in occurs:
+                if is_multiple:
+                    count = len(getattr(inst, key, None) or ())
+                else:
+                    count = int(key in seen)
 
-            setattr(inst, key, value)
+                if count < min_occurs:
+                    invalid_element(element, "Missing child element '%s'."
+                                                                        % tag)
+                if max_occurs is not None and count > max_occurs:
+                    invalid_element(element, "Element '%s' occurs more than "
+                                          "%d times." % (tag, max_occurs))
 
-        return inst
+            for key, member in attributes:
+                value = element.get(key)
+                if value is not None:
+                    setattr(inst, key, value)
+
+            return inst
+
+        return validate
 
     @classmethod
     def from_string(cls, xml_string):
@@ -264,6 +1031,12 @@ class ClassModelBase(Base):
 
     @staticmethod
     def resolve_namespace(cls, default_ns):
+        # the serializer plan, the deserializer tables and the validator
+        # depend on the namespace.
+        _serializer_plans.pop(cls, None)
+        _deserializer_tables.pop(cls, None)
+        _validators.pop(cls, None)
+
         if getattr(cls, '__extends__', None) != None:
             cls.__extends__.resolve_namespace(cls.__extends__, default_ns)
 
@@ -367,8 +1140,17 @@ class ClassModel(ClassModelBase):
     """
 
     __metaclass__ = ClassModelMeta
+    __slots__ = ()
 
 class Array(ClassModel):
+    class Attributes(ClassModel.Attributes):
+        # When set to 'array', arrays of Integer, Double or Float values are
+        # deserialized into array.array buffers instead of lists. 'numpy'
+        # gives numpy.ndarray instances instead, when numpy is importable.
+        # Arrays that contain nil items or out-of-range integers are still
+        # deserialized as lists.
+        buffer = None
+
     def __new__(cls, serializer, ** kwargs):
         retval = cls.customize(**kwargs)
 
@@ -412,17 +1194,187 @@ class Array(ClassModel):
     def get_serialization_instance(cls, value):
         inst = ClassModel.__new__(Array)
 
+        columns = cls.get_columns(value)
+        if columns is not None:
+            value = columns
+
+        else:
+            # array.array and numpy buffers are written from plain lists,
+            # whose items are cheaper to turn into text.
+            tolist = getattr(value, 'tolist', None)
+            if tolist is not None:
+                value = tolist()
+
         (member_name,) = cls._type_info.keys()
         setattr(inst, member_name, value)
 
         return inst
 
+    @classmethod
+    def get_columns(cls, value):
+        """Returns the given value as a _Columns instance when it's given
+        column by column, or None otherwise. This is only done for arrays of
+        ClassModels, whose rows can then be written without building an
+        instance per row.
+
+        The columns can be given as a dict of equal-length sequences keyed
+        by member name, as a list of tuples with the members in the order
+        they're serialized in (like records), or as a numpy structured
+        array. Columns that aren't members raise ValueError.
+        """
+
+        (serializer,) = cls._type_info.values()
+        if not issubclass(serializer, ClassModelBase) or \
+                                                issubclass(serializer, Array):
+            return None
+
+        if isinstance(value, dict):
+            columns = value
+
+        elif numpy is not None and isinstance(value, numpy.ndarray):
+            if value.dtype.names is None:
+                return None
+
+            columns = dict([(k, value[k].tolist()) for k in value.dtype.names])
+
+        elif isinstance(value, list) and len(value) > 0 and \
+                                    type(value[0]) is tuple:
+            keys = [member[0] for member in serializer.get_serializer_plan()]
+            width = len(value[0])
+            if width > len(keys):
+                raise ValueError("Rows have more values than %r has members" %
+                                                                   serializer)
+
+            for i, row in enumerate(value):
+                if len(row) != width:
+                    raise ValueError("Row %d has %d values instead of %d" %
+                                                         (i, len(row), width))
+
+            columns = dict(zip(keys, zip(*value)))
+
+            return _Columns(columns, len(value))
+
+        else:
+            return None
+
+        keys = set([member[0] for member in serializer.get_serializer_plan()])
+        unknown = [k for k in columns if k not in keys]
+        if unknown:
+            raise ValueError("%r has no members named %s" % (serializer,
+                                       ', '.join(map(repr, sorted(unknown)))))
+
+        length = None
+        for k, column in columns.items():
+            if length is None:
+                length = len(column)
+            elif len(column) != length:
+                raise ValueError("Column %r has %d values instead of %d" %
+                                                     (k, len(column), length))
+
+        return _Columns(columns, length or 0)
+
+    @classmethod
+    def compile_validator(cls):
+        tags, names, attributes = cls.get_deserializer_tables()
+        ((tag, (key, serializer, is_multiple)),) = tags.items()
+        nillable = cls.Attributes.nillable
+
+        min_occurs = serializer.Attributes.min_occurs
+        max_occurs = serializer.Attributes.max_occurs
+        if max_occurs == 'unbounded':
+            max_occurs = None
+
+        typecode = cls.get_buffer_typecode()
+
+        def validate(element):
+            if bool(element.get(_ns_xsi_nil)):
+                if not nillable:
+                    invalid_element(element, 'The element is not nillable.')
+                return None
+
+            # this is looked up here as the serializer can be the class of
+            # the parent element.
+            validator = serializer.get_validator()
+            retval = []
+
+            for c in element:
+                if c.tag != tag:
+                    if not isinstance(c.tag, basestring):
+                        continue
+
+                    invalid_element(c, 'This element is not expected.')
+
+                retval.append(validator(c))
+
+            if len(retval) < min_occurs:
+                invalid_element(element, "Missing child element '%s'." % tag)
+            if max_occurs is not None and len(retval) > max_occurs:
+                invalid_element(element, "Element '%s' occurs more than "
+                                          "%d times." % (tag, max_occurs))
+
+            if typecode is not None and not (None in retval):
+                return cls.get_buffer(typecode, retval)
+
+            return retval
+
+        return validate
+
+    @classmethod
+    def get_buffer_typecode(cls):
+        """Returns the array.array typecode of the buffers the items of this
+        array are deserialized into, or None when it's deserialized into lists.
+        """
+
+        if cls.Attributes.buffer is None:
+            return None
+
+        (serializer,) = cls._type_info.values()
+        from_string = getattr(serializer.from_string, 'im_func', None)
+
+        if from_string is Double.from_string.im_func:
+            return 'd'
+        if from_string is Integer.from_string.im_func:
+            return 'l'
+
+        return None
+
+    @classmethod
+    def get_buffer(cls, typecode, values):
+        """Returns the given numbers in a buffer of the kind set in the buffer
+        attribute, or None when they don't fit in one.
+        """
+
+        try:
+            retval = array(typecode, values)
+        except OverflowError:
+            return None
+
+        if cls.Attributes.buffer == 'numpy' and numpy is not None:
+            retval = numpy.frombuffer(retval, typecode)
+
+        return retval
+
     @classmethod
     @nillable_element
     def from_xml(cls, element):
-        retval = []
         (serializer,) = cls._type_info.values()
 
+        typecode = cls.get_buffer_typecode()
+        if typecode is not None:
+            # the text of all the items is extracted in one pass. the fast
+            # path is only taken when every item has text and none is nil.
+            texts = _xpath_texts(element)
+            if len(texts) == len(element) and not _xpath_has_nil(element):
+                if typecode == 'd':
+                    retval = cls.get_buffer(typecode, map(float, texts))
+                else:
+                    retval = cls.get_buffer(typecode, map(int, texts))
+
+                if retval is not None:
+                    return retval
+
+        retval = []
+
         for child in element.getchildren():
             retval.append(serializer.from_xml(child))
 
@@ -93,3 +93,6 @@ class Fault(Exception, Base):
                               '%sFault' % cls.get_type_name_ns(app))
 
         schema_dict.add_element(cls, top_level_element)
+
+class ValidationError(Fault):
+    """Raised when an incoming message doesn't conform to its schema."""
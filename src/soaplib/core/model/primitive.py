@@ -20,6 +20,7 @@
 import datetime
 import decimal
 import re
+import threading
 import pytz
 
 from lxml import etree
@@ -37,15 +38,102 @@ from soaplib.core.util.etreeconv import dict_to_etree
 
 string_encoding = 'utf-8'
 
-_date_pattern = r'(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})'
-_time_pattern = r'(?P<hr>\d{2}):(?P<min>\d{2}):(?P<sec>\d{2})(?P<sec_frac>\.\d+)?'
-_offset_pattern = r'(?P<tz_hr>[+-]\d{2}):(?P<tz_min>\d{2})'
-_datetime_pattern = _date_pattern + '[T ]' + _time_pattern
+_date_re = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
 
-_local_re = re.compile(_datetime_pattern)
-_utc_re = re.compile(_datetime_pattern + 'Z')
-_offset_re = re.compile(_datetime_pattern + _offset_pattern)
-_date_re = re.compile(_date_pattern)
+# local, utc and offset datetimes, with an optional fraction of a second.
+_datetime_re = re.compile(r'(\d{4})-(\d{2})-(\d{2})[T ]'
+                          r'(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?'
+                          r'(?:(Z)|([+-])(\d{2}):(\d{2}))?')
+
+_non_ascii = re.compile(u'[^\x00-\x7f]')
+_non_ascii_bytes = re.compile('[\x80-\xff]')
+
+# see set_string_policy
+_string_policies = (None, 'unicode', 'bytes')
+
+class _StringPolicy(threading.local):
+    policy = None
+
+_string_policy = _StringPolicy()
+
+def set_string_policy(policy):
+    """Sets the type of the values String.from_string returns in the current
+    thread. None returns ascii text as str and other text as unicode, 'unicode'
+    returns unicode and 'bytes' returns str in string_encoding. Applications
+    set their own policy (see the _string_policy argument of Application)
+    while they deserialize a message and restore the previous one afterwards.
+    Lazy members and streamed parameters are deserialized with the policy of
+    the message they came from.
+    """
+
+    if not (policy in _string_policies):
+        raise ValueError("Unknown string policy %r" % (policy,))
+
+    _string_policy.policy = policy
+
+def get_string_policy():
+    """Returns the string policy of the current thread."""
+
+    return _string_policy.policy
+
+# the tzinfo instances of the utc offsets seen so far, keyed by their text.
+_offsets = {}
+
+_true_strings = frozenset(('true', '1'))
+
+def parse_date(string):
+    """Parses an ISO formatted date."""
+
+    match = _date_re.match(string)
+    if match is None:
+        raise Exception("Date [%s] not in known format" % string)
+
+    year, month, day = match.groups()
+
+    return datetime.date(int(year), int(month), int(day))
+
+def parse_datetime(string):
+    """Parses an ISO formatted datetime in one pass. Fractions of a second
+    are truncated to microseconds without going through floats, and the
+    tzinfo instances of utc offsets are cached.
+    """
+
+    match = _datetime_re.match(string)
+    if match is None:
+        raise Exception("DateTime [%s] not in known format" % string)
+
+    year, month, day, hour, min, sec, frac, utc, sign, tz_hr, tz_min = \
+                                                                match.groups()
+
+    if frac is None:
+        microsec = 0
+    else:
+        microsec = int((frac + '00000')[:6])
+
+    if utc is not None:
+        tz = pytz.utc
+    elif sign is not None:
+        tz = _offsets.get(sign + tz_hr + tz_min, None)
+        if tz is None:
+            offset = int(tz_hr) * 60 + int(tz_min)
+            if sign == '-':
+                offset = -offset
+            tz = _offsets[sign + tz_hr + tz_min] = FixedOffset(offset)
+    else:
+        tz = None
+
+    return datetime.datetime(int(year), int(month), int(day), int(hour),
+                                          int(min), int(sec), microsec, tz)
+
+def parse_duration(string):
+    """Parses an xml schema duration into a timedelta."""
+
+    return XmlDuration.from_string(string).as_timedelta()
+
+def parse_boolean(string):
+    """Parses an xml schema boolean. Anything but 'true' and '1' is false."""
+
+    return string.lower() in _true_strings
 
 _ns_xs = namespaces.ns_xsd
 _ns_xsi = namespaces.ns_xsi
@@ -147,12 +235,42 @@ class String(SimpleType):
                 pattern.set('value', cls.Attributes.pattern)
 
     @classmethod
-    @nillable_value
-    def to_parent_element(cls, value, tns, parent_elt, name='retval'):
-        if not isinstance(value, unicode):
-            value = unicode(value, string_encoding)
+    def get_text_checks(cls):
+        retval = []
+
+        min_len = cls.Attributes.min_len
+        max_len = cls.Attributes.max_len
+        pattern = cls.Attributes.pattern
+
+        if min_len != String.Attributes.min_len:
+            retval.append((lambda text: len(text) >= min_len,
+                    "[facet 'minLength'] The value is shorter than %d "
+                    "characters." % min_len))
+
+        if max_len != String.Attributes.max_len:
+            retval.append((lambda text: len(text) <= max_len,
+                    "[facet 'maxLength'] The value is longer than %d "
+                    "characters." % max_len))
+
+        # xml schema patterns match the whole value. they're compiled as
+        # python regular expressions, which is fine for the usual subset.
+        if pattern != String.Attributes.pattern:
+            match = re.compile(u'(?:%s)\\Z' % pattern, re.UNICODE).match
+            retval.append((lambda text: match(text) is not None,
+                    "[facet 'pattern'] The value does not match %r." % pattern))
+
+        return retval
 
-        SimpleType.to_parent_element(value, tns, parent_elt, name)
+    @classmethod
+    def to_string(cls, value):
+        if isinstance(value, unicode):
+            return value
+
+        # lxml takes ascii byte strings as they are, and so does u''.join.
+        if isinstance(value, str) and _non_ascii_bytes.search(value) is None:
+            return value
+
+        return unicode(value, string_encoding)
 
     @classmethod
     @nillable_element
@@ -161,121 +279,98 @@ class String(SimpleType):
         return cls.from_string(u)
 
     @classmethod
-    @nillable_string
     def from_string(cls, string):
-        try:
-            string = str(string)
-            return string.encode(string_encoding)
+        if string is None:
+            return None
+
+        policy = _string_policy.policy
 
-        except:
+        if policy is None:
+            # lxml already returns ascii text as str.
+            if isinstance(string, unicode) and \
+                                         _non_ascii.search(string) is None:
+                return str(string)
             return string
 
+        if policy == 'unicode':
+            if isinstance(string, str):
+                return unicode(string, string_encoding)
+            return string
+
+        if isinstance(string, unicode):
+            return string.encode(string_encoding)
+        return string
+
 class AnyUri(String):
     __type_name__ = 'anyURI'
 
 class Decimal(SimpleType):
     @classmethod
-    @nillable_value
-    def to_parent_element(cls, value, tns, parent_elt, name='retval'):
-        SimpleType.to_parent_element(str(value), tns, parent_elt, name)
+    def to_string(cls, value):
+        return str(value)
 
     @classmethod
-    @nillable_string
     def from_string(cls, string):
+        if string is None:
+            return None
         return decimal.Decimal(string)
 
 class Integer(Decimal):
     @classmethod
-    @nillable_string
     def from_string(cls, string):
-        try:
-            return int(string)
-        except:
-            return long(string)
+        if string is None:
+            return None
+        # int returns longs for values that don't fit in ints.
+        return int(string)
 
 class Date(SimpleType):
     @classmethod
-    @nillable_value
-    def to_parent_element(cls, value, tns, parent_elt, name='retval'):
-        SimpleType.to_parent_element(value.isoformat(), tns, parent_elt, name)
+    def to_string(cls, value):
+        return value.isoformat()
 
     @classmethod
-    @nillable_string
     def from_string(cls, string):
         """expect ISO formatted dates"""
-        def parse_date(date_match):
-            fields = date_match.groupdict(0)
-            year, month, day = [int(fields[x]) for x in
-                ("year", "month", "day")]
-            return datetime.date(year, month, day)
-
-        match = _date_re.match(string)
-        if not match:
-            raise Exception("Date [%s] not in known format" % string)
-
-        return parse_date(match)
+        if string is None:
+            return None
+        return parse_date(string)
 
 class DateTime(SimpleType):
     __type_name__ = 'dateTime'
 
     @classmethod
-    @nillable_value
-    def to_parent_element(cls, value, tns, parent_elt, name='retval'):
-        SimpleType.to_parent_element(value.isoformat('T'), tns, parent_elt, name)
+    def to_string(cls, value):
+        return value.isoformat('T')
 
     @classmethod
-    @nillable_string
     def from_string(cls, string):
         """expect ISO formatted dates"""
-        def parse_date(date_match, tz=None):
-            fields = date_match.groupdict(0)
-            year, month, day, hour, min, sec = [int(fields[x]) for x in
-                ("year", "month", "day", "hr", "min", "sec")]
-
-            # use of decimal module here (rather than float) might be better
-            # here, if willing to require python 2.4 or higher
-            microsec = int(float(fields.get("sec_frac", 0)) * 10 ** 6)
-
-            return datetime.datetime(year,month,day, hour,min,sec, microsec, tz)
-
-        match = _utc_re.match(string)
-        if match:
-            return parse_date(match, tz=pytz.utc)
-
-        match = _offset_re.match(string)
-        if match:
-            tz_hr, tz_min = [int(match.group(x)) for x in "tz_hr", "tz_min"]
-            return parse_date(match, tz=FixedOffset(tz_hr * 60 + tz_min, {}))
-
-        match = _local_re.match(string)
-        if not match:
-            raise Exception("DateTime [%s] not in known format" % string)
-
-        return parse_date(match)
+        if string is None:
+            return None
+        return parse_datetime(string)
 
 class Duration(SimpleType):
     __type_name__ = 'duration'
 
     @classmethod
-    @nillable_value
-    def to_parent_element(cls, value, tns, parent_elt, name='retval'):
-        duration = XmlDuration.parse(value)
-        SimpleType.to_parent_element(str(duration), tns, parent_elt, name)
+    def to_string(cls, value):
+        return str(XmlDuration.parse(value))
 
     @classmethod
-    @nillable_string
     def from_string(cls, string):
-        return XmlDuration.from_string(string).as_timedelta()
+        if string is None:
+            return None
+        return parse_duration(string)
 
 class Double(SimpleType):
     @classmethod
-    @nillable_value
-    def to_parent_element(cls, value, tns, parent_elt, name='retval'):
-        SimpleType.to_parent_element(str(value), tns, parent_elt, name)
+    def to_string(cls, value):
+        return str(value)
 
     @classmethod
-    @nillable_string
     def from_string(cls, string):
+        if string is None:
+            return None
         return float(string)
 
 class Float(Double):
@@ -283,14 +378,14 @@ class Float(Double):
 
 class Boolean(SimpleType):
     @classmethod
-    @nillable_value
-    def to_parent_element(cls, value, tns, parent_elt, name='retval'):
-        SimpleType.to_parent_element(str(bool(value)).lower(), tns, parent_elt, name)
+    def to_string(cls, value):
+        return str(bool(value)).lower()
 
     @classmethod
-    @nillable_string
     def from_string(cls, string):
-        return (string.lower() in ['true', '1'])
+        if string is None:
+            return None
+        return parse_boolean(string)
 
 # a class that is really a namespace
 class Mandatory(object):
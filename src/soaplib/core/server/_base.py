@@ -25,17 +25,46 @@ import logging
 logger = logging.getLogger(__name__)
 
 from soaplib.core.model.exception import Fault
+from soaplib.core.model.exception import ValidationError
 from soaplib.core.model.primitive import string_encoding
+from soaplib.core.service import DefinitionBase
+from soaplib.core.timing import clock
 
 HTTP_500 = '500 Internal server error'
 HTTP_200 = '200 OK'
 HTTP_405 = '405 Method Not Allowed'
 
-class ValidationError(Fault):
-    pass
+class _ChunkBuffer(object):
+    """The file-like object the incremental serializer writes to."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def pop(self):
+        retval = ''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+
+        return retval
 
 class Base(object):
     transport = None
+    chunk_size = 64 * 1024
+
+    # see Application.serialize_soap_string
+    _string_response = False
+
+    # see Application.deserialize_soap_string
+    _event_request = False
+
+    # when set, this is passed the MethodContext of every request, with the
+    # timings of its phases. see soaplib.core.timing.
+    _timing_sink = None
 
     def __init__(self, app):
         self.app = app
@@ -43,18 +72,70 @@ class Base(object):
 
     def get_in_object(self, ctx, in_string, in_string_charset=None):
         in_object = None
+        timings = ctx.timings
+
+        if self._event_request:
+            if timings is not None:
+                start = clock()
+
+            try:
+                in_object = self.app.deserialize_soap_string(ctx, in_string,
+                                                             in_string_charset)
+            except Fault,e:
+                ctx.in_error = e
+
+            if timings is not None:
+                ctx.add_timing('deserialize', start)
+
+            return in_object
+
+        if timings is not None:
+            start = clock()
+
         root, xmlids = self.app.parse_xml_string(in_string, in_string_charset)
 
+        if timings is not None:
+            ctx.add_timing('parse', start)
+            start = clock()
+            validate = timings.get('validate', 0.0)
+
         try:
             in_object = self.app.deserialize_soap(ctx, self.app.IN_WRAPPER,
                                                                    root, xmlids)
         except Fault,e:
             ctx.in_error = e
 
+        if timings is not None:
+            # validation is timed on its own.
+            ctx.add_timing('deserialize',
+                              start + timings.get('validate', 0.0) - validate)
+
+        return in_object
+
+    def get_in_object_stream(self, ctx, in_stream, in_string_charset=None):
+        in_object = None
+
+        if ctx.timings is not None:
+            start = clock()
+
+        try:
+            in_object = self.app.deserialize_soap_stream(ctx, in_stream,
+                                                            in_string_charset)
+        except Fault,e:
+            ctx.in_error = e
+
+        if ctx.timings is not None:
+            ctx.add_timing('deserialize', start)
+
         return in_object
 
     def get_out_object(self, ctx, in_object):
-        out_object = self.app.process_request(ctx, in_object)
+        if ctx.timings is None:
+            out_object = self.app.process_request(ctx, in_object)
+        else:
+            start = clock()
+            out_object = self.app.process_request(ctx, in_object)
+            ctx.add_timing('process', start)
 
         if isinstance(out_object, Fault):
             ctx.out_error = out_object
@@ -64,7 +145,77 @@ class Base(object):
         return out_object
 
     def get_out_string(self, ctx, out_object):
+        timings = ctx.timings
+        if timings is not None:
+            start = clock()
+
+        # responses that can be streamed don't need the envelope tree either.
+        if self._string_response and self.can_stream(ctx, out_object):
+            out_string = self.app.serialize_soap_string(ctx,
+                                          self.app.OUT_WRAPPER, out_object)
+            if out_string is not None:
+                if timings is not None:
+                    ctx.add_timing('serialize', start)
+                return out_string
+
         out_xml = self.app.serialize_soap(ctx, self.app.OUT_WRAPPER, out_object)
+
+        if timings is not None:
+            ctx.add_timing('serialize', start)
+            start = clock()
+
         out_string = etree.tostring(out_xml, xml_declaration=True,
                                                        encoding=string_encoding)
+
+        if timings is not None:
+            ctx.add_timing('tostring', start)
+
         return out_string
+
+    def can_stream(self, ctx, out_object):
+        """Tells whether the response can be serialized with
+        get_out_chunks.
+        """
+
+        if isinstance(out_object, Fault) or ctx.in_error or ctx.out_error:
+            return False
+
+        if ctx.descriptor is None or ctx.descriptor.mtom:
+            return False
+
+        # this hook needs the whole envelope as an element tree.
+        return ctx.service.on_method_return_xml.im_func is \
+                                    DefinitionBase.on_method_return_xml.im_func
+
+    def get_out_chunks(self, ctx, out_object):
+        """Serializes the response incrementally. This is a generator that
+        yields the encoded response in chunks of roughly chunk_size bytes.
+        """
+
+        out_file = _ChunkBuffer()
+        timings = ctx.timings
+
+        # the time spent sending the chunks isn't part of serialization.
+        if timings is not None:
+            start = clock()
+
+        with etree.xmlfile(out_file, encoding=string_encoding) as xf:
+            xf.write_declaration()
+
+            for _ in self.app.serialize_soap_incremental(ctx,
+                                       self.app.OUT_WRAPPER, out_object, xf):
+                if out_file.size >= self.chunk_size:
+                    chunk = out_file.pop()
+                    if timings is not None:
+                        ctx.add_timing('serialize', start)
+
+                    yield chunk
+
+                    if timings is not None:
+                        start = clock()
+
+        if timings is not None:
+            ctx.add_timing('serialize', start)
+
+        if out_file.size > 0:
+            yield out_file.pop()
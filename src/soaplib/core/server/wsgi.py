@@ -25,43 +25,180 @@ logger = logging.getLogger(__name__)
 import cgi
 import traceback
 
+from email.utils import formatdate
+from email.utils import mktime_tz
+from email.utils import parsedate_tz
+
 import soaplib
 
 from soaplib.core.model.exception import Fault
+from soaplib.core.model.exception import ValidationError
 
+from soaplib.core.metrics import CONTENT_TYPE as metrics_content_type
+from soaplib.core.metrics import Metrics
 from soaplib.core.mime import apply_mtom
 from soaplib.core.mime import collapse_swa
 from soaplib.core.util import reconstruct_url
 from soaplib.core.server import Base
+from soaplib.core.timing import clock
 
 HTTP_500 = '500 Internal server error'
 HTTP_200 = '200 OK'
+HTTP_304 = '304 Not Modified'
 HTTP_405 = '405 Method Not Allowed'
 
-class ValidationError(Fault):
-    pass
-
-def _reconstruct_soap_request(http_env):
+def _reconstruct_soap_request(http_env, ctx):
     """Reconstruct http payload using information in the http header
     """
 
+    timings = ctx.timings
+    if timings is not None:
+        start = clock()
+
     input = http_env.get('wsgi.input')
     length = http_env.get("CONTENT_LENGTH")
     http_payload = input.read(int(length))
 
+    if timings is not None:
+        ctx.add_timing('read', start)
+
     # fyi, here's what the parse_header function returns:
     # >>> import cgi; cgi.parse_header("text/xml; charset=utf-8")
     # ('text/xml', {'charset': 'utf-8'})
+    # when there's no charset, it's left to the parser to figure out the
+    # encoding from the xml declaration.
+    content_type = cgi.parse_header(http_env.get("CONTENT_TYPE"))
+    charset = content_type[1].get('charset',None)
+
+    if timings is None:
+        return collapse_swa(content_type, http_payload), charset
+
+    start = clock()
+    in_string = collapse_swa(content_type, http_payload)
+    ctx.add_timing('mime', start)
+
+    return in_string, charset
+
+def _accepts_gzip(http_env):
+    '''Tells whether the client accepts gzip content coding, as per the
+    Accept-Encoding header.
+    '''
+
+    retval = False
+
+    for coding in http_env.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        params = coding.split(';')
+        name = params[0].strip().lower()
+        if not (name in ('gzip', 'x-gzip', '*')):
+            continue
+
+        q = 1.0
+        for param in params[1:]:
+            k, _, v = param.partition('=')
+            if k.strip() == 'q':
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+
+        if name == '*':
+            retval = retval or q > 0
+        else:
+            # an explicit gzip entry overrides the wildcard
+            return q > 0
+
+    return retval
+
+def _is_not_modified(http_env, etag, last_modified):
+    '''Evaluates the If-None-Match and If-Modified-Since headers of a GET
+    request. If-Modified-Since is only looked at when there's no
+    If-None-Match.
+    '''
+
+    if_none_match = http_env.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*' or tag == etag or tag == 'W/' + etag:
+                return True
+
+        return False
+
+    if_modified_since = http_env.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None:
+        since = parsedate_tz(if_modified_since.split(';')[0])
+        if since is not None:
+            return last_modified <= mktime_tz(since)
+
+    return False
+
+class _RequestBody(object):
+    '''Reads at most 'length' bytes from the wsgi input stream.'''
+
+    def __init__(self, input, length):
+        self.input = input
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.input.read(size)
+        self.remaining -= len(data)
+
+        return data
+
+def _get_soap_request_stream(http_env):
+    '''Returns the http payload as a file-like object along with its charset,
+    or None when the payload has to be reconstructed first.
+    '''
+
     content_type = cgi.parse_header(http_env.get("CONTENT_TYPE"))
+    if 'multipart/related' in content_type[0]:
+        return None
+
+    input = http_env.get('wsgi.input')
+    length = http_env.get("CONTENT_LENGTH")
     charset = content_type[1].get('charset',None)
-    if charset is None:
-        charset = 'ascii'
 
-    return collapse_swa(content_type, http_payload), charset
+    return _RequestBody(input, int(length)), charset
 
 class Application(Base):
     transport = 'http://schemas.xmlsoap.org/soap/http'
 
+    def __init__(self, app, _stream_response=False, _string_response=False,
+                                 _event_request=False, _timing_sink=None,
+                                 _metrics_path=None):
+        '''@param app the soaplib.core.Application instance to expose
+        @param _stream_response when True, responses are serialized
+        incrementally while they're sent, instead of being built as a whole
+        in memory first. See Base.get_out_chunks.
+        @param _string_response when True, responses are written as strings
+        without building an element tree, when possible. See
+        soaplib.core.Application.serialize_soap_string.
+        @param _event_request when True, requests are deserialized from the
+        events of the parser without building an element tree, when
+        possible. See soaplib.core.Application.deserialize_soap_string.
+        @param _timing_sink a callable that's passed the MethodContext of
+        every soap request, with the timings of its phases. See
+        soaplib.core.timing.
+        @param _metrics_path when set, the requests are counted in
+        self.metrics, which are served at this path in the Prometheus text
+        format. See soaplib.core.metrics.
+        '''
+
+        Base.__init__(self, app)
+
+        self._stream_response = _stream_response
+        self._string_response = _string_response
+        self._event_request = _event_request
+        self._timing_sink = _timing_sink
+
+        self._metrics_path = _metrics_path
+        self.metrics = None
+        if _metrics_path is not None:
+            self.metrics = Metrics()
+
     def __call__(self, req_env, start_response, wsgi_url=None):
         '''This method conforms to the WSGI spec for callable wsgi applications
         (PEP 333). It looks in environ['wsgi.input'] for a fully formed soap
@@ -74,6 +211,10 @@ class Application(Base):
         @returns the string representation of the soap call
         '''
 
+        if self._metrics_path is not None and \
+                                 req_env['PATH_INFO'] == self._metrics_path:
+            return self.__handle_metrics_request(req_env, start_response)
+
         url = wsgi_url
         if url is None:
             url = reconstruct_url(req_env).split('.wsdl')[0]
@@ -105,13 +246,31 @@ class Application(Base):
         http_resp_headers = {'Content-Type': 'text/xml'}
 
         try:
-            wsdl = self.app.get_wsdl(url)
-            self.on_wsdl(req_env, wsdl) # implementation hook
+            wsdl = self.app.get_wsdl_document(url)
+            self.on_wsdl(req_env, wsdl.string) # implementation hook
+
+            if _accepts_gzip(req_env):
+                body, etag = wsdl.gzipped, wsdl.gzipped_etag
+                http_resp_headers['Content-Encoding'] = 'gzip'
+            else:
+                body, etag = wsdl.string, wsdl.etag
 
-            http_resp_headers['Content-Length'] = str(len(wsdl))
+            http_resp_headers['ETag'] = etag
+            http_resp_headers['Last-Modified'] = formatdate(wsdl.last_modified,
+                                                                   usegmt=True)
+            http_resp_headers['Vary'] = 'Accept-Encoding'
+
+            if _is_not_modified(req_env, etag, wsdl.last_modified):
+                del http_resp_headers['Content-Type']
+                http_resp_headers.pop('Content-Encoding', None)
+                start_response(HTTP_304, http_resp_headers.items())
+
+                return ['']
+
+            http_resp_headers['Content-Length'] = str(len(body))
             start_response(HTTP_200, http_resp_headers.items())
 
-            return [wsdl]
+            return [body]
 
         except Exception, e:
             logger.error(traceback.format_exc())
@@ -119,32 +278,88 @@ class Application(Base):
             # implementation hook
             self.on_wsdl_exception(req_env, e)
 
-            start_response(HTTP_500, http_resp_headers.items())
+            start_response(HTTP_500, {'Content-Type': 'text/xml'}.items())
 
             return [""]
 
+    def __handle_metrics_request(self, req_env, start_response):
+        if req_env['REQUEST_METHOD'].lower() != 'get':
+            start_response(HTTP_405, [('Allow', 'GET')])
+            return ['']
+
+        body = self.metrics.get_text()
+        start_response(HTTP_200, [
+            ('Content-Type', metrics_content_type),
+            ('Content-Length', str(len(body))),
+        ])
+
+        return [body]
+
     def __handle_soap_request(self, req_env, start_response):
         ctx = soaplib.core.MethodContext()
 
         # implementation hook
         self.on_wsgi_call(req_env)
 
-        in_string, in_string_charset = _reconstruct_soap_request(req_env)
+        ctx.client_key = self.get_client_key(req_env)
+
+        if self._timing_sink is not None:
+            ctx.timings = {}
+
+        request_start = None
+        if ctx.timings is not None or self.metrics is not None:
+            request_start = clock()
+
+        in_stream = None
+        if self.app.stream_requests:
+            in_stream = _get_soap_request_stream(req_env)
 
-        in_object = self.get_in_object(ctx, in_string, in_string_charset)
+        if in_stream is None:
+            in_string, in_string_charset = _reconstruct_soap_request(req_env,
+                                                                         ctx)
+            in_object = self.get_in_object(ctx, in_string, in_string_charset)
+
+        else:
+            in_stream, in_string_charset = in_stream
+            in_object = self.get_in_object_stream(ctx, in_stream,
+                                                            in_string_charset)
 
         return_code = HTTP_200
+        out_string = None
+        cache = None
+
         if ctx.in_error:
             out_object = ctx.in_error
             return_code = HTTP_500
         else:
             assert ctx.service != None
-            out_object = self.get_out_object(ctx, in_object)
-            if ctx.out_error:
-                out_object = ctx.out_error
-                return_code = HTTP_500
 
-        out_string = self.get_out_string(ctx, out_object)
+            # see soaplib.core.cache
+            cache = ctx.descriptor.cache
+            if cache is not None:
+                cache_key = cache.get_key(ctx, in_object)
+                out_string = cache.get(cache_key)
+
+            if out_string is None:
+                out_object = self.get_out_object(ctx, in_object)
+                if ctx.out_error:
+                    out_object = ctx.out_error
+                    return_code = HTTP_500
+
+        if out_string is None:
+            if self._stream_response and cache is None and \
+                                            self.can_stream(ctx, out_object):
+                chunks = self.__stream_soap_response(req_env, start_response,
+                                                 ctx, return_code, out_object)
+                if request_start is not None:
+                    chunks = self.__finish_streamed(ctx, req_env, chunks,
+                                                                request_start)
+                return chunks
+
+            out_string = self.get_out_string(ctx, out_object)
+
+            if cache is not None and return_code is HTTP_200:
+                cache.set(cache_key, out_string)
 
         http_resp_headers = {
             'Content-Type': 'text/xml',
@@ -163,16 +378,84 @@ class Application(Base):
             if len(out_type_info) == 1:
                 out_object = [out_object]
 
+            if ctx.timings is not None:
+                start = clock()
+
             http_resp_headers, out_string = apply_mtom(http_resp_headers,
                     out_string, ctx.descriptor.out_message._type_info.values(),
                     out_object)
 
+            if ctx.timings is not None:
+                ctx.add_timing('mime', start)
+
         # initiate the response
         http_resp_headers['Content-Length'] = str(len(out_string))
         start_response(return_code, http_resp_headers.items())
 
+        if request_start is not None:
+            self.__finish(ctx, req_env, request_start, len(out_string))
+
         return [out_string]
 
+    def __finish(self, ctx, req_env, request_start, response_bytes):
+        '''Passes the context of a request to the timing sink, and counts the
+        request in the metrics.
+        '''
+
+        if ctx.timings is not None:
+            ctx.add_timing('total', request_start)
+            self._timing_sink(ctx)
+
+        if self.metrics is not None:
+            operation = ''
+            if ctx.descriptor is not None:
+                operation = ctx.descriptor.name
+
+            faultcode = None
+            if ctx.in_error is not None:
+                faultcode = ctx.in_error.faultcode
+            elif ctx.out_error is not None:
+                faultcode = ctx.out_error.faultcode
+
+            self.metrics.record(operation, clock() - request_start, faultcode,
+                    int(req_env.get('CONTENT_LENGTH') or 0), response_bytes)
+
+    def __finish_streamed(self, ctx, req_env, chunks, request_start):
+        '''Passes the chunks of a streamed response through, then finishes
+        the request like __finish.
+        '''
+
+        response_bytes = 0
+        for chunk in chunks:
+            response_bytes += len(chunk)
+            yield chunk
+
+        self.__finish(ctx, req_env, request_start, response_bytes)
+
+    def __stream_soap_response(self, req_env, start_response, ctx, return_code,
+                                                                   out_object):
+        http_resp_headers = {
+            'Content-Type': 'text/xml',
+        }
+
+        # implementation hook. the response isn't serialized yet.
+        self.on_wsgi_return(req_env, http_resp_headers, None)
+
+        # there's no Content-Length, so the wsgi server is free to send the
+        # response with chunked transfer encoding.
+        start_response(return_code, http_resp_headers.items())
+
+        return self.get_out_chunks(ctx, out_object)
+
+    def get_client_key(self, environ):
+        '''Returns the key that identifies the client of the request, for
+        soaplib.core.validation.PerClientKey. This is the remote address by
+        default. Override it to use e.g. an api key header instead.
+
+        @param the wsgi environment
+        '''
+        return environ.get('REMOTE_ADDR')
+
     def on_wsgi_call(self, environ):
         '''This is the first method called when this WSGI app is invoked.
 
@@ -202,6 +485,7 @@ class Application(Base):
 
         @param the wsgi environment
         @param http response headers as dict
-        @param return string of the soap request
+        @param return string of the soap request, or None when the response
+        is streamed
         '''
         pass
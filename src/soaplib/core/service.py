@@ -25,6 +25,7 @@ from lxml import etree
 
 from soaplib.core import namespaces, styles
 from soaplib.core import MethodDescriptor
+from soaplib.core.model.clazz import Array
 from soaplib.core.model.clazz import ClassModel as Message
 from soaplib.core.model.clazz import ClassModelMeta as MessageMeta
 from soaplib.core.model.clazz import TypeInfo
@@ -58,6 +59,32 @@ def _produce_input_message(ns, f, params, kparams):
 
     return message
 
+def _produce_stream_param(f, in_message, kparams):
+    '''Returns the name of the input message member that's deserialized
+    lazily, if any. Only the last parameter can be streamed, and only when
+    it's an Array.
+    '''
+
+    _stream_param = kparams.get('_stream_param', None)
+    if _stream_param is None:
+        return None
+
+    _in_variable_names = kparams.get('_in_variable_names', {})
+    member_name = _in_variable_names.get(_stream_param, _stream_param)
+
+    member_names = in_message._type_info.keys()
+    if len(member_names) == 0 or member_names[-1] != member_name:
+        raise ValueError("%s: only the last parameter can be streamed, "
+                         "not %r" % (f.func_name, _stream_param))
+
+    # customized types are clones, not subclasses, of the original type.
+    member = in_message._type_info[member_name]
+    if not issubclass(getattr(member, '_is_clone_of', member), Array):
+        raise ValueError("%s: the streamed parameter %r must be an Array" %
+                                                   (f.func_name, _stream_param))
+
+    return member_name
+
 def _produce_rpc_output_message(ns, f, params, kparams):
     _returns = kparams.get('_returns')
 
@@ -191,6 +218,20 @@ def soap(*params, **kparams):
 
 
                 _faults = kparams.get('_faults', [])
+                _stream_param = _produce_stream_param(f, in_message, kparams)
+                _validation = kparams.get('_validation', None)
+                _lazy = kparams.get('_lazy', False)
+                _records = kparams.get('_records', False)
+                _cache = kparams.get('_cache', None)
+                _coalesce = kparams.get('_coalesce', False)
+                _coalesce_per_client = kparams.get('_coalesce_per_client',
+                                                                         True)
+
+                # the cached responses are sent as they are.
+                if _cache is not None and (_mtom or _stream_param):
+                    raise ValueError("%s: the responses of methods with mtom "
+                            "or streamed parameters can't be cached" %
+                                                                 f.func_name)
 
                 if _in_header :
                     _in_header.resolve_namespace(_in_header, ns)
@@ -211,6 +252,13 @@ def soap(*params, **kparams):
                                           _faults,
                                           _style,
                                           _port_type,
+                                          _stream_param,
+                                          _validation,
+                                          _lazy,
+                                          _records,
+                                          _cache,
+                                          _coalesce,
+                                          _coalesce_per_client,
                                          )
             return retval
 
@@ -269,6 +317,7 @@ def document(*params, **kparams):
 
 
 _public_methods_cache = {}
+_method_index_cache = {}
 
 class DefinitionBase(object):
     '''
@@ -300,6 +349,16 @@ class DefinitionBase(object):
         self.port_types = cls.__port_types__
         self.environ = environ
 
+    def reset(self, environ=None):
+        '''Prepares a reused instance for a new request. Called by
+        Application.get_service when service instances are pooled.
+
+        @param the environment of the new request
+        '''
+        self.in_header = None
+        self.out_header = None
+        self.environ = environ
+
     @classmethod
     def get_service_class_name(cls):
         return cls.__name__
@@ -386,19 +445,35 @@ class DefinitionBase(object):
 
         return public_methods
 
-    def get_method(self, name):
-        '''Returns the metod descriptor based on element name or soap action.'''
+    def build_method_index(self):
+        '''Returns a dict that maps element names and soap actions to method
+        descriptors. Element names take precedence over soap actions.'''
+
+        method_index = {}
 
         for method in self.public_methods:
             type_name = method.in_message.get_type_name()
-            if '{%s}%s' % (self.get_tns(), type_name) == name:
-                return method
+            method_index.setdefault('{%s}%s' % (self.get_tns(), type_name),
+                                                                        method)
 
         for method in self.public_methods:
-            if method.public_name == name:
-                return method
+            method_index.setdefault(method.public_name, method)
+
+        return method_index
+
+    def get_method(self, name):
+        '''Returns the metod descriptor based on element name or soap action.'''
+
+        key = (self.__class__, self.get_tns())
+        method_index = _method_index_cache.get(key, None)
+        if method_index is None:
+            method_index = _method_index_cache[key] = self.build_method_index()
+
+        method = method_index.get(name, None)
+        if method is None:
+            raise Exception('Method "%s" not found' % name)
 
-        raise Exception('Method "%s" not found' % name)
+        return method
 
     def _has_callbacks(self):
         '''Determines if this object has callback methods or not.'''
@@ -18,6 +18,7 @@
 #
 
 import datetime
+import threading
 import unittest
 
 from lxml import etree
@@ -31,6 +32,8 @@ from soaplib.core.model.primitive import String
 
 from soaplib.core import service
 from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core import ValidatingApplication
 Application.transport = 'test'
 
 from soaplib.core.service import soap
@@ -121,6 +124,17 @@ class MultipleReturnService(service.DefinitionBase):
     def multi(self, s):
         return s, 'a', 'b'
 
+class RenamedService(service.DefinitionBase):
+    @soap(String, _returns=String, _in_message='renamedRequest',
+                                   _public_name='urn:renamed')
+    def renamed(self, s):
+        return s
+
+class StreamingService(service.DefinitionBase):
+    @soap(String, Array(Person), _stream_param='people')
+    def import_people(self, s, people):
+        pass
+
 class Test(unittest.TestCase):
     '''Most of the service tests are performed through the interop tests.'''
 
@@ -167,5 +181,257 @@ class Test(unittest.TestCase):
         svc = Application([MultipleNamespaceService], 'tns')
         wsdl = svc.get_wsdl("URL")
 
+    def test_validating_multiple_ns(self):
+        app = ValidatingApplication([MultipleNamespaceService], 'tns')
+
+        def request(i):
+            return etree.fromstring('''
+                <tns:a xmlns:tns="tns" xmlns:s1="TestService.NS1">
+                    <tns:t1><s1:i>%s</s1:i><s1:s>x</s1:s></tns:t1>
+                </tns:a>''' % i)
+
+        app.validate(request(1))
+
+        from soaplib.core._base import ValidationError
+        self.assertRaises(ValidationError, app.validate, request('x'))
+
+    def test_validating_native(self):
+        from soaplib.core._base import ValidationError
+
+        class CodeService(service.DefinitionBase):
+            @soap(String(max_len=3, min_occurs=1), Integer, _returns=String)
+            def code(self, s, i):
+                return s
+
+        schema_app = ValidatingApplication([CodeService], 'tns')
+        native_app = ValidatingApplication([CodeService], 'tns',
+                                                        _validator='native')
+
+        def request(s):
+            return etree.fromstring('''
+                <SOAP-ENV:Envelope
+                        xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"
+                        xmlns:tns="tns">
+                    <SOAP-ENV:Body>
+                        <tns:code>%s<tns:i>1</tns:i></tns:code>
+                    </SOAP-ENV:Body>
+                </SOAP-ENV:Envelope>''' % s)
+
+        for app in (schema_app, native_app):
+            in_object = app.deserialize_soap(MethodContext(), app.IN_WRAPPER,
+                                                   request('<tns:s>abc</tns:s>'))
+            self.assertEquals(in_object.s, 'abc')
+            self.assertEquals(in_object.i, 1)
+
+            for s in ('<tns:s>abcd</tns:s>', ''):
+                try:
+                    app.deserialize_soap(MethodContext(), app.IN_WRAPPER,
+                                                                    request(s))
+                except ValidationError, e:
+                    self.assertEquals(e.faultcode,
+                                              'senv:Client.SchemaValidation')
+                else:
+                    self.fail('%r was not rejected' % s)
+
+        self.assertRaises(ValueError, ValidatingApplication, [CodeService],
+                                                   'tns', _validator='other')
+
+    def test_validation_policy(self):
+        from soaplib.core._base import ValidationError
+        from soaplib.core.validation import Always
+        from soaplib.core.validation import Never
+        from soaplib.core.validation import PerClientKey
+        from soaplib.core.validation import Sampled
+
+        class PolicyService(service.DefinitionBase):
+            @soap(String(max_len=3), _returns=String)
+            def trusted(self, s):
+                return s
+
+            @soap(String(max_len=3), _returns=String, _validation=Always())
+            def sensitive(self, s):
+                return s
+
+        def call(app, method, client_key=None):
+            ctx = MethodContext()
+            ctx.client_key = client_key
+            envelope = etree.fromstring('''
+                <SOAP-ENV:Envelope
+                        xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"
+                        xmlns:tns="tns">
+                    <SOAP-ENV:Body>
+                        <tns:%s><tns:s>abcd</tns:s></tns:%s>
+                    </SOAP-ENV:Body>
+                </SOAP-ENV:Envelope>''' % (method, method))
+
+            return app.deserialize_soap(ctx, app.IN_WRAPPER, envelope)
+
+        policy = PerClientKey({'internal': Never()})
+        for validator in ('schema', 'native'):
+            app = ValidatingApplication([PolicyService], 'tns',
+                        _validator=validator, _validation_policy=policy)
+
+            self.assertEquals(call(app, 'trusted', 'internal').s, 'abcd')
+            self.assertRaises(ValidationError, call, app, 'trusted', 'other')
+            self.assertRaises(ValidationError, call, app, 'trusted')
+            self.assertRaises(ValidationError, call, app, 'sensitive',
+                                                                   'internal')
+
+            self.assertEquals(app.validation_stats,
+                              {'validated': 3, 'skipped': 1, 'failed': 3})
+
+        app = ValidatingApplication([PolicyService], 'tns',
+                                          _validation_policy=Sampled(0))
+        self.assertEquals(call(app, 'trusted').s, 'abcd')
+        self.assertRaises(ValidationError, call, app, 'sensitive')
+
+        app.validation_policy = Sampled(1)
+        self.assertRaises(ValidationError, call, app, 'trusted')
+
+        self.assertRaises(ValueError, Sampled, 2)
+
+    def test_lazy_and_record_methods(self):
+        class LazyService(service.DefinitionBase):
+            @soap(Person, Integer, _returns=String, _lazy=True)
+            def lazy(self, person, i):
+                return person.name
+
+            @soap(Person, Integer, _returns=String)
+            def eager(self, person, i):
+                return person.name
+
+            @soap(Person, Integer, _returns=String, _records=True)
+            def record(self, person, i):
+                return person.name
+
+        def call(app, method):
+            ctx = MethodContext()
+            envelope = etree.fromstring('''
+                <SOAP-ENV:Envelope
+                        xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"
+                        xmlns:tns="tns" xmlns:s="TestService">
+                    <SOAP-ENV:Body>
+                        <tns:%s><tns:person><s:addresses>
+                            <s:Address><s:zip>1</s:zip></s:Address>
+                        </s:addresses><s:name>n</s:name></tns:person>
+                        <tns:i>2</tns:i></tns:%s>
+                    </SOAP-ENV:Body>
+                </SOAP-ENV:Envelope>''' % (method, method))
+
+            return app.deserialize_soap(ctx, app.IN_WRAPPER, envelope)
+
+        for app in (Application([LazyService], 'tns'),
+                    ValidatingApplication([LazyService], 'tns')):
+            in_object = call(app, 'lazy')
+            person = in_object.person
+            self.assertEquals(sorted(person.__dict__), ['_lazy_elements'])
+            self.assertEquals(person.name, 'n')
+            self.assertEquals(person.addresses[0].zip, 1)
+            self.failUnless('_lazy_elements' in person.addresses[0].__dict__)
+            self.assertEquals(in_object.i, 2)
+
+            person = call(app, 'eager').person
+            self.failIf('_lazy_elements' in person.__dict__)
+
+            person, i = call(app, 'record')
+            self.assertEquals((person.name, i), ('n', 2))
+            self.assertEquals(person.addresses[0].zip, 1)
+            self.failUnless(isinstance(person.addresses[0], tuple))
+
+    def test_method_routes(self):
+        app = Application([RenamedService, MultipleReturnService], 'tns')
+
+        for key in ('{tns}renamedRequest', '{tns}renamed', 'renamed',
+                                                                'urn:renamed'):
+            service_class, descriptor = app.method_routes[key]
+            self.assertEquals(service_class, RenamedService)
+            self.assertEquals(descriptor.name, 'renamed')
+            self.assertEquals(app.get_service_class(key), RenamedService)
+
+        self.assertEquals(app.get_service_class('{tns}multi'),
+                                                        MultipleReturnService)
+
+    def test_get_method(self):
+        app = Application([RenamedService], 'tns')
+        srv = RenamedService()
+
+        self.assertEquals(srv.get_method('{tns}renamedRequest').name,
+                                                                    'renamed')
+        self.assertEquals(srv.get_method('urn:renamed').name, 'renamed')
+        self.assertRaises(Exception, srv.get_method, '{tns}nonexistent')
+
+    def test_dispatch_renamed_message(self):
+        app = Application([RenamedService], 'tns')
+
+        envelope = etree.fromstring("""
+            <SOAP-ENV:Envelope
+                    xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"
+                    xmlns:tns="tns">
+                <SOAP-ENV:Body>
+                    <tns:renamedRequest><tns:s>x</tns:s></tns:renamedRequest>
+                </SOAP-ENV:Body>
+            </SOAP-ENV:Envelope>
+        """)
+
+        ctx = MethodContext()
+        in_object = app.deserialize_soap(ctx, app.IN_WRAPPER, envelope)
+
+        self.assertEquals(ctx.service_class, RenamedService)
+        self.assertEquals(ctx.descriptor.name, 'renamed')
+        self.assertEquals(in_object.s, 'x')
+
+    def test_service_not_pooled_by_default(self):
+        app = Application([TestService], 'tns')
+
+        self.failIf(app.get_service(TestService) is
+                                                app.get_service(TestService))
+
+    def test_pooled_service_reset(self):
+        app = Application([TestService], 'tns', _pool_services=True)
+
+        srv = app.get_service(TestService)
+        srv.in_header = srv.out_header = object()
+
+        environ = {}
+        same_srv = app.get_service(TestService, environ)
+        self.failUnless(same_srv is srv)
+        self.failUnless(srv.in_header is None)
+        self.failUnless(srv.out_header is None)
+        self.failUnless(srv.environ is environ)
+
+    def test_pooled_service_per_thread(self):
+        app = Application([TestService], 'tns', _pool_services=True)
+        srv = app.get_service(TestService)
+
+        other = []
+        thread = threading.Thread(
+                      target=lambda: other.append(app.get_service(TestService)))
+        thread.start()
+        thread.join()
+
+        self.failIf(other[0] is srv)
+
+    def test_stream_param(self):
+        app = Application([StreamingService], 'tns')
+        descriptor = app.method_routes['import_people'][1]
+        self.assertEquals(descriptor.stream_param, 'people')
+        self.failUnless(app.stream_requests)
+
+        self.failIf(Application([TestService], 'tns').stream_requests)
+
+    def test_stream_param_invalid(self):
+        class NotLast(service.DefinitionBase):
+            @soap(Array(String), String, _stream_param='a')
+            def m(self, a, s):
+                pass
+
+        class NotArray(service.DefinitionBase):
+            @soap(String, _stream_param='s')
+            def m(self, s):
+                pass
+
+        self.assertRaises(ValueError, Application, [NotLast], 'tns')
+        self.assertRaises(ValueError, Application, [NotArray], 'tns')
+
 if __name__ == '__main__':
     unittest.main()
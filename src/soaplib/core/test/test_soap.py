@@ -32,6 +32,8 @@ from soaplib.core.model.primitive import String
 from soaplib.core.model.clazz import ClassModel as Message
 from soaplib.core._base import _from_soap
 from soaplib.core._base import _parse_xml_string
+from soaplib.core._base import _ParserPool
+from soaplib.core._base import resolve_hrefs
 
 class Address(ClassModel):
     street = String
@@ -111,6 +113,87 @@ xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
 
         # quick and dirty test href reconstruction
         self.assertEquals(len(payload[0]), 2)
+        self.assertEquals(payload[0][0][0].text, 'somemachine')
+        self.assertEquals(payload[0][1][1].text, 'user2')
+
+    def test_href_shared(self):
+        root = etree.fromstring('''<a>
+            <b href="#id1"/>
+            <c href="#id1"/>
+            <d id="id1" x="y"><e>text</e></d>
+        </a>''')
+
+        resolve_hrefs(root)
+
+        for e in root[:2]:
+            self.assertEquals(e.get('href'), None)
+            self.assertEquals(e.get('x'), 'y')
+            self.assertEquals(e[0].text, 'text')
+
+    def test_href_chained(self):
+        root = etree.fromstring('''<a>
+            <b href="#id1"/>
+            <c id="id1"><d href="#id2"/></c>
+            <e id="id2">text</e>
+        </a>''')
+
+        resolve_hrefs(root)
+
+        self.assertEquals(root[0][0].text, 'text')
+
+    def test_href_cycle(self):
+        root = etree.fromstring('''<a>
+            <b href="#id1"/>
+            <c id="id1"><d href="#id2"/></c>
+            <e id="id2"><f href="#id1"/></e>
+        </a>''')
+
+        resolve_hrefs(root)
+
+        self.assertEquals(root[0][0][0].get('href'), '#id1')
+
+    def test_href_deep(self):
+        root = etree.Element('a')
+        parent = root
+        for i in range(5000):
+            parent = etree.SubElement(parent, 'b')
+        etree.SubElement(parent, 'c').set('href', '#id1')
+        etree.SubElement(root, 'd', id='id1').text = 'text'
+
+        resolve_hrefs(root)
+
+        self.assertEquals(parent[0].text, 'text')
+
+    def test_parse_charset(self):
+        envelope_string = ('<?xml version="1.0" encoding="iso-8859-9"?>'
+                           '<a>\xfc &lt;b&gt; &amp;</a>')
+
+        root, xmlids = _parse_xml_string(envelope_string, 'iso-8859-9')
+        self.assertEquals(root.text, u'\xfc <b> &')
+
+        # the declared encoding is used when there's no charset
+        root, xmlids = _parse_xml_string(envelope_string)
+        self.assertEquals(root.text, u'\xfc <b> &')
+
+    def test_parse_wrong_charset(self):
+        envelope_string = '<?xml version="1.0" encoding="utf-8"?><a>\xc3\xbc</a>'
+
+        root, xmlids = _parse_xml_string(envelope_string, 'ascii')
+        self.assertEquals(root.text, u'\xfc')
+
+    def test_parse_unicode(self):
+        envelope_string = u'<?xml version="1.0" encoding="utf-8"?><a>\xfc</a>'
+
+        root, xmlids = _parse_xml_string(envelope_string)
+        self.assertEquals(root.text, u'\xfc')
+
+    def test_parser_pool(self):
+        pool = _ParserPool({'huge_tree': True})
+
+        self.assertEquals(pool.options['huge_tree'], True)
+        self.assertEquals(pool.options['resolve_entities'], False)
+        self.failUnless(pool.get_parser('utf8') is pool.get_parser('utf8'))
+        self.failIf(pool.get_parser('utf8') is pool.get_parser())
 
     def test_namespaces(self):
         m = Message.produce(
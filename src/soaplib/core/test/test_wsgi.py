@@ -0,0 +1,959 @@
+#!/usr/bin/env python
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+
+import gzip
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from StringIO import StringIO
+
+from lxml import etree
+
+from soaplib.core import Application
+from soaplib.core import MethodContext
+from soaplib.core import ValidatingApplication
+from soaplib.core import namespaces
+from soaplib.core.cache import MemoryCache
+from soaplib.core.cache import SqliteCache
+from soaplib.core.cache import get_request_key
+from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import ClassModel
+from soaplib.core.model.clazz import XMLAttribute
+from soaplib.core.model.enum import Enum
+from soaplib.core.model.exception import Fault
+from soaplib.core.model.primitive import Double
+from soaplib.core.model.primitive import Integer
+from soaplib.core.model.primitive import String
+from soaplib.core.model.primitive import get_string_policy
+from soaplib.core.server import wsgi
+from soaplib.core.service import DefinitionBase
+from soaplib.core.service import soap
+from soaplib.core.timing import TimingAggregator
+
+class Item(ClassModel):
+    __namespace__ = "TestWsgi"
+
+    i = Integer
+    s = String
+    n = String(min_occurs=1)
+    t = Array(String)
+
+class ItemService(DefinitionBase):
+    @soap(Integer, _returns=Array(Item))
+    def items(self, count):
+        for i in range(count):
+            yield Item(i=i, s='item %d' % i, t=['a', 'b'])
+
+    @soap(Integer, _returns=String)
+    def fail(self, count):
+        raise Fault('Server', 'fail')
+
+class Leaf(ClassModel):
+    __namespace__ = "TestWsgi.Node"
+
+    text = String
+
+class Node(ClassModel):
+    __namespace__ = "TestWsgi.Node"
+
+    lang = XMLAttribute('xs:string')
+    text = String
+    items = Array(Item)
+    children = Array(Leaf)
+
+class Tagged(ClassModel):
+    __namespace__ = "TestWsgi"
+
+    text = String
+    tags = String(max_occurs='unbounded', min_occurs=1)
+
+Color = Enum('red', 'green', type_name='Color')
+
+class TextService(DefinitionBase):
+    @soap(_returns=Array(Node))
+    def nodes(self):
+        return [
+            Node(lang='e"n\t', text=u'caf\xe9 & <b>\r\n', items=[
+                Item(i=1, s='', t=['a', None, '>']),
+                Item(i=2, n='n'),
+            ], children=[Leaf(), Leaf(text='leaf')]),
+            None,
+            Node(items=[], children=[]),
+        ]
+
+    @soap(_returns=Array(Tagged))
+    def tagged(self):
+        return [Tagged(text='untagged'), Tagged(tags=['a', None])]
+
+    @soap(_returns=Array(Tagged))
+    def tagged_columns(self):
+        return {'text': ['untagged', None], 'tags': [None, ['a']]}
+
+    @soap(_returns=Array(Node))
+    def shared_nodes(self):
+        # immutable instances are serialized once.
+        node = Node(lang='en', text='shared', children=[Leaf(text='leaf')])
+        node.__immutable__ = True
+
+        return [node, Node(text='other'), node]
+
+    @soap(_returns=Array(Node))
+    def node_columns(self):
+        return {
+            'lang': ['en', None],
+            'text': [u'caf\xe9 & <b>', None],
+            'items': [[Item(i=1, t=['a', None])], None],
+        }
+
+    @soap(_returns=(Integer, String))
+    def pair(self):
+        return 1, None
+
+    @soap(_returns=Color)
+    def color(self):
+        return Color.red
+
+    @soap(_returns=String)
+    def invalid(self):
+        return 'a\x01'
+
+class EchoService(DefinitionBase):
+    @soap(Array(Node), _returns=Array(Node), _in_header=Leaf)
+    def echo_nodes(self, nodes):
+        if self.in_header is not None:
+            nodes.append(Node(text=self.in_header.text))
+
+        return nodes
+
+    @soap(Color, Integer, _returns=(Color, Integer))
+    def echo_color(self, color, i):
+        return color, i
+
+class _TreeCounter(Application):
+    trees = 0
+
+    def serialize_soap(self, ctx, wrapper, out_object):
+        self.trees += 1
+        return Application.serialize_soap(self, ctx, wrapper, out_object)
+
+class ImportService(DefinitionBase):
+    @soap(String, Array(Item), _stream_param='items', _returns=Integer)
+    def import_items(self, name, items):
+        assert name == 'import'
+        assert not isinstance(items, list)
+
+        return sum([item.i for item in items])
+
+class _GeneratedRequest(object):
+    '''A file-like object that generates an import_items request with the
+    given number of items as it's read.
+    '''
+
+    def __init__(self, count):
+        self.parts = self.__generate(count)
+        self.data = ''
+        self.read_size = 0
+
+    def __generate(self, count):
+        yield ('<e:Envelope xmlns:e="%s" xmlns:tns="tns" xmlns:i="TestWsgi">'
+                 '<e:Body><tns:import_items><tns:name>import</tns:name>'
+                 '<tns:items>' % namespaces.ns_soap_env)
+
+        for i in xrange(count):
+            yield '<i:Item><i:i>%d</i:i><i:s>item %d</i:s></i:Item>' % (i, i)
+
+        yield '</tns:items></tns:import_items></e:Body></e:Envelope>'
+
+    def read(self, size=-1):
+        for part in self.parts:
+            self.data += part
+            if len(self.data) >= size:
+                break
+
+        retval, self.data = self.data[:size], self.data[size:]
+        self.read_size += len(retval)
+
+        return retval
+
+def _make_environ(method, count):
+    body = """<?xml version='1.0' encoding='UTF-8'?>
+        <SOAP-ENV:Envelope
+                xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"
+                xmlns:tns="tns">
+            <SOAP-ENV:Body>
+                <tns:%s><tns:count>%d</tns:count></tns:%s>
+            </SOAP-ENV:Body>
+        </SOAP-ENV:Envelope>""" % (method, count, method)
+
+    return {
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'text/xml; charset=utf-8',
+    }
+
+def _make_wsdl_environ(host, **headers):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'QUERY_STRING': 'wsdl',
+        'PATH_INFO': '/',
+        'HTTP_HOST': host,
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+    }
+    environ.update(headers)
+
+    return environ
+
+class Test(unittest.TestCase):
+    def __get_wsdl(self, server, host, **headers):
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        body = ''.join(server(_make_wsdl_environ(host, **headers),
+                                                             start_response))
+
+        return response, body
+
+    def test_wsdl_conditional(self):
+        app = Application([ItemService], 'tns')
+        server = wsgi.Application(app)
+
+        response, body = self.__get_wsdl(server, 'a.example.com')
+        headers = response['headers']
+        self.assertEquals(response['status'], wsgi.HTTP_200)
+        self.assertEquals(headers['Content-Length'], str(len(body)))
+        self.failIf('Content-Encoding' in headers)
+        self.failUnless('Last-Modified' in headers)
+        etag = headers['ETag']
+
+        response, body = self.__get_wsdl(server, 'a.example.com',
+                                             HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response['status'], wsgi.HTTP_304)
+        self.assertEquals(response['headers']['ETag'], etag)
+        self.assertEquals(body, '')
+
+        response, body = self.__get_wsdl(server, 'a.example.com',
+                                             HTTP_IF_NONE_MATCH='"other"')
+        self.assertEquals(response['status'], wsgi.HTTP_200)
+
+        response, body = self.__get_wsdl(server, 'a.example.com',
+                HTTP_IF_MODIFIED_SINCE=headers['Last-Modified'])
+        self.assertEquals(response['status'], wsgi.HTTP_304)
+
+    def test_wsdl_gzip(self):
+        app = Application([ItemService], 'tns')
+        server = wsgi.Application(app)
+
+        response, plain = self.__get_wsdl(server, 'a.example.com')
+        response, body = self.__get_wsdl(server, 'a.example.com',
+                                     HTTP_ACCEPT_ENCODING='deflate, gzip')
+
+        self.assertEquals(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEquals(response['headers']['Vary'], 'Accept-Encoding')
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO(body)).read(), plain)
+
+        response, body = self.__get_wsdl(server, 'a.example.com',
+                                     HTTP_ACCEPT_ENCODING='*, gzip;q=0')
+        self.failIf('Content-Encoding' in response['headers'])
+        self.assertEquals(body, plain)
+
+    def test_wsdl_per_host(self):
+        app = Application([ItemService], 'tns')
+        app.wsdl_cache_size = 2
+        server = wsgi.Application(app)
+
+        response, a = self.__get_wsdl(server, 'a.example.com')
+        response, b = self.__get_wsdl(server, 'b.example.com')
+        self.failUnless('http://a.example.com/' in a)
+        self.failUnless('http://b.example.com/' in b)
+        self.failIf('a.example.com' in b)
+
+        # cached documents are served as they are.
+        document = app.get_wsdl_document('http://a.example.com/?wsdl')
+        self.assertEquals(document.string, a)
+        self.failUnless(app.get_wsdl_document('http://a.example.com/?wsdl')
+                                                                  is document)
+
+        self.__get_wsdl(server, 'c.example.com')
+        self.failUnless(app.get_wsdl_document('http://a.example.com/?wsdl')
+                                                                  is document)
+        self.failIf(app.get_wsdl_document('http://b.example.com/?wsdl')
+                                                                 .string is b)
+
+    def __call_app(self, server, method, count):
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        chunks = server(_make_environ(method, count), start_response)
+
+        return response, chunks
+
+    def test_string_matches_tree(self):
+        app = _TreeCounter([TextService, ItemService], 'tns')
+        tree_server = wsgi.Application(app)
+        string_server = wsgi.Application(app, _string_response=True)
+
+        for method, uses_tree in (('nodes', False), ('node_columns', False),
+                                   ('shared_nodes', False), ('pair', False),
+                            ('tagged', False), ('tagged_columns', False),
+                         ('items', False), ('color', True), ('fail', True)):
+            tree_response, tree_chunks = self.__call_app(tree_server,
+                                                                  method, 3)
+
+            app.trees = 0
+            string_response, string_chunks = self.__call_app(string_server,
+                                                                  method, 3)
+            self.assertEquals(app.trees, int(uses_tree))
+
+            self.assertEquals(string_response, tree_response)
+            self.assertEquals(''.join(string_chunks), ''.join(tree_chunks))
+
+        self.assertRaises(ValueError, self.__call_app, string_server,
+                                                               'invalid', 0)
+
+    def test_string_response_threads(self):
+        app = Application([TextService, ItemService], 'tns')
+        server = wsgi.Application(app, _string_response=True)
+        errors = []
+
+        def call():
+            try:
+                for i in range(20):
+                    response, chunks = self.__call_app(server, 'nodes', 0)
+                    etree.fromstring(''.join(chunks))
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for i in range(8)]
+        for t in threads:
+            t.start()
+
+        # the serializer is reset while the responses are written.
+        for i in range(20):
+            app.set_namespace_prefix('urn:threads:%d' % i, 'threads%d' % i)
+            time.sleep(0.001)
+
+        for t in threads:
+            t.join()
+
+        self.assertEquals(errors, [])
+
+    def __echo(self, server, body):
+        ctx = MethodContext()
+        in_object = server.get_in_object(ctx, body, 'utf-8')
+        if ctx.in_error:
+            out_object = ctx.in_error
+        else:
+            out_object = server.get_out_object(ctx, in_object)
+
+        return ctx, server.get_out_string(ctx, out_object)
+
+    def test_event_request_matches_tree(self):
+        app = Application([EchoService], 'tns')
+        tree_server = wsgi.Application(app)
+        event_server = wsgi.Application(app, _event_request=True)
+
+        envelope = ('<e:Envelope xmlns:e="%s" xmlns:tns="tns" '
+                             'xmlns:n="TestWsgi.Node">%%s<e:Body>%%s</e:Body>'
+                             '</e:Envelope>' % namespaces.ns_soap_env)
+
+        message = etree.Element('{tns}echo_nodes')
+        Array(Node).to_parent_element(TextService().nodes(), 'tns', message,
+                                                                    'nodes')
+        message.append(etree.Comment('comment'))
+        etree.SubElement(message, '{tns}unknown').text = 'x'
+        nodes = etree.tostring(message, pretty_print=True)
+
+        header = '<e:Header><n:Leaf><n:text>header</n:text></n:Leaf></e:Header>'
+
+        requests = (
+            (envelope % ('', nodes), False),
+            (envelope % (header, nodes), False),
+            (envelope % ('', '<tns:echo_nodes/>'), False),
+            (envelope % ('', '<tns:echo_color><tns:color>red</tns:color>'
+                                 '<tns:i>1</tns:i></tns:echo_color>'), False),
+            (envelope % ('', '<tns:echo_color><tns:color>red</tns:color>'
+                                 '<tns:i href="#i"/></tns:echo_color>'
+                                 '<tns:i id="i">2</tns:i>'), True),
+            # the tree path reports the error before setting in_body_xml.
+            (envelope % ('', '<tns:unknown/>'), False),
+        )
+
+        for body, uses_tree in requests:
+            tree_ctx, tree_string = self.__echo(tree_server, body)
+            event_ctx, event_string = self.__echo(event_server, body)
+
+            self.assertEquals(event_ctx.in_body_xml is not None, uses_tree)
+            self.assertEquals(event_string, tree_string)
+
+        self.assertRaises(etree.XMLSyntaxError, self.__echo, event_server,
+                                                          '<e:Envelope>')
+
+    def test_string_policy(self):
+        texts = []
+
+        def read(nodes):
+            texts.append([node.text for node in nodes])
+            return len(texts[-1])
+
+        class PolicyService(DefinitionBase):
+            @soap(Array(Node), _returns=Integer)
+            def echo_nodes(self, nodes):
+                return read(nodes)
+
+            # the members are read after the request is deserialized.
+            @soap(Array(Node), _returns=Integer, _lazy=True)
+            def lazy_nodes(self, nodes):
+                return read(nodes)
+
+        class StreamPolicyService(DefinitionBase):
+            # the items are read after the request is deserialized.
+            @soap(Array(Node), _returns=Integer, _stream_param='nodes')
+            def stream_nodes(self, nodes):
+                return read(nodes)
+
+        expected = {
+            None: ((unicode, str), [u'caf\xe9', 'cafe']),
+            'unicode': ((unicode, unicode), [u'caf\xe9', u'cafe']),
+            'bytes': ((str, str), ['caf\xc3\xa9', 'cafe']),
+        }
+
+        routes = [
+            (PolicyService, 'echo_nodes'),
+            (PolicyService, 'lazy_nodes'),
+            (StreamPolicyService, 'stream_nodes'),
+        ]
+
+        for service, method_name in routes:
+            message = etree.Element('{tns}%s' % method_name)
+            Array(Node).to_parent_element([Node(text=u'caf\xe9'),
+                                           Node(text='cafe')], 'tns', message,
+                                                                       'nodes')
+            body = ('<e:Envelope xmlns:e="%s"><e:Body>%s</e:Body>'
+                    '</e:Envelope>' % (namespaces.ns_soap_env,
+                                                     etree.tostring(message)))
+
+            for policy, (types, values) in expected.items():
+                app = Application([service], 'tns', _string_policy=policy)
+                for event_request in (False, True):
+                    server = wsgi.Application(app,
+                                                _event_request=event_request)
+
+                    environ = _make_environ(method_name, 0)
+                    environ['wsgi.input'] = StringIO(body)
+                    environ['CONTENT_LENGTH'] = str(len(body))
+                    del texts[:]
+                    ''.join(server(environ, lambda status, headers: None))
+
+                    self.assertEquals(texts, [values])
+                    self.assertEquals(tuple(map(type, texts[0])), types)
+
+                    # the application doesn't leave its policy behind.
+                    self.assertEquals(get_string_policy(), None)
+
+                # neither do applications that aren't called by a transport.
+                ctx = MethodContext()
+                in_object = app.deserialize_soap_string(ctx, body)
+                self.assertEquals(get_string_policy(), None)
+
+                del texts[:]
+                getattr(ctx.service, method_name)(*in_object)
+                self.assertEquals(texts, [values])
+                self.assertEquals(tuple(map(type, texts[0])), types)
+
+        self.assertRaises(ValueError, Application, [EchoService], 'tns',
+                                                     _string_policy='ascii')
+
+    def __check_cache(self, cache):
+        calls = []
+
+        class CachedService(DefinitionBase):
+            @soap(Integer, _returns=Array(Item), _cache=cache)
+            def items(self, count):
+                calls.append(count)
+                if count < 0:
+                    raise Fault('Server', 'negative')
+                return [Item(i=i, s='item %d' % i) for i in range(count)]
+
+        server = wsgi.Application(Application([CachedService], 'tns'))
+
+        first = ''.join(self.__call_app(server, 'items', 3)[1])
+        second = ''.join(self.__call_app(server, 'items', 3)[1])
+        self.__call_app(server, 'items', 2)
+        self.assertEquals(second, first)
+        self.assertEquals(calls, [3, 2])
+        self.assertEquals((cache.stats['hits'], cache.stats['misses']),
+                                                                     (1, 2))
+
+        # faults are not cached
+        self.__call_app(server, 'items', -1)
+        response, chunks = self.__call_app(server, 'items', -1)
+        self.assertEquals(response['status'], wsgi.HTTP_500)
+        self.assertEquals(calls, [3, 2, -1, -1])
+
+        # the least recently used response is evicted.
+        self.__call_app(server, 'items', 3)
+        self.__call_app(server, 'items', 1)
+        self.assertEquals(cache.stats['evictions'], 1)
+        self.assertEquals(len(cache), 2)
+        self.__call_app(server, 'items', 2)
+        self.assertEquals(calls, [3, 2, -1, -1, 1, 2])
+
+        now = cache.clock()
+        cache.clock = lambda: now + 3600
+        self.__call_app(server, 'items', 1)
+        self.assertEquals(calls, [3, 2, -1, -1, 1, 2, 1])
+        self.assertEquals(cache.stats['expirations'], 1)
+
+    def test_memory_cache(self):
+        self.__check_cache(MemoryCache(max_size=2, ttl=60))
+
+    def test_cache_per_client(self):
+        for per_client, expected in ((True, [1, 1]), (False, [1])):
+            calls = []
+
+            class CachedService(DefinitionBase):
+                @soap(Integer, _returns=Integer,
+                                _cache=MemoryCache(per_client=per_client))
+                def echo(self, count):
+                    calls.append(count)
+                    return count
+
+            server = wsgi.Application(Application([CachedService], 'tns'))
+            for address in ('10.0.0.1', '10.0.0.2', '10.0.0.1'):
+                environ = _make_environ('echo', 1)
+                environ['REMOTE_ADDR'] = address
+                ''.join(server(environ, lambda status, headers: None))
+
+            self.assertEquals(calls, expected)
+
+    def test_request_key_buffers(self):
+        class BufferService(DefinitionBase):
+            @soap(Array(Double, buffer='array'), _returns=Integer)
+            def sum_array(self, values):
+                return int(sum(values))
+
+            @soap(Array(Double, buffer='numpy'), _returns=Integer)
+            def sum_numpy(self, values):
+                return int(sum(values))
+
+        app = Application([BufferService], 'tns')
+
+        def get_key(method_name, values):
+            message = etree.Element('{tns}%s' % method_name)
+            Array(Double).to_parent_element(values, 'tns', message, 'values')
+            body = ('<e:Envelope xmlns:e="%s"><e:Body>%s</e:Body>'
+                    '</e:Envelope>' % (namespaces.ns_soap_env,
+                                                     etree.tostring(message)))
+
+            ctx = MethodContext()
+            in_object = app.deserialize_soap_string(ctx, body)
+
+            return get_request_key(ctx, in_object)
+
+        # the reprs of large numpy buffers elide the values in the middle.
+        values = [float(i) for i in range(5000)]
+        other_values = list(values)
+        other_values[2500] = -1.0
+
+        for method_name in ('sum_array', 'sum_numpy'):
+            self.assertEquals(get_key(method_name, values),
+                              get_key(method_name, list(values)))
+            self.assertNotEquals(get_key(method_name, values),
+                                 get_key(method_name, other_values))
+
+    def test_sqlite_cache(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+
+        try:
+            self.__check_cache(SqliteCache(path, max_size=2, ttl=60))
+
+            # other processes see the same entries.
+            cache = SqliteCache(path)
+            cache.set('key', 'value')
+            self.assertEquals(SqliteCache(path).get('key'), 'value')
+
+            # children don't reuse the connection of their parent.
+            parent = cache.get_connection()
+            read, write = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    os.close(read)
+                    child = cache.get_connection()
+                    os.write(write, str(int(cache.get('key') == 'value'
+                                                   and child is not parent)))
+                finally:
+                    os._exit(0)
+
+            os.close(write)
+            os.waitpid(pid, 0)
+            self.assertEquals(os.read(read, 1), '1')
+            os.close(read)
+
+        finally:
+            os.remove(path)
+
+    def test_coalesce(self):
+        calls = []
+        release = threading.Event()
+
+        class SlowService(DefinitionBase):
+            @soap(Integer, _returns=Array(Item), _coalesce=True)
+            def items(self, count):
+                calls.append(count)
+                release.wait()
+                if count < 0:
+                    raise Fault('Server', 'negative')
+                for i in range(count):
+                    yield Item(i=i, s='item %d' % i)
+
+        app = Application([SlowService], 'tns')
+        server = wsgi.Application(app)
+
+        def call_concurrently(count, n):
+            results = [None] * n
+            def call(i):
+                response, chunks = self.__call_app(server, 'items', count)
+                results[i] = response['status'], ''.join(chunks)
+
+            release.clear()
+            coalesced = app.coalesce_stats['coalesced']
+            threads = [threading.Thread(target=call, args=(i,))
+                                                          for i in range(n)]
+            for t in threads:
+                t.start()
+
+            # let the method return once the other requests wait for it.
+            deadline = time.time() + 10
+            while app.coalesce_stats['coalesced'] < coalesced + n - 1 \
+                                                   and time.time() < deadline:
+                time.sleep(0.001)
+            release.set()
+
+            for t in threads:
+                t.join()
+
+            return results
+
+        results = call_concurrently(3, 4)
+        self.assertEquals(calls, [3])
+        self.assertEquals(app.coalesce_stats,
+                                           {'executed': 1, 'coalesced': 3})
+        self.assertEquals(results, [results[0]] * 4)
+        self.assertEquals(results[0][0], wsgi.HTTP_200)
+        self.assertEquals(results[0][1].count('item '), 3)
+
+        # faults are shared as well.
+        results = call_concurrently(-1, 3)
+        self.assertEquals(calls, [3, -1])
+        self.assertEquals([r[0] for r in results], [wsgi.HTTP_500] * 3)
+
+        # calls that don't overlap are not coalesced.
+        self.__call_app(server, 'items', 3)
+        self.assertEquals(calls, [3, -1, 3])
+        self.assertEquals(app.coalesce_stats,
+                                           {'executed': 3, 'coalesced': 5})
+
+    def test_coalesce_per_client(self):
+        for per_client in (True, False):
+            calls = []
+            release = threading.Event()
+
+            class SlowService(DefinitionBase):
+                @soap(Integer, _returns=Integer, _coalesce=True,
+                                          _coalesce_per_client=per_client)
+                def echo(self, count):
+                    calls.append(count)
+                    release.wait()
+                    return count
+
+            app = Application([SlowService], 'tns')
+            server = wsgi.Application(app)
+
+            def call(address):
+                environ = _make_environ('echo', 1)
+                environ['REMOTE_ADDR'] = address
+                ''.join(server(environ, lambda status, headers: None))
+
+            threads = [threading.Thread(target=call, args=(address,))
+                                       for address in ('10.0.0.1', '10.0.0.2')]
+            for t in threads:
+                t.start()
+
+            # let the method return once both requests are in.
+            deadline = time.time() + 10
+            while len(calls) + app.coalesce_stats['coalesced'] < 2 \
+                                                   and time.time() < deadline:
+                time.sleep(0.001)
+            release.set()
+
+            for t in threads:
+                t.join()
+
+            if per_client:
+                self.assertEquals(calls, [1, 1])
+                self.assertEquals(app.coalesce_stats,
+                                           {'executed': 2, 'coalesced': 0})
+            else:
+                self.assertEquals(calls, [1])
+                self.assertEquals(app.coalesce_stats,
+                                           {'executed': 1, 'coalesced': 1})
+
+    def test_timings(self):
+        contexts = []
+        aggregator = TimingAggregator()
+        def sink(ctx):
+            contexts.append(ctx)
+            aggregator(ctx)
+
+        app = ValidatingApplication([ItemService], 'tns')
+        for kwargs, phases in (
+                ({}, ['deserialize', 'mime', 'parse', 'process', 'read',
+                              'serialize', 'tostring', 'total', 'validate']),
+                ({'_string_response': True}, ['deserialize', 'mime', 'parse',
+                       'process', 'read', 'serialize', 'total', 'validate']),
+                ({'_stream_response': True}, ['deserialize', 'mime', 'parse',
+                       'process', 'read', 'serialize', 'total', 'validate']),
+            ):
+            server = wsgi.Application(app, _timing_sink=sink, **kwargs)
+            del contexts[:]
+
+            response, chunks = self.__call_app(server, 'items', 3)
+            list(chunks)
+
+            self.assertEquals(len(contexts), 1)
+            timings = contexts[0].timings
+            self.assertEquals(sorted(timings), phases)
+            self.failUnless(timings['total'] >= timings['process'] >= 0)
+
+        stats = aggregator.get_stats()['{tns}items']
+        self.assertEquals(stats['total']['count'], 3)
+        self.assertEquals(stats['tostring']['count'], 1)
+        self.assertEquals(sum([n for bound, n in
+                                       stats['total']['histogram']]), 3)
+        self.assertEquals(stats['total']['histogram'][-1][0], None)
+
+        # no timings are recorded without a sink.
+        ctx = MethodContext()
+        server = wsgi.Application(app)
+        server.get_in_object(ctx, _make_environ('items', 3)['wsgi.input']
+                                                                   .read())
+        self.assertEquals(ctx.timings, None)
+
+    def test_metrics(self):
+        app = Application([ItemService], 'tns')
+        server = wsgi.Application(app, _metrics_path='/metrics',
+                                                     _stream_response=True)
+
+        response_bytes = []
+        def call(count):
+            response, chunks = self.__call_app(server, 'items', count)
+            response_bytes.append(len(''.join(chunks)))
+
+        call(3)
+        self.__call_app(server, 'fail', 0)
+
+        # the counts of other threads are merged, even after they're gone.
+        thread = threading.Thread(target=call, args=(2,))
+        thread.start()
+        thread.join()
+
+        environ = _make_wsdl_environ('localhost')
+        environ['PATH_INFO'] = '/metrics'
+        environ['QUERY_STRING'] = ''
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        lines = ''.join(server(environ, start_response)).splitlines()
+        self.assertEquals(response['status'], wsgi.HTTP_200)
+        self.failUnless(response['headers']['Content-Type']
+                                                   .startswith('text/plain'))
+
+        self.failUnless('soaplib_requests_total{operation="items"} 2' in lines)
+        self.failUnless('soaplib_requests_total{operation="fail"} 1' in lines)
+        self.failUnless('soaplib_faults_total{operation="fail",'
+                                      'faultcode="senv:Server"} 1' in lines)
+        self.failUnless('soaplib_request_duration_seconds_bucket'
+                               '{operation="items",le="+Inf"} 2' in lines)
+        self.failUnless('soaplib_request_duration_seconds_count'
+                                           '{operation="items"} 2' in lines)
+        self.failIf([l for l in lines if l.startswith(
+                              'soaplib_faults_total{operation="items"')])
+
+        request_bytes = int(_make_environ('items', 3)['CONTENT_LENGTH']) + \
+                        int(_make_environ('items', 2)['CONTENT_LENGTH'])
+        self.failUnless('soaplib_request_bytes_total{operation="items"} %d' %
+                                                    request_bytes in lines)
+        self.failUnless('soaplib_response_bytes_total{operation="items"} %d' %
+                                              sum(response_bytes) in lines)
+
+        environ['REQUEST_METHOD'] = 'POST'
+        server(environ, start_response)
+        self.assertEquals(response['status'], wsgi.HTTP_405)
+
+    def test_stream_matches_tree(self):
+        app = Application([ItemService], 'tns')
+        tree_server = wsgi.Application(app)
+        stream_server = wsgi.Application(app, _stream_response=True)
+        stream_server.chunk_size = 256
+
+        tree_response, tree_chunks = self.__call_app(tree_server, 'items', 50)
+        stream_response, stream_chunks = self.__call_app(stream_server,
+                                                                 'items', 50)
+
+        self.assertEquals(stream_response['status'], tree_response['status'])
+        self.failUnless('Content-Length' in tree_response['headers'])
+        self.failIf('Content-Length' in stream_response['headers'])
+
+        stream_chunks = list(stream_chunks)
+        self.failUnless(len(stream_chunks) > 1)
+
+        tree = etree.fromstring(''.join(tree_chunks))
+        stream = etree.fromstring(''.join(stream_chunks))
+        self.assertEquals(etree.tostring(stream), etree.tostring(tree))
+
+        items = stream.findall('.//{TestWsgi}Item')
+        self.assertEquals(len(items), 50)
+        self.assertEquals(items[1].find('{TestWsgi}s').text, 'item 1')
+        self.assertEquals(items[1].find('{TestWsgi}n').get(
+                                        '{%s}nil' % namespaces.ns_xsi), 'true')
+
+        # multiple members that are None are left out, even when they're
+        # required.
+        app = Application([TextService], 'tns')
+        tree_response, tree_chunks = self.__call_app(wsgi.Application(app),
+                                                                 'tagged', 0)
+        stream_response, stream_chunks = self.__call_app(
+               wsgi.Application(app, _stream_response=True), 'tagged', 0)
+        self.assertEquals(etree.tostring(etree.fromstring(
+                                                  ''.join(stream_chunks))),
+                     etree.tostring(etree.fromstring(''.join(tree_chunks))))
+
+    def test_stream_is_lazy(self):
+        consumed = []
+        class LazyService(DefinitionBase):
+            @soap(Integer, _returns=Array(Integer))
+            def numbers(self, count):
+                for i in range(count):
+                    consumed.append(i)
+                    yield i
+
+        app = Application([LazyService], 'tns')
+        server = wsgi.Application(app, _stream_response=True)
+        server.chunk_size = 1
+
+        response, chunks = self.__call_app(server, 'numbers', 10000)
+        self.assertEquals(consumed, [])
+
+        chunks.next()
+        self.failUnless(len(consumed) < 10000)
+
+        list(chunks)
+        self.assertEquals(consumed, range(10000))
+
+    def test_stream_fault(self):
+        app = Application([ItemService], 'tns')
+        server = wsgi.Application(app, _stream_response=True)
+
+        response, chunks = self.__call_app(server, 'fail', 1)
+
+        self.assertEquals(response['status'], wsgi.HTTP_500)
+        self.failUnless('Content-Length' in response['headers'])
+
+        fault = etree.fromstring(''.join(chunks)).find(
+                        './/{%s}Fault' % namespaces.ns_soap_env)
+        self.assertEquals(fault.find('faultstring').text, 'fail')
+
+    def test_stream_request(self):
+        app = Application([ImportService, ItemService], 'tns')
+        server = wsgi.Application(app)
+        self.failUnless(app.stream_requests)
+
+        environ = _make_environ('import_items', 0)
+        body = '''<e:Envelope xmlns:e="%s" xmlns:tns="tns" xmlns:i="TestWsgi">
+            <e:Body><tns:import_items>
+                <!-- comment -->
+                <tns:name>import</tns:name>
+                <tns:items>
+                    <i:Item><i:i>1</i:i></i:Item>
+                    <i:Item><i:i>2</i:i></i:Item>
+                </tns:items>
+            </tns:import_items></e:Body>
+        </e:Envelope>''' % namespaces.ns_soap_env
+        environ['wsgi.input'] = StringIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+
+        result = etree.fromstring(''.join(server(environ, start_response)))
+
+        self.assertEquals(response['status'], wsgi.HTTP_200)
+        self.assertEquals(result.find('.//{tns}import_itemsResult').text, '3')
+
+        # requests to other methods are parsed as usual.
+        response, chunks = self.__call_app(server, 'items', 2)
+        self.assertEquals(len(etree.fromstring(''.join(chunks)).findall(
+                                                  './/{TestWsgi}Item')), 2)
+
+    def test_stream_request_bounded(self):
+        app = Application([ImportService], 'tns')
+        count = 100000
+        in_stream = _GeneratedRequest(count)
+
+        ctx = MethodContext()
+        in_object = app.deserialize_soap_stream(ctx, in_stream)
+        self.assertEquals(in_object.name, 'import')
+
+        array_xml = ctx.in_body_xml[-1]
+
+        i = 0
+        for item in in_object.items:
+            self.assertEquals(item.i, i)
+            if i == 0:
+                self.failUnless(in_stream.read_size < 100000)
+
+            # only the items the parser read ahead are kept in memory.
+            self.failUnless(len(array_xml) < 1000)
+            i += 1
+
+        self.assertEquals(i, count)
+
+if __name__ == '__main__':
+    unittest.main()
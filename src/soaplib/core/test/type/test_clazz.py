@@ -20,10 +20,14 @@
 import datetime
 import unittest
 
+from array import array
+
 from soaplib.core.model.clazz import ClassModel
 from soaplib.core.model.clazz import Array
+from soaplib.core.model.clazz import fragment_cache
 
 from soaplib.core.model.primitive import DateTime
+from soaplib.core.model.primitive import Double
 from soaplib.core.model.primitive import Float
 from soaplib.core.model.primitive import Integer
 from soaplib.core.model.primitive import String
@@ -200,6 +204,383 @@ class TestClassModel(unittest.TestCase):
         self.assertEquals(len(l1.level4), len(l.level4))
         self.assertEquals(100, len(l.level3))
 
+    def test_serializer_plan(self):
+        plan = Employee.get_serializer_plan()
+        names = [entry[0] for entry in plan]
+
+        self.assertEquals(names[:len(Person._type_info)],
+                          [entry[0] for entry in Person.get_serializer_plan()])
+        self.assertEquals(set(names[len(Person._type_info):]),
+                          set(['employee_id', 'salary']))
+
+        for k, v, ns, tag, is_attribute, is_multiple, write_none, to_string \
+                                                                    in plan:
+            self.assertEquals(tag, '{%s}%s' % (ns, k))
+
+        self.failUnless(Employee.get_serializer_plan() is plan)
+
+    def test_serializer_plan_output(self):
+        class Optional(ClassModel):
+            __namespace__ = 'ns'
+
+            s = String
+            i = Integer(min_occurs=1)
+            n = String(min_occurs=1, nillable=False)
+            a = String(max_occurs='unbounded')
+
+        element = etree.Element('test')
+        Optional.to_parent_element(Optional(a=['x', None]), ns_test, element)
+
+        self.assertEquals(etree.tostring(element[0]),
+            '<ns0:Optional xmlns:ns0="test_namespace">'
+                '<ns1:i xmlns:ns1="ns" '
+                      'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                      'xsi:nil="true"/>'
+                '<ns2:n xmlns:ns2="ns" '
+                      'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                      'xsi:nil="true"/>'
+                '<ns3:a xmlns:ns3="ns">x</ns3:a>'
+                '<ns4:a xmlns:ns4="ns" '
+                      'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                      'xsi:nil="true"/>'
+            '</ns0:Optional>')
+
+    def test_deserializer_tables(self):
+        tags, names, attributes = Employee.get_deserializer_tables()
+
+        self.assertEquals(set(names),
+                   set(Person._type_info.keys() + ['employee_id', 'salary']))
+        self.assertEquals(attributes, [])
+
+        key, member, is_multiple = tags['{%s}name' % Person.get_namespace()]
+        self.assertEquals(key, 'name')
+        self.failUnless(member is String)
+        self.failIf(is_multiple)
+
+        key, member, is_multiple = \
+                          tags['{%s}salary' % Employee.get_namespace()]
+        self.assertEquals(key, 'salary')
+
+        self.failUnless(Employee.get_deserializer_tables()[0] is tags)
+
+    def test_deserializer_skips_unknown(self):
+        class Multi(ClassModel):
+            __namespace__ = 'ns'
+
+            s = String
+            a = String(max_occurs='unbounded')
+
+        element = etree.fromstring(
+            '<Multi xmlns="ns">'
+                '<!-- comment -->'
+                '<s>x</s>'
+                '<unknown>y</unknown>'
+                '<a>1</a>'
+                '<?pi?>'
+                '<other:a xmlns:other="other">2</other:a>'
+            '</Multi>')
+
+        inst = Multi.from_xml(element)
+
+        self.assertEquals(inst.s, 'x')
+        self.assertEquals(inst.a, ['1', '2'])
+
+    def test_validator(self):
+        from soaplib.core.model.exception import ValidationError
+
+        class Node(ClassModel):
+            __namespace__ = 'ns'
+
+            name = String(min_occurs=1, nillable=False)
+            values = Array(Integer(max_occurs=3))
+
+        Node._type_info['child'] = Node
+        Node.resolve_namespace(Node, 'ns')
+        validate = Node.get_validator()
+
+        def node(inner):
+            return etree.fromstring('<Node xmlns="ns" xmlns:xsi="%s">%s'
+                        '</Node>' % ('http://www.w3.org/2001/XMLSchema-instance',
+                                                                       inner))
+
+        inst = validate(node('<name>a</name>'
+                               '<values><integer>1</integer></values>'
+                               '<child><name>b</name></child>'))
+        self.assertEquals(inst.name, 'a')
+        self.assertEquals(inst.values, [1])
+        self.assertEquals(inst.child.name, 'b')
+        self.assertEquals(inst.child.values, None)
+
+        for inner in (
+                '', # name is missing
+                '<name xsi:nil="true"/>',
+                '<name>a</name><name>b</name>',
+                '<name>a</name><unknown/>',
+                '<name>a</name><values><integer>x</integer></values>',
+                '<name>a</name><values>%s</values>' % (
+                                                 '<integer>1</integer>' * 4),
+                '<name>a</name><child/>',
+            ):
+            self.assertRaises(ValidationError, validate, node(inner))
+
+    def test_attribute_roundtrip(self):
+        from soaplib.core.model.clazz import XMLAttribute
+
+        class WithAttribute(ClassModel):
+            __namespace__ = 'ns'
+
+            lang = XMLAttribute('xs:string')
+            s = String
+
+        element = etree.Element('test')
+        WithAttribute.to_parent_element(WithAttribute(lang='en', s='x'),
+                                                            ns_test, element)
+        inst = WithAttribute.from_xml(element[0])
+
+        self.assertEquals(inst.lang, 'en')
+        self.assertEquals(inst.s, 'x')
+
+    def test_lazy(self):
+        e = Employee(name='bob', age=3, employee_id=7, titles=['x', 'y'],
+                     addresses=[Address(street='a', city='b', zip=1)])
+        element = etree.Element('test')
+        Employee.to_parent_element(e, ns_test, element)
+        element = element[0]
+
+        inst = Employee.get_lazy_instance(element)
+        self.failUnless(isinstance(inst, Employee))
+        self.assertEquals(inst.__dict__.keys(), ['_lazy_elements'])
+
+        self.assertEquals(inst.employee_id, 7)
+        self.assertEquals(sorted(inst.__dict__),
+                                      ['_lazy_elements', 'employee_id'])
+        self.assertEquals(inst.salary, None)
+        self.assertEquals(inst.titles, ['x', 'y'])
+        self.failIf('_lazy_elements' in inst.addresses[0].__dict__)
+        self.assertEquals(inst.addresses[0].street, 'a')
+
+        inst.age = 4
+        self.assertEquals(inst.age, 4)
+        self.failUnless(Employee.get_lazy_class().age is Integer)
+
+        deep = Employee.get_lazy_instance(element, True)
+        self.failUnless('_lazy_elements' in deep.addresses[0].__dict__)
+        self.assertEquals(deep.addresses[0].city, 'b')
+
+        out = etree.Element('test')
+        Employee.to_parent_element(deep, ns_test, out)
+        self.assertEquals(etree.tostring(out[0]), etree.tostring(element))
+
+        class LazyClass(ClassModel):
+            __namespace__ = 'ns'
+            __lazy__ = True
+
+            s = String
+            i = Integer
+
+        element = etree.Element('test')
+        Array(LazyClass).to_parent_element([LazyClass(s='s', i=1), None],
+                                                              'ns', element)
+        values = Array(LazyClass).from_xml(element[0])
+        self.failUnless('_lazy_elements' in values[0].__dict__)
+        self.assertEquals((values[0].s, values[0].i), ('s', 1))
+        self.assertEquals(values[1], None)
+
+    def test_compact(self):
+        from soaplib.core.model.clazz import XMLAttribute
+
+        class CompactPerson(ClassModel):
+            __namespace__ = 'ns'
+            __compact__ = True
+
+            lang = XMLAttribute('xs:string')
+            name = String
+            addresses = Array(Address)
+
+        class CompactEmployee(CompactPerson):
+            employee_id = Integer
+
+        self.assertEquals(sorted(CompactPerson.__slots__),
+                                         ['addresses', 'lang', 'name'])
+        self.assertEquals(CompactEmployee.__slots__, ('employee_id',))
+
+        e = CompactEmployee(lang='en', name='bob', employee_id=3,
+                                      addresses=[Address(street='a')])
+        self.failIf(hasattr(e, '__dict__'))
+        self.assertRaises(AttributeError, setattr, e, 'other', 1)
+
+        element = etree.Element('test')
+        Array(CompactEmployee).to_parent_element([e, None], 'ns', element)
+        values = Array(CompactEmployee).from_xml(element[0])
+
+        self.failIf(hasattr(values[0], '__dict__'))
+        self.assertEquals((values[0].lang, values[0].name,
+                    values[0].employee_id), ('en', 'bob', 3))
+        self.assertEquals(values[0].addresses[0].street, 'a')
+        self.assertEquals(values[1], None)
+
+        self.assertEquals(CompactEmployee.customize(max_occurs=2).__slots__,
+                                                          ('employee_id',))
+
+    def test_record(self):
+        e = Employee(name='bob', age=3, employee_id=7, titles=['x', 'y'],
+                     addresses=[Address(street='a', city='b', zip=1)])
+        element = etree.Element('test')
+        Employee.to_parent_element(e, ns_test, element)
+        element = element[0]
+
+        record = Employee.get_record(element)
+        self.failUnless(isinstance(record, tuple))
+        self.assertEquals(record.name, 'bob')
+        self.assertEquals(record.employee_id, 7)
+        self.assertEquals(record.salary, None)
+        self.assertEquals(record.titles, ['x', 'y'])
+        self.assertEquals(record.addresses[0].city, 'b')
+        self.failUnless(isinstance(record.addresses[0], tuple))
+        self.assertRaises(AttributeError, setattr, record, 'name', 'jim')
+
+        out = etree.Element('test')
+        Employee.to_parent_element(record, ns_test, out)
+        self.assertEquals(etree.tostring(out[0]), etree.tostring(element))
+
+    def test_numeric_buffer(self):
+        from soaplib.core.model.clazz import numpy
+
+        def roundtrip(type, value):
+            type.resolve_namespace(type, __name__)
+            element = etree.Element('test')
+            type.to_parent_element(value, ns_test, element)
+            return type.from_xml(element[0])
+
+        value = roundtrip(Array(Double, buffer='array'), [1.5, -2.0, 3.25])
+        self.assertEquals(value, array('d', [1.5, -2.0, 3.25]))
+
+        value = roundtrip(Array(Integer, buffer='array'), array('l', [1, 2]))
+        self.assertEquals(value, array('l', [1, 2]))
+
+        # nil items and values that don't fit in a buffer give lists
+        value = roundtrip(Array(Double, buffer='array'), [1.5, None])
+        self.assertEquals(value, [1.5, None])
+
+        value = roundtrip(Array(Integer, buffer='array'), [1, 2 ** 80])
+        self.assertEquals(value, [1, 2 ** 80])
+
+        # so do arrays of other types
+        value = roundtrip(Array(String, buffer='array'), ['a', 'b'])
+        self.assertEquals(value, ['a', 'b'])
+
+        value = roundtrip(Array(Double, buffer='numpy'), [0.5, 1.0])
+        if numpy is None:
+            self.assertEquals(value, array('d', [0.5, 1.0]))
+        else:
+            self.failUnless(isinstance(value, numpy.ndarray))
+            self.assertEquals(value.tolist(), [0.5, 1.0])
+
+            value = roundtrip(Array(Double, buffer='numpy'), value)
+            self.assertEquals(value.tolist(), [0.5, 1.0])
+
+        validator = Array(Double, buffer='array').get_validator()
+        element = etree.Element('test')
+        Array(Double).to_parent_element([1.5, 2.5], ns_test, element)
+        self.assertEquals(validator(element[0]), array('d', [1.5, 2.5]))
+
+    def test_columns(self):
+        from soaplib.core.model.clazz import numpy
+
+        type = Array(Address)
+        type.resolve_namespace(type, __name__)
+
+        def serialize(value):
+            element = etree.Element('test')
+            type.to_parent_element(value, ns_test, element)
+            return etree.tostring(element)
+
+        fields = Address.get_record_class()._fields
+        addresses = [Address(street='a & b', city='c', zip=1),
+                     Address(street='d', zip=2,
+                             since=datetime.datetime(2010, 1, 1))]
+        rows = [tuple([getattr(a, k) for k in fields]) for a in addresses]
+        expected = serialize(addresses)
+
+        self.assertEquals(serialize(rows), expected)
+        self.assertEquals(serialize(dict(zip(fields, zip(*rows)))), expected)
+        self.assertEquals(serialize({}), serialize([]))
+
+        self.assertRaises(ValueError, serialize, {'street': ['a'],
+                                                  'city': ['b', 'c']})
+        self.assertRaises(ValueError, serialize, [('a',), ('b', 'c')])
+        self.assertRaises(ValueError, serialize, {'stret': ['a']})
+
+        # the rows of columns can still be iterated over, e.g. when
+        # they are streamed.
+        columns = type.get_columns({'street': ['a'], 'zip': [1]})
+        self.assertEquals(list(columns), [{'street': 'a', 'zip': 1}])
+
+        if numpy is not None:
+            value = numpy.array([('a', 1), ('b', 2)],
+                                dtype=[('street', 'S5'), ('zip', 'i4')])
+            self.assertEquals(serialize(value), serialize([
+                     Address(street='a', zip=1), Address(street='b', zip=2)]))
+
+    def test_immutable(self):
+        class Currency(ClassModel):
+            __immutable__ = True
+
+            code = String
+            rate = Float
+
+        class Rates(ClassModel):
+            __immutable__ = 'version'
+
+            version = Integer
+            rates = Array(Currency)
+
+        Rates.resolve_namespace(Rates, __name__)
+
+        def serialize(value):
+            element = etree.Element('test')
+            Rates.to_parent_element(value, ns_test, element)
+            return etree.tostring(element)
+
+        fragment_cache.clear()
+        usd = Currency(code='USD', rate=1.0)
+        rates = Rates(version=1, rates=[usd, Currency(code='EUR', rate=0.8)])
+        expected = serialize(rates)
+
+        hits = fragment_cache.stats['hits']
+        self.assertEquals(serialize(rates), expected)
+        self.assertEquals(fragment_cache.stats['hits'], hits + 1)
+
+        # instances are looked up by identity, along with their version.
+        eur = Rates(version=1, rates=[Currency(code='EUR', rate=0.8)])
+        self.failIf('USD' in serialize(eur))
+
+        rates.version = 2
+        rates.rates = [usd]
+        self.assertEquals(serialize(rates).count('USD'), 1)
+        self.failIf('EUR' in serialize(rates))
+
+        usd.rate = 2.0
+        self.failIf('2.0' in serialize(Rates(version=3, rates=[usd])))
+
+        # instances sharing a version are different fragments.
+        versions = Array(Rates)
+        versions.resolve_namespace(versions, __name__)
+        element = etree.Element('test')
+        versions.to_parent_element([Rates(version=5, rates=[usd]),
+                                    Rates(version=5, rates=[]),
+                                    Rates(version=5, rates=[usd])],
+                                                       ns_test, element)
+        self.assertEquals(etree.tostring(element).count('USD'), 2)
+
+        max_size = fragment_cache.max_size
+        fragment_cache.max_size = 2
+        try:
+            serialize(Rates(version=4))
+            self.assertEquals(len(fragment_cache), 2)
+        finally:
+            fragment_cache.max_size = max_size
+
     def test_customize(self):
         class Base(ClassModel):
             class Attributes(ClassModel.Attributes):
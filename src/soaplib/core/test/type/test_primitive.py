@@ -31,6 +31,7 @@ from soaplib.core.model.primitive import Duration
 from soaplib.core.model.primitive import Float
 from soaplib.core.model.primitive import Integer
 from soaplib.core.model.base import Null
+from soaplib.core.model.exception import ValidationError
 from soaplib.core.model.primitive import String
 from soaplib.core.util.duration import XmlDuration
 
@@ -102,6 +103,35 @@ class TestPrimitive(unittest.TestCase):
         self.assertEquals(dt.month, 5)
         self.assertEquals(dt.day, 15)
 
+    def test_datetime_formats(self):
+        dt = DateTime.from_string('2007-05-15 13:40:44.000001')
+        self.assertEquals(dt, datetime.datetime(2007, 5, 15, 13, 40, 44, 1))
+        self.assertEquals(dt.tzinfo, None)
+
+        dt = DateTime.from_string('2007-05-15T13:40:44.1234567+00:00')
+        self.assertEquals(dt.microsecond, 123456)
+        self.assertEquals(dt.utcoffset(), datetime.timedelta(0))
+
+        dt = DateTime.from_string('2007-05-15T13:40:44-05:30')
+        self.assertEquals(dt.utcoffset(), -datetime.timedelta(hours=5,
+                                                              minutes=30))
+        self.failUnless(dt.tzinfo is DateTime.from_string(
+                                        '2010-01-01T00:00:00-05:30').tzinfo)
+
+        self.assertRaises(Exception, DateTime.from_string, '2007-05-15')
+        self.assertEquals(DateTime.from_string(None), None)
+
+    def test_duration_formats(self):
+        self.assertEquals(Duration.from_string('-P1DT2H'),
+                                      -datetime.timedelta(days=1, hours=2))
+        self.assertEquals(Duration.from_string('PT1.5S'),
+                                      datetime.timedelta(seconds=1.5))
+        self.assertEquals(Duration.from_string('P1DT'),
+                                      datetime.timedelta(days=1))
+
+        for string in ('P', 'PT', '-P', 'P1.5D', 'P1DX', '1D', 'PT1..2S'):
+            self.assertRaises(ValueError, Duration.from_string, string)
+
     def test_integer(self):
         i = 12
         integer = Integer()
@@ -221,5 +251,50 @@ class TestPrimitive(unittest.TestCase):
         b = Boolean.from_xml(b)
         self.assertEquals(b, None)
 
+    def test_string_validator(self):
+        Code = String(min_len=2, max_len=4, pattern='[A-Z]+', nillable=False)
+
+        def element(text):
+            e = etree.Element('{%s}code' % ns_test)
+            e.text = text
+            return e
+
+        validate = Code.get_validator()
+        self.failUnless(Code.get_validator() is validate)
+        self.assertEquals(validate(element('ABC')), 'ABC')
+
+        for text in ('A', 'ABCDE', 'AB1', '1AB', 'ab'):
+            self.assertRaises(ValidationError, validate, element(text))
+
+        nil = element(None)
+        nil.set('{%s}nil' % namespaces.ns_xsi, 'true')
+        self.assertRaises(ValidationError, validate, nil)
+
+        try:
+            validate(element('A'))
+        except ValidationError, e:
+            self.assertEquals(e.faultcode, 'senv:Client.SchemaValidation')
+            self.failUnless('minLength' in e.faultstring)
+
+    def test_simple_type_validator(self):
+        Small = Integer(values=set([1, 2, 3]))
+
+        def element(text):
+            e = etree.Element('{%s}i' % ns_test)
+            e.text = text
+            return e
+
+        validate = Small.get_validator()
+        self.assertEquals(validate(element('2')), 2)
+        self.assertRaises(ValidationError, validate, element('4'))
+        self.assertRaises(ValidationError, validate, element('x'))
+
+        nil = element(None)
+        nil.set('{%s}nil' % namespaces.ns_xsi, 'true')
+        self.assertEquals(validate(nil), None)
+
+        self.assertRaises(ValidationError, DateTime.get_validator(),
+                                                       element('yesterday'))
+
 if __name__ == '__main__':
     unittest.main()
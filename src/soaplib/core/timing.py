@@ -0,0 +1,113 @@
+
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Per-phase timings of requests.
+
+Transports given a timing sink, like soaplib.core.server.wsgi.Application
+with _timing_sink, record how long every phase of a request takes in
+MethodContext.timings, a dict of phase name to seconds, and pass the context
+to the sink once the response is produced. The phases are:
+
+    read         reading the request body
+    mime         collapsing SwA requests and applying MTOM to responses
+    parse        parsing the request envelope
+    validate     validating the request against the schema
+    deserialize  deserializing the request (also parsing, when the request is
+                 deserialized from the events of the parser or streamed)
+    process      calling the method, including its hooks
+    serialize    serializing the response (also encoding, when the response
+                 is serialized as a string or streamed)
+    tostring     encoding the response envelope
+    total        the whole request
+
+Phases a request doesn't go through are missing. A sink can be any callable
+that takes the MethodContext, e.g.:
+
+    def log_timings(ctx):
+        logger.info("%s %r" % (ctx.method_name, ctx.timings))
+
+    wsgi.Application(app, _timing_sink=log_timings)
+
+or a TimingAggregator, which keeps histograms of the timings per method.
+"""
+
+import threading
+import time
+
+from bisect import bisect_left
+
+# the clock timings are measured with. python 2 has no monotonic clock in
+# the standard library.
+clock = getattr(time, 'monotonic', time.time)
+
+class TimingAggregator(object):
+    """A timing sink that keeps the number of requests, the total time and a
+    histogram of the times of every phase of every method. The histograms
+    count the times that are less than or equal to each of the bucket
+    bounds, in seconds, and the ones that are greater than all of them.
+    """
+
+    buckets = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, buckets=None):
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+
+        self.__stats = {}
+        self.__lock = threading.Lock()
+
+    def __call__(self, ctx):
+        buckets = self.buckets
+
+        with self.__lock:
+            for phase, seconds in ctx.timings.iteritems():
+                key = (ctx.method_name, phase)
+                entry = self.__stats.get(key, None)
+                if entry is None:
+                    entry = self.__stats[key] = [0, 0.0,
+                                                   [0] * (len(buckets) + 1)]
+
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2][bisect_left(buckets, seconds)] += 1
+
+    def get_stats(self):
+        """Returns the timings collected so far as a dict of method names to
+        dicts of phases to dicts with 'count', 'sum' and 'histogram' keys.
+        The histograms are lists of (bucket bound, count) tuples, the last
+        bound being None.
+        """
+
+        bounds = self.buckets + (None,)
+
+        retval = {}
+        with self.__lock:
+            for (method_name, phase), (count, sum, histogram) in \
+                                                    self.__stats.iteritems():
+                retval.setdefault(method_name, {})[phase] = {
+                    'count': count,
+                    'sum': sum,
+                    'histogram': zip(bounds, histogram),
+                }
+
+        return retval
+
+    def clear(self):
+        with self.__lock:
+            self.__stats.clear()
@@ -18,6 +18,12 @@
 #
 
 import datetime
+import re
+
+# the number tokens are checked when they're converted, like they used to be
+# when durations were parsed by hand.
+_duration_re = re.compile(r'(-)?P(?:([\d.]+)Y)?(?:([\d.]+)M)?(?:([\d.]+)D)?'
+                   r'(?:T(?:([\d.]+)H)?(?:([\d.]+)M)?(?:([\d.]+)S)?)?\Z')
 
 class XmlDuration(object):
     """Handles the conversion between soap duration and python timedelta."""
@@ -105,54 +111,29 @@ class XmlDuration(object):
 
     @classmethod
     def from_string(cls, string):
-        orig_str = string
-        ret = cls()
-
-        def parse_token(string):
-            n = "0"
-
-            for i in range(len(string)):
-                if string[i].isdigit() or string[i] == ".":
-                    n += string[i]
-                else:
-                    break
-
-            return (float(n), string[i], string[i + 1:])
-
-        def parse_seq(string, seq):
-            i = 0
-            while string:
-                n, s, string = parse_token(string)
-
-                while i < len(seq):
-                    s1, attr = seq[i]
-                    i += 1
-                    if s == s1:
-                        if n >= 0 and (n == round(n) or attr == "seconds"):
-                            setattr(ret, attr, n)
-                            break
-                        else:
-                            raise Exception
-                else:
-                    raise Exception
+        # lastindex is the sign when no number was matched.
+        match = _duration_re.match(string)
+        if match is None or (match.lastindex or 0) < 2:
+            raise ValueError("Duration %r not in correct format" % string)
+
+        negative, years, months, days, hours, minutes, seconds = \
+                                                                match.groups()
 
         try:
-            if string.startswith("-"):
-                ret.negative = True
-                string = string[1:]
-
-            if string.startswith("P"):
-                string = string[1:]
-            else:
-                raise Exception
-
-            str1, _, str2 = string.partition("T")
-            if not (str1 or str2):
-                raise Exception
-            parse_seq(str1, cls.__seq1)
-            parse_seq(str2, cls.__seq2)
-
-        except:
-            raise ValueError("Duration %r not in correct format" % orig_str)
+            ret = cls(negative=negative is not None)
+            for attr, n in (("years", years), ("months", months),
+                            ("days", days), ("hours", hours),
+                            ("minutes", minutes)):
+                if n is not None:
+                    n = float(n)
+                    if n != round(n):
+                        raise ValueError(n)
+                    setattr(ret, attr, n)
+
+            if seconds is not None:
+                ret.seconds = float(seconds)
+
+        except ValueError:
+            raise ValueError("Duration %r not in correct format" % string)
 
         return ret
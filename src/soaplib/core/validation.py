@@ -0,0 +1,89 @@
+
+#
+# soaplib - Copyright (C) Soaplib contributors.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#
+
+"""Policies that decide which incoming messages a ValidatingApplication
+validates.
+
+A policy is passed to the application as its default, and can be overridden
+per method with the _validation argument of the @soap decorator:
+
+    policy = PerClientKey({'10.0.0.5': Sampled(0.05)}, default=Always())
+    app = ValidatingApplication(services, tns, _validation_policy=policy)
+
+    class Service(DefinitionBase):
+        @soap(String, _returns=String, _validation=Always())
+        def sensitive(self, s):
+            ...
+"""
+
+import random
+
+class ValidationPolicy(object):
+    """The base class for validation policies."""
+
+    def should_validate(self, ctx):
+        """Returns True when the message of the given MethodContext is to be
+        validated.
+        """
+
+        raise NotImplementedError()
+
+class Always(ValidationPolicy):
+    """Validates every message."""
+
+    def should_validate(self, ctx):
+        return True
+
+class Never(ValidationPolicy):
+    """Validates no messages."""
+
+    def should_validate(self, ctx):
+        return False
+
+class Sampled(ValidationPolicy):
+    """Validates a random sample of messages, e.g. Sampled(0.1) validates
+    about one message in ten.
+    """
+
+    def __init__(self, rate):
+        if not (0 <= rate <= 1):
+            raise ValueError("The sampling rate must be between 0 and 1, "
+                                                          "not %r" % rate)
+
+        self.rate = rate
+
+    def should_validate(self, ctx):
+        return random.random() < self.rate
+
+class PerClientKey(ValidationPolicy):
+    """Picks the policy by MethodContext.client_key, which the transport sets
+    to identify the client. Clients that are not in the given dict are
+    handled by the default policy, which validates every message.
+    """
+
+    def __init__(self, policies, default=None):
+        if default is None:
+            default = Always()
+
+        self.policies = policies
+        self.default = default
+
+    def should_validate(self, ctx):
+        return self.policies.get(ctx.client_key, self.default) \
+                                                        .should_validate(ctx)